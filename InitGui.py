@@ -33,30 +33,21 @@ class AnchorWorkbench(Gui.Workbench):
 
     def Initialize(self):
         """This function is called at the first activation of the workbench.
-        here is the place to import all the commands
+        here is the place to register all the commands
         """
+        import time
         Msg("Anchor workbench initialize\n")
+        start = time.time()
 
-        from command_anchorable_object_open import CommandAnchorableObjectOpen
-        from command_anchorable_object_add import CommandAnchorableObjectAdd
-        from command_anchor_add import CommandAnchorAdd
-        from command_anchorable_object_save import CommandAnchorableObjectSave
-        from command_assembly_add import CommandAssemblyAdd
+        # The command modules are only imported when their command
+        # is first activated
+        from lazy_commands import COMMANDS, LazyCommand
+        from preferences import parameters
 
-        command_names = ["AnchorableObjectOpen",
-                         "AnchorableObjectAdd",
-                         "AnchorAdd",
-                         "AnchorableObjectSave",
-                         "AssemblyAdd"]
+        command_names = [entry[0] for entry in COMMANDS]
 
-        commands = [CommandAnchorableObjectOpen(),
-                    CommandAnchorableObjectAdd(),
-                    CommandAnchorAdd(),
-                    CommandAnchorableObjectSave(),
-                    CommandAssemblyAdd()]
-
-        for name, command in zip(command_names, commands):
-            FreeCADGui.addCommand(name, command)
+        for name in command_names:
+            FreeCADGui.addCommand(name, LazyCommand(name))
 
         # creates a new toolbar with your commands
         self.appendToolbar("Anchors commands toolbar", command_names)
@@ -68,6 +59,11 @@ class AnchorWorkbench(Gui.Workbench):
         # not useful in the Anchors Workbench context
         # self.appendMenu(["Tools", "My submenu"], commands.keys())
 
+        # Track the latency of the workbench activation
+        elapsed = (time.time() - start) * 1000.
+        parameters().SetFloat("InitializeTime", elapsed)
+        Msg("Anchor workbench initialized in %.1f ms\n" % elapsed)
+
     def Activated(self):
         r"""code which should be computed when a user
         switches to this workbench"""
@@ -30,29 +30,68 @@ from os.path import join, dirname
 
 import numpy as np
 
+from anchor_descriptors import descriptor, make_descriptor
+from anchor_math import axis_angles_from_matrices, superimposition_matrix, \
+    translation_from_matrix
 from freecad_logging import debug
+from placement_updates import record_notification
+from placements import transform_frame
+from transform_tree import placement_matrix
 import FreeCAD as App
 
 from pivy import coin
 
-from transformations import superimposition_matrix, translation_from_matrix, \
-    rotation_from_matrix
 from puv import puv
 
 
-# def make_anchor_feature(p, u, v):
-#     r"""makes an anchorable object feature
-#
-#     Returns
-#     -------
-#     the new object.
-#
-#     """
-#     obj = App.ActiveDocument.addObject("Part::FeaturePython",
-#                                        "Anchor")
-#     Anchor(obj, p, u, v)
-#     ViewProviderAnchor(obj.ViewObject)
-#     return obj
+def set_descriptor(obj, descriptor_):
+    r"""Set the descriptor properties of an anchor feature"""
+    obj.source_type = descriptor_['type']
+    obj.radius = descriptor_['radius']
+    obj.area = descriptor_['area']
+    obj.planar = descriptor_['planar']
+    obj.signature = descriptor_['signature']
+
+
+def anchor_feature_descriptor(obj):
+    r"""Descriptor of an anchor feature, None for the anchors created
+    before the descriptors existed"""
+    if not hasattr(obj, "signature"):
+        return None
+    return make_descriptor(obj.source_type, obj.radius, obj.area, obj.planar)
+
+
+def make_anchor_feature(parent, p, u, v, label=None, sub_element=None,
+                        descriptor_=None):
+    r"""makes an anchor feature
+
+    Parameters
+    ----------
+    parent : anchorable object
+    p : tuple
+    u : tuple
+    v : tuple
+    label : str or None
+    sub_element : str or None
+        Name of the sub element of the parent the anchor is computed from,
+        None for an anchor that keeps its p, u, v (e.g. read from a file)
+    descriptor_ : dict or None
+        Descriptor of an anchor that keeps its p, u, v
+
+    Returns
+    -------
+    the new object.
+
+    """
+    obj = App.ActiveDocument.addObject("App::FeaturePython", "Anchor")
+    Anchor(obj, p, u, v, topo_element=(parent, sub_element),
+           descriptor_=descriptor_)
+    if App.GuiUp:
+        ViewProviderAnchor(obj.ViewObject)
+    if label is not None:
+        obj.Label = label
+    return obj
+
 
 def anchor_transformation(p0, u0, v0, p1, u1, v1):
     r"""Find the 4x4 transformation matrix
@@ -96,17 +135,23 @@ def anchor_transformation(p0, u0, v0, p1, u1, v1):
 
 
 class Anchor:
-    def __init__(self, obj, p, u, v, topo_element):
+    def __init__(self, obj, p, u, v, topo_element, descriptor_=None):
+        r"""An anchor whose topo_element has no sub element name (None)
+        is not computed from the geometry of its parent: it keeps its
+        p, u, v in the local frame of its parent, in hidden properties,
+        and its descriptor (see anchor_descriptors) is given."""
+        parent, sub_element = topo_element
+
         obj.addProperty("App::PropertyLink",
                         "parent",
                         "Definition",
-                        "Anchor's parent").parent = topo_element[0]
+                        "Anchor's parent").parent = parent
 
         obj.addProperty("App::PropertyString",
                         "name_sub_element",
                         "Definition",
                         "Anchor's sub element name").name_sub_element = \
-            topo_element[1]
+            sub_element or ""
 
         # https://forum.freecadweb.org/viewtopic.php?t=8224
         # -> The property editor doesn't support App::PropertyLinkSub
@@ -114,7 +159,21 @@ class Anchor:
         obj.addProperty("App::PropertyLinkSub",
                         "topo_element",
                         "Definition",
-                        "Anchor's topo element").topo_element = topo_element
+                        "Anchor's topo element")
+        if sub_element is not None:
+            obj.topo_element = topo_element
+        else:
+            inverse = np.linalg.inv(placement_matrix(parent))
+            p_local, u_local, v_local = transform_frame(inverse, p, u, v)
+            for name, value in (("p_local", p_local),
+                                ("u_local", u_local),
+                                ("v_local", v_local)):
+                obj.addProperty("App::PropertyVector",
+                                name,
+                                "Definition",
+                                "Anchor's frame in the parent's frame")
+                setattr(obj, name, App.Vector(*value))
+                obj.setEditorMode(name, 2)
 
         obj.addProperty("App::PropertyVector",
                         "p",
@@ -128,17 +187,58 @@ class Anchor:
                         "v",
                         "Definition",
                         "Anchor's v vector").v = App.Vector(v[0], v[1], v[2])
+
+        obj.addProperty("App::PropertyString",
+                        "source_type",
+                        "Descriptor",
+                        "Type of the element the anchor comes from")
+        obj.addProperty("App::PropertyFloat",
+                        "radius",
+                        "Descriptor",
+                        "Radius of the element (0 if not circular)")
+        obj.addProperty("App::PropertyFloat",
+                        "area",
+                        "Descriptor",
+                        "Area of the element")
+        obj.addProperty("App::PropertyBool",
+                        "planar",
+                        "Descriptor",
+                        "Is the element planar?")
+        obj.addProperty("App::PropertyInteger",
+                        "signature",
+                        "Descriptor",
+                        "Hash of the mating-relevant descriptors")
+        for name in ("source_type", "radius", "area", "planar", "signature"):
+            obj.setEditorMode(name, 1)
+        if descriptor_ is None and sub_element is not None:
+            descriptor_ = descriptor(parent.Shape.getElement(sub_element))
+        if descriptor_ is not None:
+            set_descriptor(obj, descriptor_)
         obj.Proxy = self
 
     def onChanged(self, fp, prop):
         r"""Do something when a property has changed"""
-        debug("Change property of Anchor: " + str(prop) + "\n")
+        debug("Change property of Anchor: %s", prop)
+        record_notification()
+        if prop in ['p', 'u', 'v']:
+            # the local anchors frames cached by the parent are now stale
+            proxy = getattr(getattr(fp, 'parent', None), 'Proxy', None)
+            if hasattr(proxy, 'invalidate_anchors'):
+                proxy.invalidate_anchors()
 
     def execute(self, fp):
         r"""Do something when doing a recomputation, this method is mandatory"""
-        debug("Recompute Anchor feature\n")
-
-        p, u, v = puv(fp.parent.Shape.getElement(fp.name_sub_element))
+        debug("Recompute Anchor feature")
+
+        if fp.name_sub_element == "":
+            # Not computed from the geometry: follows the parent's placement
+            p, u, v = transform_frame(placement_matrix(fp.parent),
+                                      fp.p_local, fp.u_local, fp.v_local)
+        else:
+            element = fp.parent.Shape.getElement(fp.name_sub_element)
+            p, u, v = puv(element)
+            if hasattr(fp, "signature"):
+                set_descriptor(fp, descriptor(element))
         fp.p = App.Vector(p[0], p[1], p[2])
         fp.u = App.Vector(u[0], u[1], u[2])
         fp.v = App.Vector(v[0], v[1], v[2])
@@ -319,12 +419,11 @@ class ViewProviderAnchor:
 
         self.transform.translation.setValue((t[0], t[1], t[2]))
 
-        angle, direction, point = rotation_from_matrix(at)
-        # print("angle : %f" % angle)
-        # print("direction : %s" % str(direction))
-        # print("point : %s" % str(point))
+        # Quaternion based axis-angle, cheaper than the eigen decompositions
+        # of rotation_from_matrix
+        axes, angles = axis_angles_from_matrices(at[np.newaxis])
 
-        self.transform.rotation.setValue(coin.SbVec3f(direction), angle)
+        self.transform.rotation.setValue(coin.SbVec3f(axes[0]), angles[0])
 
         # mat = coin.SoSFMatrix()
         # mat.setValue(at[0][0], at[0][1], at[0][2], at[0][3],
@@ -361,7 +460,7 @@ class ViewProviderAnchor:
 
     def onChanged(self, vp, prop):
         r"""Here we can do something when a single property got changed"""
-        debug("Change property of ViewProvideAnchor: " + str(prop) + "\n")
+        debug("Change property of ViewProvideAnchor: %s", prop)
         if prop == "ColorU":
             cu = vp.getPropertyByName("ColorU")
             self.color_u.rgb.setValue(cu[0], cu[1], cu[2])
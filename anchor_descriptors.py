@@ -0,0 +1,117 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Descriptors of anchors, for compatibility lookups without geometry
+
+The descriptor of an anchor describes the element it was computed from:
+- type : 'face' or 'circular_edge' ('' if unknown)
+- radius : radius of a cylindrical face or of a circular edge, 0 otherwise
+- area : area of the face (of the disc for a circular edge)
+- planar : is the face (or the disc) planar?
+
+The signature of an anchor is an integer hash of its type, planarity and
+radius. The area is left out so that anchors that can mate share their
+signature (e.g. two planar faces of different sizes, or a hole and a shaft
+of the same radius): finding the candidates to mate with an anchor is a
+dict (or SQL index) lookup instead of geometric tests.
+
+"""
+
+import hashlib
+import math
+
+# Quantization of the radius in the signatures (model units)
+RADIUS_RESOLUTION = 1e-3
+
+FACE = "face"
+CIRCULAR_EDGE = "circular_edge"
+
+
+def descriptor(element):
+    r"""Descriptor of a sub element of a shape
+
+    Parameters
+    ----------
+    element : Part.Face or Part.Edge
+
+    Returns
+    -------
+    dict
+        type, radius, area, planar and signature
+
+    """
+    type_, radius, area, planar = "", 0., 0., False
+    if element.ShapeType == "Face":
+        surface = type(element.Surface).__name__
+        type_ = FACE
+        area = element.Area
+        planar = surface == "Plane"
+        if surface == "Cylinder":
+            radius = element.Surface.Radius
+    elif element.ShapeType == "Edge" \
+            and type(element.Curve).__name__ == "Circle":
+        type_ = CIRCULAR_EDGE
+        radius = element.Curve.Radius
+        area = math.pi * radius ** 2
+        planar = True
+    return make_descriptor(type_, radius, area, planar)
+
+
+def make_descriptor(type_, radius, area, planar):
+    r"""Descriptor (with its signature) from its components"""
+    return {'type': type_,
+            'radius': float(radius),
+            'area': float(area),
+            'planar': bool(planar),
+            'signature': signature(type_, radius, planar)}
+
+
+def signature(type_, radius, planar):
+    r"""Integer hash of the mating-relevant components of a descriptor
+
+    Returns
+    -------
+    int
+        Non negative, fits in 31 bits (FreeCAD integer properties, SQLite)
+
+    """
+    key = "%s|%i|%i" % (type_, int(planar),
+                        int(round(radius / RADIUS_RESOLUTION)))
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) \
+        & 0x7fffffff
+
+
+def anchor_index(descriptors):
+    r"""Index of anchors by signature
+
+    Parameters
+    ----------
+    descriptors : dict
+        anchor label -> descriptor
+
+    Returns
+    -------
+    dict
+        signature -> list of anchor labels
+
+    """
+    index = {}
+    for label, descriptor_ in sorted(descriptors.items()):
+        index.setdefault(descriptor_['signature'], []).append(label)
+    return index
@@ -0,0 +1,628 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""The homogeneous transformation kernels used by the anchors
+
+A focused subset of the vendored transformations module, which is a large
+general library (arcball, projections, shears, Euler angles ...) that is
+slow to import. The full library is only imported when one of its other
+functions is needed, through full_transformations() or as an attribute of
+this module (e.g. anchor_math.euler_matrix).
+
+It also provides stacked variants of the kernels, processing (N, 4, 4)
+matrices and (N, 4) quaternions in single NumPy calls: the assembly solver
+handles all the parts of a depth of the mates graph at once.
+
+The kernels below are copied from transformations.py:
+
+    Copyright (c) 2006-2018, Christoph Gohlke
+    Copyright (c) 2006-2018, The Regents of the University of California
+    Produced at the Laboratory for Fluorescence Dynamics
+    All rights reserved.
+
+and are distributed under the BSD 3-clause license reproduced at the top
+of transformations.py.
+
+"""
+
+from __future__ import division
+
+from importlib import import_module
+import math
+
+import numpy as np
+
+_EPS = np.finfo(float).eps * 4.0
+
+
+def full_transformations():
+    r"""The full transformations module, imported on the first call"""
+    return import_module("transformations")
+
+
+def __getattr__(name):
+    # The rest of the transformations module, imported on demand (Python 3.7+)
+    if name.startswith("__"):
+        raise AttributeError(name)
+    return getattr(full_transformations(), name)
+
+
+def translation_from_matrix(matrix):
+    r"""Translation vector of a 4x4 transformation matrix"""
+    return np.array(matrix)[:3, 3]
+
+
+def rotation_from_matrix(matrix):
+    r"""Rotation angle, axis direction and point of a 4x4 rotation matrix
+
+    Returns
+    -------
+    tuple
+        (angle, direction (3,), point (4,))
+
+    """
+    R = np.asarray(matrix, dtype=np.float64)
+    R33 = R[:3, :3]
+    # direction: unit eigenvector of R33 corresponding to eigenvalue of 1
+    w, W = np.linalg.eig(R33.T)
+    i = np.where(abs(np.real(w) - 1.0) < 1e-8)[0]
+    if not len(i):
+        raise ValueError('no unit eigenvector corresponding to eigenvalue 1')
+    direction = np.real(W[:, i[-1]]).squeeze()
+    # point: unit eigenvector of R corresponding to eigenvalue of 1
+    w, Q = np.linalg.eig(R)
+    i = np.where(abs(np.real(w) - 1.0) < 1e-8)[0]
+    if not len(i):
+        raise ValueError('no unit eigenvector corresponding to eigenvalue 1')
+    point = np.real(Q[:, i[-1]]).squeeze()
+    point /= point[3]
+    # rotation angle depending on direction
+    cosa = (np.trace(R33) - 1.0) / 2.0
+    if abs(direction[2]) > 1e-8:
+        sina = (R[1, 0] + (cosa - 1.0) * direction[0] * direction[1]) \
+            / direction[2]
+    elif abs(direction[1]) > 1e-8:
+        sina = (R[0, 2] + (cosa - 1.0) * direction[0] * direction[2]) \
+            / direction[1]
+    else:
+        sina = (R[2, 1] + (cosa - 1.0) * direction[1] * direction[2]) \
+            / direction[0]
+    angle = math.atan2(sina, cosa)
+    return angle, direction, point
+
+
+def quaternion_matrix(quaternion):
+    r"""4x4 rotation matrix of a quaternion (w, x, y, z)"""
+    q = np.array(quaternion, dtype=np.float64)
+    n = np.dot(q, q)
+    if n < _EPS:
+        return np.identity(4)
+    q *= math.sqrt(2.0 / n)
+    q = np.outer(q, q)
+    return np.array([
+        [1.0-q[2, 2]-q[3, 3],     q[1, 2]-q[3, 0],     q[1, 3]+q[2, 0], 0.0],
+        [    q[1, 2]+q[3, 0], 1.0-q[1, 1]-q[3, 3],     q[2, 3]-q[1, 0], 0.0],
+        [    q[1, 3]-q[2, 0],     q[2, 3]+q[1, 0], 1.0-q[1, 1]-q[2, 2], 0.0],
+        [                0.0,                 0.0,                 0.0, 1.0]])
+
+
+def superimposition_matrix(v0, v1, scale=False, usesvd=True):
+    r"""4x4 rigid (or similarity, if scale) transformation matrix
+    registering the 3D point set v0 onto the point set v1
+
+    Parameters
+    ----------
+    v0 : (3, N) or (4, N) array
+        At least 3 points
+    v1 : (3, N) or (4, N) array
+    scale : bool
+        Also find a uniform scaling
+    usesvd : bool
+        Use the algorithm by Kabsch (SVD), or the quaternion based
+        algorithm by Horn
+
+    Returns
+    -------
+    4x4 matrix (numpy array)
+
+    """
+    v0 = np.array(v0, dtype=np.float64)[:3]
+    v1 = np.array(v1, dtype=np.float64)[:3]
+    if v0.shape[1] < 3 or v0.shape != v1.shape:
+        raise ValueError('input arrays are of wrong shape or type')
+
+    # move centroids to origin
+    t0 = -np.mean(v0, axis=1)
+    M0 = np.identity(4)
+    M0[:3, 3] = t0
+    v0 += t0.reshape(3, 1)
+    t1 = -np.mean(v1, axis=1)
+    M1 = np.identity(4)
+    M1[:3, 3] = t1
+    v1 += t1.reshape(3, 1)
+
+    if usesvd:
+        # Rigid transformation via SVD of covariance matrix
+        u, s, vh = np.linalg.svd(np.dot(v1, v0.T))
+        # rotation matrix from SVD orthonormal bases
+        R = np.dot(u, vh)
+        if np.linalg.det(R) < 0.0:
+            # R does not constitute right handed system
+            R -= np.outer(u[:, 2], vh[2, :] * 2.0)
+            s[-1] *= -1.0
+        M = np.identity(4)
+        M[:3, :3] = R
+    else:
+        # Rigid transformation matrix via quaternion
+        xx, yy, zz = np.sum(v0 * v1, axis=1)
+        xy, yz, zx = np.sum(v0 * np.roll(v1, -1, axis=0), axis=1)
+        xz, yx, zy = np.sum(v0 * np.roll(v1, -2, axis=0), axis=1)
+        N = [[xx+yy+zz, 0.0,      0.0,      0.0],
+             [yz-zy,    xx-yy-zz, 0.0,      0.0],
+             [zx-xz,    xy+yx,    yy-xx-zz, 0.0],
+             [xy-yx,    zx+xz,    yz+zy,    zz-xx-yy]]
+        # quaternion: eigenvector corresponding to most positive eigenvalue
+        w, V = np.linalg.eigh(N)
+        q = V[:, np.argmax(w)]
+        q /= math.sqrt(np.dot(q, q))  # unit quaternion
+        M = quaternion_matrix(q)
+
+    if scale:
+        # scale is ratio of RMS deviations from centroid
+        v0 *= v0
+        v1 *= v1
+        M[:3, :3] *= math.sqrt(np.sum(v1) / np.sum(v0))
+
+    # move centroids back
+    M = np.dot(np.linalg.inv(M1), np.dot(M, M0))
+    M /= M[3, 3]
+    return M
+
+
+# Stacked kernels: (N, 4, 4) matrices, (N, 4) quaternions (w, x, y, z) and
+# (N, 3) vectors, processed in single NumPy calls. The out arguments are
+# optional preallocated result arrays.
+
+
+def compose_matrices(a, b, out=None):
+    r"""Stacked matrix products a[i] . b[i] (broadcasting as np.matmul)
+
+    Parameters
+    ----------
+    a : (N, 4, 4) or (4, 4) array
+    b : (N, 4, 4) or (4, 4) array
+    out : (N, 4, 4) array or None
+
+    Returns
+    -------
+    (N, 4, 4) array
+
+    """
+    return np.matmul(a, b, out=out)
+
+
+def invert_rigid_matrices(matrices, out=None):
+    r"""Inverses of stacked rigid transformation matrices
+
+    Uses the transpose of the rotations instead of a general inversion
+
+    Parameters
+    ----------
+    matrices : (N, 4, 4) array
+    out : (N, 4, 4) array or None
+
+    Returns
+    -------
+    (N, 4, 4) array
+
+    """
+    matrices = np.asarray(matrices, dtype=np.float64)
+    if out is None:
+        out = np.empty_like(matrices)
+    rotations_t = np.swapaxes(matrices[:, :3, :3], 1, 2)
+    # Computed before writing to out, in case out is matrices
+    translations = -np.einsum('nij,nj->ni', rotations_t, matrices[:, :3, 3])
+    out[:, :3, :3] = rotations_t
+    out[:, :3, 3] = translations
+    out[:, 3, :3] = 0.
+    out[:, 3, 3] = 1.
+    return out
+
+
+def transform_points(matrices, points, out=None):
+    r"""Apply stacked transformation matrices to points
+
+    Parameters
+    ----------
+    matrices : (N, 4, 4) array
+    points : (N, 3) array (one point per matrix)
+        or (N, M, 3) array (M points per matrix)
+    out : array of the shape of points, or None
+
+    Returns
+    -------
+    array of the shape of points
+
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim == 2:
+        out = np.einsum('nij,nj->ni', matrices[:, :3, :3], points, out=out)
+        out += matrices[:, :3, 3]
+    else:
+        out = np.einsum('nij,nmj->nmi', matrices[:, :3, :3], points,
+                        out=out)
+        out += matrices[:, np.newaxis, :3, 3]
+    return out
+
+
+def transform_vectors(matrices, vectors, out=None):
+    r"""Apply the rotations of stacked transformation matrices to vectors
+
+    Parameters
+    ----------
+    matrices : (N, 4, 4) array
+    vectors : (N, 3) array
+    out : (N, 3) array or None
+
+    Returns
+    -------
+    (N, 3) array
+
+    """
+    return np.einsum('nij,nj->ni', matrices[:, :3, :3],
+                     np.asarray(vectors, dtype=np.float64), out=out)
+
+
+def quaternions_from_matrices(matrices, out=None):
+    r"""Unit quaternions (w, x, y, z) of stacked rotation matrices
+
+    Shepperd's method: for each matrix, the quaternion is computed from the
+    largest of w, x, y, z for numerical stability. The sign is chosen so
+    that w >= 0.
+
+    Parameters
+    ----------
+    matrices : (N, 4, 4) or (N, 3, 3) array
+    out : (N, 4) array or None
+
+    Returns
+    -------
+    (N, 4) array
+
+    """
+    M = np.asarray(matrices, dtype=np.float64)
+    m00, m11, m22 = M[:, 0, 0], M[:, 1, 1], M[:, 2, 2]
+    trace = m00 + m11 + m22
+    # 4 w^2, 4 x^2, 4 y^2, 4 z^2 (up to 1)
+    candidates = np.stack([trace, m00 - m11 - m22, m11 - m00 - m22,
+                           m22 - m00 - m11], axis=1)
+    largest = np.argmax(candidates, axis=1)
+    s = np.sqrt(1. + candidates[np.arange(len(M)), largest]) * 2.
+    q = np.empty((len(M), 4)) if out is None else out
+
+    d21 = M[:, 2, 1] - M[:, 1, 2]
+    d02 = M[:, 0, 2] - M[:, 2, 0]
+    d10 = M[:, 1, 0] - M[:, 0, 1]
+    s01 = M[:, 0, 1] + M[:, 1, 0]
+    s02 = M[:, 0, 2] + M[:, 2, 0]
+    s12 = M[:, 1, 2] + M[:, 2, 1]
+    rows = [(0, [s / 4., d21 / s, d02 / s, d10 / s]),
+            (1, [d21 / s, s / 4., s01 / s, s02 / s]),
+            (2, [d02 / s, s01 / s, s / 4., s12 / s]),
+            (3, [d10 / s, s02 / s, s12 / s, s / 4.])]
+    for case, components in rows:
+        selected = largest == case
+        for k, component in enumerate(components):
+            q[selected, k] = component[selected]
+    q[q[:, 0] < 0.] *= -1.
+    return q
+
+
+def matrices_from_quaternions(quaternions, out=None):
+    r"""Stacked 4x4 rotation matrices of quaternions (w, x, y, z)
+
+    Parameters
+    ----------
+    quaternions : (N, 4) array
+        Normalized on the fly
+    out : (N, 4, 4) array or None
+
+    Returns
+    -------
+    (N, 4, 4) array
+
+    """
+    q = np.asarray(quaternions, dtype=np.float64)
+    n = np.einsum('ni,ni->n', q, q)
+    n[n < _EPS] = np.inf  # zero quaternions give the identity
+    q = q * np.sqrt(2. / n)[:, np.newaxis]
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    M = np.zeros((len(q), 4, 4)) if out is None else out
+    M[:, 0, 0] = 1. - y * y - z * z
+    M[:, 0, 1] = x * y - z * w
+    M[:, 0, 2] = x * z + y * w
+    M[:, 1, 0] = x * y + z * w
+    M[:, 1, 1] = 1. - x * x - z * z
+    M[:, 1, 2] = y * z - x * w
+    M[:, 2, 0] = x * z - y * w
+    M[:, 2, 1] = y * z + x * w
+    M[:, 2, 2] = 1. - x * x - y * y
+    M[:, :3, 3] = 0.
+    M[:, 3, :3] = 0.
+    M[:, 3, 3] = 1.
+    return M
+
+
+def axis_angles_from_matrices(matrices, out_axes=None, out_angles=None):
+    r"""Rotation axes and angles of stacked rotation matrices
+
+    The axis of a rotation by a null angle is (0, 0, 1)
+
+    Parameters
+    ----------
+    matrices : (N, 4, 4) array
+    out_axes : (N, 3) array or None
+    out_angles : (N,) array or None
+
+    Returns
+    -------
+    tuple
+        ((N, 3) unit axes, (N,) angles in [0, pi])
+
+    """
+    q = quaternions_from_matrices(matrices)
+    sines = np.sqrt(np.einsum('ni,ni->n', q[:, 1:], q[:, 1:]))
+    angles = np.arctan2(sines, q[:, 0], out=out_angles)
+    angles *= 2.
+    axes = np.empty((len(q), 3)) if out_axes is None else out_axes
+    null = sines < _EPS
+    axes[~null] = q[~null, 1:] / sines[~null, np.newaxis]
+    axes[null] = (0., 0., 1.)
+    return axes, angles
+
+
+def frames_matrices(p, u, v, out=None):
+    r"""Stacked 4x4 matrices of anchors frames
+
+    The frame of an anchor has its origin at p and the axes u, v and u x v
+    (u is normalized, v is orthonormalized against u).
+
+    Parameters
+    ----------
+    p : (N, 3) array
+    u : (N, 3) array
+    v : (N, 3) array
+    out : (N, 4, 4) array or None
+
+    Returns
+    -------
+    (N, 4, 4) array
+
+    """
+    u = np.array(u, dtype=np.float64)
+    v = np.array(v, dtype=np.float64)
+    u /= np.sqrt(np.einsum('ni,ni->n', u, u))[:, np.newaxis]
+    v -= np.einsum('ni,ni->n', u, v)[:, np.newaxis] * u
+    v /= np.sqrt(np.einsum('ni,ni->n', v, v))[:, np.newaxis]
+    M = np.zeros((len(u), 4, 4)) if out is None else out
+    M[:, :3, 0] = u
+    M[:, :3, 1] = v
+    M[:, :3, 2] = np.cross(u, v)
+    M[:, :3, 3] = p
+    M[:, 3, :3] = 0.
+    M[:, 3, 3] = 1.
+    return M
+
+
+def anchors_transformations(p0, u0, v0, p1, u1, v1, out=None):
+    r"""Stacked transformations superimposing anchors 0 on anchors 1
+
+    The batched equivalent of anchor.anchor_transformation: the origins
+    coincide, u0 is opposed to u1 and v0 is along v1.
+
+    Parameters
+    ----------
+    p0, u0, v0 : (N, 3) arrays
+    p1, u1, v1 : (N, 3) arrays
+    out : (N, 4, 4) array or None
+
+    Returns
+    -------
+    (N, 4, 4) array
+
+    """
+    frames_0 = frames_matrices(p0, u0, v0)
+    frames_1 = frames_matrices(p1, -np.asarray(u1, dtype=np.float64), v1)
+    return compose_matrices(frames_1, invert_rigid_matrices(frames_0),
+                            out=out)
+
+
+def slerp_quaternions(q0, q1, fractions, out=None):
+    r"""Spherical linear interpolation of N pairs of unit quaternions
+    at K fractions
+
+    The shortest arc is used (q1 is flipped where q0 . q1 < 0). Nearly
+    identical pairs are linearly interpolated and normalized.
+
+    Parameters
+    ----------
+    q0 : (N, 4) array
+    q1 : (N, 4) array
+    fractions : (K,) array
+    out : (K, N, 4) array or None
+
+    Returns
+    -------
+    (K, N, 4) array
+
+    """
+    q0 = np.asarray(q0, dtype=np.float64)
+    q1 = np.array(q1, dtype=np.float64)
+    fractions = np.asarray(fractions, dtype=np.float64)[:, np.newaxis]
+    d = np.einsum('ni,ni->n', q0, q1)
+    q1[d < 0.] *= -1.
+    d = np.clip(np.abs(d), 0., 1.)
+    angles = np.arccos(d)
+    sines = np.sin(angles)
+    close = sines < 1e-6
+    sines[close] = 1.
+
+    # (K, N) weights of q0 and q1
+    w0 = np.sin((1. - fractions) * angles) / sines
+    w1 = np.sin(fractions * angles) / sines
+    w0[:, close] = 1. - fractions
+    w1[:, close] = np.broadcast_to(fractions, w1[:, close].shape)
+
+    out = np.multiply(w0[:, :, np.newaxis], q0, out=out)
+    out += w1[:, :, np.newaxis] * q1
+    out /= np.sqrt(np.einsum('kni,kni->kn', out, out))[:, :, np.newaxis]
+    return out
+
+
+def dual_quaternions_from_matrices(matrices):
+    r"""Unit dual quaternions of stacked rigid transformation matrices
+
+    Parameters
+    ----------
+    matrices : (N, 4, 4) array
+
+    Returns
+    -------
+    tuple
+        ((N, 4) real parts, (N, 4) dual parts), quaternions as (w, x, y, z)
+
+    """
+    matrices = np.asarray(matrices, dtype=np.float64)
+    real = quaternions_from_matrices(matrices)
+    translations = np.zeros((len(real), 4))
+    translations[:, 1:] = matrices[:, :3, 3]
+    return real, 0.5 * _multiply_quaternions(translations, real)
+
+
+def matrices_from_dual_quaternions(real, dual, out=None):
+    r"""Stacked rigid transformation matrices of dual quaternions
+
+    Parameters
+    ----------
+    real : (N, 4) array
+    dual : (N, 4) array
+    out : (N, 4, 4) array or None
+
+    Returns
+    -------
+    (N, 4, 4) array
+
+    """
+    norms = np.sqrt(np.einsum('ni,ni->n', real, real))[:, np.newaxis]
+    real = real / norms
+    dual = dual / norms
+    out = matrices_from_quaternions(real, out=out)
+    conjugate = real * (1., -1., -1., -1.)
+    out[:, :3, 3] = 2. * _multiply_quaternions(dual, conjugate)[:, 1:]
+    return out
+
+
+def _multiply_quaternions(a, b):
+    r"""Stacked Hamilton products a[i] b[i]"""
+    w0, x0, y0, z0 = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    w1, x1, y1, z1 = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    return np.stack([w0 * w1 - x0 * x1 - y0 * y1 - z0 * z1,
+                     w0 * x1 + x0 * w1 + y0 * z1 - z0 * y1,
+                     w0 * y1 - x0 * z1 + y0 * w1 + z0 * x1,
+                     w0 * z1 + x0 * y1 - y0 * x1 + z0 * w1], axis=-1)
+
+
+def blend_dual_quaternions(dq0, dq1, fractions):
+    r"""Dual quaternion linear blending of N pairs at K fractions
+
+    The blend moves the parts along screw-like paths (rotation and
+    translation coupled), where slerp and linear translation move them
+    along straight lines.
+
+    Parameters
+    ----------
+    dq0 : tuple of (N, 4) arrays
+        (real parts, dual parts), see dual_quaternions_from_matrices
+    dq1 : tuple of (N, 4) arrays
+    fractions : (K,) array
+
+    Returns
+    -------
+    tuple
+        ((K, N, 4) real parts, (K, N, 4) dual parts), not normalized
+        (see matrices_from_dual_quaternions)
+
+    """
+    real0, dual0 = dq0
+    real1, dual1 = dq1
+    # Shortest path: same hemisphere for the real parts
+    signs = np.where(np.einsum('ni,ni->n', real0, real1) < 0., -1., 1.)
+    real1 = real1 * signs[:, np.newaxis]
+    dual1 = dual1 * signs[:, np.newaxis]
+    f = np.asarray(fractions, dtype=np.float64)[:, np.newaxis, np.newaxis]
+    return (1. - f) * real0 + f * real1, (1. - f) * dual0 + f * dual1
+
+
+def interpolate_matrices(matrices_0, matrices_1, fractions,
+                         method="slerp", out=None):
+    r"""Interpolate N rigid transformations at K fractions
+
+    Parameters
+    ----------
+    matrices_0 : (N, 4, 4) array
+        Transformations at the fraction 0
+    matrices_1 : (N, 4, 4) array
+        Transformations at the fraction 1
+    fractions : (K,) array
+    method : str
+        'slerp' (rotations slerped, translations linearly interpolated)
+        or 'dual_quaternion' (dual quaternion linear blending)
+    out : (K, N, 4, 4) array or None
+
+    Returns
+    -------
+    (K, N, 4, 4) array
+
+    """
+    matrices_0 = np.asarray(matrices_0, dtype=np.float64)
+    matrices_1 = np.asarray(matrices_1, dtype=np.float64)
+    k, n = len(fractions), len(matrices_0)
+    if out is None:
+        out = np.empty((k, n, 4, 4))
+    flat = out.reshape(k * n, 4, 4)
+
+    if method == "slerp":
+        rotations = slerp_quaternions(quaternions_from_matrices(matrices_0),
+                                      quaternions_from_matrices(matrices_1),
+                                      fractions)
+        matrices_from_quaternions(rotations.reshape(k * n, 4), out=flat)
+        f = np.asarray(fractions, dtype=np.float64)[:, np.newaxis,
+                                                    np.newaxis]
+        out[:, :, :3, 3] = (1. - f) * matrices_0[:, :3, 3] \
+            + f * matrices_1[:, :3, 3]
+    elif method == "dual_quaternion":
+        real, dual = blend_dual_quaternions(
+            dual_quaternions_from_matrices(matrices_0),
+            dual_quaternions_from_matrices(matrices_1),
+            fractions)
+        matrices_from_dual_quaternions(real.reshape(k * n, 4),
+                                       dual.reshape(k * n, 4), out=flat)
+    else:
+        raise ValueError("Unknown interpolation method : %s" % method)
+    return out
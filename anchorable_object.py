@@ -23,12 +23,22 @@ An anchorable object is:
 - a FreeCAD object
 - one or more Anchors
 
+An anchorable object instance reuses the shape and the anchors definition
+of an anchorable object (its Source) at another placement
+
 """
 from os.path import join, dirname
 
+import numpy as np
+
 import FreeCAD as App
 
+from anchor import anchor_feature_descriptor
+from anchor_descriptors import anchor_index
 from freecad_logging import debug, error
+from placement_updates import placements_streaming, record_notification
+from placements import transform_frame
+from transform_tree import ROOT, placement_matrix, placement_tree
 
 
 def is_anchorable_object(object_):
@@ -40,9 +50,15 @@ def is_anchorable_object(object_):
         return False
 
 
-def make_anchorable_object_feature():
+def make_anchorable_object_feature(base=None):
     r"""makes an anchorable object feature
 
+    Parameters
+    ----------
+    base : FreeCAD object with a Shape, or None
+        The object to make anchorable. The anchorable object starts
+        at the placement of its base.
+
     Returns
     -------
     the new object.
@@ -60,10 +76,128 @@ def make_anchorable_object_feature():
     #                                    "AnchorableObject")
 
     AnchorableObject(obj)
-    ViewProviderAnchorableObject(obj.ViewObject)
+    if App.GuiUp:
+        ViewProviderAnchorableObject(obj.ViewObject)
+    if base is not None:
+        obj.Placement = base.Placement
+        obj.Base = base
     return obj
 
 
+def ensure_shape(feature):
+    r"""Load the geometry of an anchorable object (or instance)
+    whose Base loads its shape lazily (e.g. opened from a stepzip)
+
+    Parameters
+    ----------
+    feature : AnchorableObject or AnchorableObjectInstance feature
+
+    """
+    source = getattr(feature, "Source", None)
+    if source is not None:
+        ensure_shape(source)
+        feature.Proxy.execute(feature)
+        return
+    base = getattr(feature, "Base", None)
+    if base is not None and hasattr(base.Proxy, "load") \
+            and base.Shape.isNull():
+        base.Proxy.load(base)
+        feature.Proxy.execute(feature)
+
+
+def make_anchorable_object_instance(source):
+    r"""makes an instance of an anchorable object
+
+    The instance shares the shape and the anchors of its source,
+    only its placement is its own.
+
+    Parameters
+    ----------
+    source : AnchorableObject feature
+
+    Returns
+    -------
+    the new object.
+
+    """
+    obj = App.ActiveDocument.addObject("Part::FeaturePython",
+                                       "AnchorableObjectInstance")
+    AnchorableObjectInstance(obj)
+    ViewProviderAnchorableObjectInstance(obj.ViewObject)
+    obj.Placement = source.Placement
+    obj.Source = source
+    return obj
+
+
+def world_anchors(feature):
+    r"""Anchors frames of an anchorable object (or instance)
+    expressed in the global frame
+
+    Parameters
+    ----------
+    feature : AnchorableObject or AnchorableObjectInstance feature
+
+    Returns
+    -------
+    dict
+        anchor label -> (p, u, v) tuple of numpy arrays
+
+    """
+    transforms = feature.Proxy.transforms(feature)
+    transforms.set_frames(ROOT, feature.Proxy.local_anchors(feature))
+    return transforms.world_frames(ROOT)
+
+
+def anchors_descriptors(feature):
+    r"""Descriptors of the anchors of an anchorable object (or instance)
+
+    Returns
+    -------
+    dict
+        anchor label -> descriptor (see anchor_descriptors), the anchors
+        without descriptor being left out
+
+    """
+    source = getattr(feature, "Source", None)
+    if source is not None:
+        return anchors_descriptors(source)
+    descriptors = {}
+    for anchor in feature.Anchors:
+        descriptor = anchor_feature_descriptor(anchor)
+        if descriptor is not None:
+            descriptors[anchor.Label] = descriptor
+    return descriptors
+
+
+def anchors_content(feature):
+    r"""Serializable description of the anchors of an anchorable object
+    (or instance), as stored in the stepzip format
+
+    Parameters
+    ----------
+    feature : AnchorableObject or AnchorableObjectInstance feature
+
+    Returns
+    -------
+    dict
+
+    """
+    content = {'anchors': {}, 'properties': {}}
+    if hasattr(feature, "Anchors"):
+        frames = {anchor.Label: (anchor.p, anchor.u, anchor.v)
+                  for anchor in feature.Anchors}
+    else:
+        frames = world_anchors(feature)
+    descriptors = anchors_descriptors(feature)
+    for label, (p, u, v) in frames.items():
+        content['anchors'][label] = {'p': [float(x) for x in p[:3]],
+                                     'u': [float(x) for x in u[:3]],
+                                     'v': [float(x) for x in v[:3]]}
+        if label in descriptors:
+            content['anchors'][label]['descriptor'] = descriptors[label]
+    return content
+
+
 class AnchorableObject:
     def __init__(self, obj):
         # obj.addExtension('App::OriginGroupExtensionPython', self)
@@ -77,23 +211,151 @@ class AnchorableObject:
                         "AnchorableObject",
                         "A link list")
 
+        self._local_anchors = None
+        self._anchor_index = None
+        self._transforms = None
         obj.Proxy = self
 
     def onChanged(self, feature, prop):
         r"""Do something when a property has changed"""
-        debug("Change property: " + str(prop) + "\n")
-        if prop in ['Base']:
+        debug("Change property: %s", prop)
+        record_notification()
+        if prop in ['Anchors', 'Shape'] or \
+                (prop == 'Placement' and not placements_streaming()):
+            # The anchors do not follow a streamed placement: their local
+            # frames must not be derived from it
+            self.invalidate_anchors()
+        if prop == 'Placement' and self._transforms is not None:
+            self._transforms.set_placement(ROOT, feature.Placement)
+        if prop in ['Base'] and feature.Base is not None:
             self.execute(feature)
-            feature.Base.ViewObject.hide()
+            if App.GuiUp:
+                feature.Base.ViewObject.hide()
 
     def execute(self, feature):
         r"""Do something when doing a recomputation, this method is mandatory"""
+        # The anchorable object has its own placement: it starts at the
+        # placement of its Base (see make_anchorable_object_feature)
+        # and may then be placed (e.g. by an assembly)
+        placement = feature.Placement
         feature.Shape = feature.Base.Shape
+        feature.Placement = placement
 
         for anchor in feature.Anchors:
             anchor.Proxy.execute(anchor)
+        self.invalidate_anchors()
         # feature.Label = "Anchorable" + feature.Base.Label
 
+    def invalidate_anchors(self):
+        r"""Forget the cached local anchors frames and index"""
+        self._local_anchors = None
+        self._anchor_index = None
+
+    def anchor_index(self, feature):
+        r"""Labels of the anchors by signature (see anchor_descriptors),
+        cached and shared by all the instances of the anchorable object
+
+        Returns
+        -------
+        dict
+            signature -> list of anchor labels
+
+        """
+        if self._anchor_index is None:
+            self._anchor_index = anchor_index(anchors_descriptors(feature))
+        return self._anchor_index
+
+    def local_anchors(self, feature):
+        r"""Anchors frames expressed in the local frame of the feature
+
+        The frames are cached and shared by all the instances
+        of the anchorable object.
+
+        Returns
+        -------
+        dict
+            anchor label -> (p, u, v) tuple of numpy arrays
+
+        """
+        if self._local_anchors is None:
+            inverse = np.linalg.inv(placement_matrix(feature))
+            self._local_anchors = {
+                anchor.Label: transform_frame(inverse,
+                                              anchor.p, anchor.u, anchor.v)
+                for anchor in feature.Anchors}
+        return self._local_anchors
+
+    def transforms(self, feature):
+        r"""Transform tree (see transform_tree) of the feature: its
+        placement, and its anchors frames once world_anchors was called"""
+        if self._transforms is None:
+            self._transforms = placement_tree(feature.Placement)
+        return self._transforms
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        self._local_anchors = None
+        self._anchor_index = None
+        self._transforms = None
+        return None
+
+
+class AnchorableObjectInstance:
+    r"""Placed reference to an anchorable object
+
+    The shape of the source is shared (not copied) and the anchors
+    of the instance are derived on the fly from the local anchors frames
+    of the source: no Anchor feature is created per instance.
+
+    """
+    def __init__(self, obj):
+        obj.addProperty("App::PropertyLink",
+                        "Source",
+                        "AnchorableObjectInstance",
+                        "Anchorable object this is an instance of")
+
+        self._transforms = None
+        obj.Proxy = self
+
+    def onChanged(self, feature, prop):
+        r"""Do something when a property has changed"""
+        debug("Change property of instance: %s", prop)
+        record_notification()
+        if prop == 'Placement' and self._transforms is not None:
+            self._transforms.set_placement(ROOT, feature.Placement)
+        if prop in ['Source'] and feature.Source is not None:
+            self.execute(feature)
+
+    def execute(self, feature):
+        r"""Do something when doing a recomputation, this method is mandatory"""
+        placement = feature.Placement
+        # Assigning the Shape copies the TopoDS handle, not the geometry
+        feature.Shape = feature.Source.Shape
+        feature.Placement = placement
+
+    def local_anchors(self, feature):
+        r"""Anchors frames of the source, in the local frame"""
+        return feature.Source.Proxy.local_anchors(feature.Source)
+
+    def anchor_index(self, feature):
+        r"""Labels of the anchors of the source by signature"""
+        return feature.Source.Proxy.anchor_index(feature.Source)
+
+    def transforms(self, feature):
+        r"""Transform tree (see transform_tree) of the instance"""
+        if self._transforms is None:
+            self._transforms = placement_tree(feature.Placement)
+        return self._transforms
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        self._transforms = None
+        return None
+
 
 class ViewProviderAnchorableObject:
     def __init__(self, vobj):
@@ -125,6 +387,11 @@ class ViewProviderAnchorableObject:
             children.append(anchor)
         return children
 
+    def onChanged(self, vobj, prop):
+        r"""Showing an object whose geometry is not loaded yet loads it"""
+        if prop == "Visibility" and vobj.Visibility:
+            ensure_shape(vobj.Object)
+
     def onDelete(self, feature, subelements):
         try:
             self.Object.Base.ViewObject.show()
@@ -137,3 +404,35 @@ class ViewProviderAnchorableObject:
 
     def __setstate__(self, state):
         return None
+
+
+class ViewProviderAnchorableObjectInstance:
+    def __init__(self, vobj):
+        r"""Set this object to the proxy object of the actual view provider"""
+        vobj.Proxy = self
+
+    def attach(self, vobj):
+        r"""Setup the scene sub-graph of the view provider,
+        this method is mandatory
+        """
+        self.ViewObject = vobj
+        self.Object = vobj.Object
+
+    def getIcon(self):
+        r"""Return the icon in XPM format which will appear in the tree view.
+        This method is\ optional and if not defined a default icon is shown.
+        """
+        return join(dirname(__file__),
+                    "resources",
+                    "freecad_workbench_anchors_add_anchorable_object.svg")
+
+    def onChanged(self, vobj, prop):
+        r"""Showing an instance loads the geometry of its source"""
+        if prop == "Visibility" and vobj.Visibility:
+            ensure_shape(vobj.Object)
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        return None
@@ -0,0 +1,549 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Assembly and Mate Python Features
+
+An assembly is:
+- a list of parts (anchorable objects, instances or other assemblies)
+- a list of mates, each mate superimposing an anchor of a part
+  on an anchor of another part
+
+The first part of an assembly is grounded, the other parts are placed
+by walking the mates graph from it.
+
+An assembly used as a part of another assembly (a subassembly) is a rigid
+unit: its solved internal placements and the frames of its exposed
+(boundary) anchors are cached, and are only solved again when something
+inside the subassembly changes. The parent assembly mates against the
+cached boundary anchors, labelled PartName.AnchorLabel.
+
+An assembly can be exploded: the exploded placements are cached alongside
+the assembled ones, so that switching between both is immediate.
+
+"""
+
+from collections import deque
+from os.path import join, dirname
+
+import numpy as np
+
+import FreeCAD as App
+
+from anchor_math import anchors_transformations, transform_points, \
+    transform_vectors
+from freecad_logging import debug
+from placement_updates import apply_placements, record_notification
+from placements import transform_frame
+from transform_tree import ROOT, placement_matrix, placement_tree
+
+
+def make_assembly_feature(parts):
+    r"""makes an assembly feature
+
+    Parameters
+    ----------
+    parts : list
+        Anchorable objects, instances or assemblies. The first one is grounded.
+
+    Returns
+    -------
+    the new object.
+
+    """
+    obj = App.ActiveDocument.addObject("App::FeaturePython", "Assembly")
+    Assembly(obj)
+    ViewProviderAssembly(obj.ViewObject)
+    obj.Parts = parts
+    return obj
+
+
+def make_mate_feature(assembly, part0, anchor0, part1, anchor1):
+    r"""makes a mate feature and adds it to an assembly
+
+    Parameters
+    ----------
+    assembly : Assembly feature
+    part0 : part of the assembly
+    anchor0 : str
+        Label of the anchor of part0
+    part1 : part of the assembly
+    anchor1 : str
+        Label of the anchor of part1
+
+    Returns
+    -------
+    the new object.
+
+    """
+    obj = App.ActiveDocument.addObject("App::FeaturePython", "Mate")
+    Mate(obj, part0, anchor0, part1, anchor1)
+    mates = assembly.Mates
+    mates.append(obj)
+    assembly.Mates = mates
+    return obj
+
+
+def is_assembly(object_):
+    return hasattr(object_, "Parts") and hasattr(object_, "Mates")
+
+
+def leaf_parts(assembly):
+    r"""Anchorable objects and instances of an assembly and of
+    all its subassemblies"""
+    leaves = []
+    for part in assembly.Parts:
+        if is_assembly(part):
+            leaves.extend(leaf_parts(part))
+        else:
+            leaves.append(part)
+    return leaves
+
+
+def mate_anchor(assembly, part, label):
+    r"""Part of an assembly to mate, and anchor label, for an anchor of a
+    part of the assembly or of one of its subassemblies
+
+    The anchor of a part of a subassembly is mated through the boundary
+    anchors of the subassembly (see Assembly.local_anchors), labelled
+    PartName.AnchorLabel at each level.
+
+    Parameters
+    ----------
+    assembly : Assembly feature
+    part : anchorable object, instance or assembly
+    label : str
+        Label of the anchor of part
+
+    Returns
+    -------
+    tuple
+        (part of the assembly, anchor label in that part),
+        None if part is not in the assembly
+
+    """
+    if part in assembly.Parts:
+        return part, label
+    for subassembly in assembly.Parts:
+        if is_assembly(subassembly):
+            found = mate_anchor(subassembly, part, label)
+            if found is not None:
+                return subassembly, "%s.%s" % (found[0].Name, found[1])
+    return None
+
+
+def free_matrix(part):
+    r"""Placement of a part before it was placed by an assembly
+
+    The placement of the base of an anchorable object (or of the base of
+    the source of an instance)
+
+    Returns
+    -------
+    4x4 matrix (numpy array)
+
+    """
+    source = getattr(part, "Source", None)
+    if source is not None:
+        return free_matrix(source)
+    base = getattr(part, "Base", None)
+    if base is None:
+        return placement_matrix(part)
+    return placement_matrix(base)
+
+
+def _frames_key(frames):
+    r"""Hashable, rounded representation of a dict of anchors frames"""
+    return tuple(sorted(
+        (label, tuple(np.round(np.concatenate(frame), 9).tolist()))
+        for label, frame in frames.items()))
+
+
+def mate_tree(parts, mates):
+    r"""Breadth first traversal of the mates graph from the grounded part
+
+    Parameters
+    ----------
+    parts : list
+        The parts, the first one is grounded
+    mates : list of tuples
+        (part0 name, anchor0 label, part1 name, anchor1 label)
+
+    Returns
+    -------
+    list of tuples
+        (part name, depth, parent name, parent anchor label, anchor label)
+        in traversal order, for the parts connected to the grounded part.
+        The grounded part comes first, with a depth of 0 and no parent.
+
+    """
+    neighbours = {part.Name: [] for part in parts}
+    for name0, label0, name1, label1 in mates:
+        if name0 not in neighbours or name1 not in neighbours:
+            debug("Mate between parts that are not in the assembly ignored")
+            continue
+        neighbours[name0].append((label0, name1, label1))
+        neighbours[name1].append((label1, name0, label0))
+
+    tree = [(parts[0].Name, 0, None, None, None)]
+    depths = {parts[0].Name: 0}
+    queue = deque([parts[0].Name])
+
+    while queue:
+        placed = queue.popleft()
+        for label, other, other_label in neighbours[placed]:
+            if other in depths:
+                continue
+            depths[other] = depths[placed] + 1
+            tree.append((other, depths[other], placed, label, other_label))
+            queue.append(other)
+
+    return tree
+
+
+def solve(tree, grounded_matrix, frames):
+    r"""Place the parts so that the mated anchors are superimposed
+
+    Parameters
+    ----------
+    tree : list of tuples
+        Mates graph traversal, as returned by mate_tree
+    grounded_matrix : 4x4 matrix (numpy array)
+        Placement of the grounded part
+    frames : dict
+        part name -> local anchors frames of the part
+
+    Returns
+    -------
+    dict
+        part name -> 4x4 matrix, for the parts of the tree
+
+    """
+    grounded = tree[0][0]
+    matrices = {grounded: grounded_matrix}
+
+    # The parts at a depth only depend on the parts at the previous depth
+    # (the tree is in breadth first order): each depth is solved in a
+    # single batch
+    mated = tree[1:]
+    start = 0
+    while start < len(mated):
+        depth = mated[start][1]
+        end = start
+        while end < len(mated) and mated[end][1] == depth:
+            end += 1
+        level = mated[start:end]
+
+        parents = np.array([matrices[parent]
+                            for _, _, parent, _, _ in level])
+        parent_frames = np.array([frames[parent][parent_label]
+                                  for _, _, parent, parent_label, _ in level],
+                                 dtype=float)
+        frames_0 = np.array([frames[name][label]
+                             for name, _, _, _, label in level], dtype=float)
+        p1 = transform_points(parents, parent_frames[:, 0])
+        u1 = transform_vectors(parents, parent_frames[:, 1])
+        v1 = transform_vectors(parents, parent_frames[:, 2])
+        solved = anchors_transformations(frames_0[:, 0], frames_0[:, 1],
+                                         frames_0[:, 2], p1, u1, v1)
+        for (name, _, _, _, _), matrix in zip(level, solved):
+            matrices[name] = matrix
+        start = end
+
+    return matrices
+
+
+def explode(tree, matrices, frames, distance):
+    r"""Exploded placements of the parts
+
+    Each part is moved along the u direction of the anchor it is mated to,
+    by its depth in the mates graph times the distance.
+    All the offsets are computed in a single vectorized pass.
+
+    Parameters
+    ----------
+    tree : list of tuples
+        Mates graph traversal, as returned by mate_tree
+    matrices : dict
+        part name -> assembled 4x4 matrix, as returned by solve
+    frames : dict
+        part name -> local anchors frames of the part
+    distance : float
+
+    Returns
+    -------
+    dict
+        part name -> exploded 4x4 matrix
+
+    """
+    exploded = dict(matrices)
+    mated = tree[1:]
+    if len(mated) == 0:
+        return exploded
+
+    parents = np.array([matrices[parent][:3, :3]
+                        for _, _, parent, _, _ in mated])
+    u = np.array([frames[parent][parent_label][1]
+                  for _, _, parent, parent_label, _ in mated])
+    depths = np.array([depth for _, depth, _, _, _ in mated], dtype=float)
+
+    offsets = np.einsum('nij,nj->ni', parents, u) \
+        * (depths * distance)[:, np.newaxis]
+
+    stacked = np.array([matrices[name] for name, _, _, _, _ in mated])
+    stacked[:, :3, 3] += offsets
+    for (name, _, _, _, _), matrix in zip(mated, stacked):
+        exploded[name] = matrix
+    return exploded
+
+
+class Mate:
+    r"""Superimposition of an anchor of a part on an anchor of another part"""
+    def __init__(self, obj, part0, anchor0, part1, anchor1):
+        obj.addProperty("App::PropertyLink",
+                        "Part0",
+                        "Mate",
+                        "First part").Part0 = part0
+        obj.addProperty("App::PropertyString",
+                        "Anchor0",
+                        "Mate",
+                        "Label of the anchor of the first part").Anchor0 = \
+            anchor0
+        obj.addProperty("App::PropertyLink",
+                        "Part1",
+                        "Mate",
+                        "Second part").Part1 = part1
+        obj.addProperty("App::PropertyString",
+                        "Anchor1",
+                        "Mate",
+                        "Label of the anchor of the second part").Anchor1 = \
+            anchor1
+        obj.Proxy = self
+
+    def onChanged(self, fp, prop):
+        r"""Do something when a property has changed"""
+        debug("Change property of Mate: %s", prop)
+
+    def execute(self, fp):
+        r"""Do something when doing a recomputation, this method is mandatory"""
+        pass
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        return None
+
+
+class Assembly:
+    def __init__(self, obj):
+        obj.addProperty("App::PropertyPlacement",
+                        "Placement",
+                        "Base",
+                        "Placement of the assembly")
+
+        obj.addProperty("App::PropertyLinkList",
+                        "Parts",
+                        "Assembly",
+                        "Parts of the assembly, the first one is grounded")
+
+        obj.addProperty("App::PropertyLinkList",
+                        "Mates",
+                        "Assembly",
+                        "Mates between the anchors of the parts")
+
+        obj.addProperty("App::PropertyStringList",
+                        "ExposedAnchors",
+                        "Assembly",
+                        "Anchors usable by a parent assembly, as "
+                        "PartName.AnchorLabel (all the unmated anchors "
+                        "if empty)")
+
+        obj.addProperty("App::PropertyBool",
+                        "Exploded",
+                        "Exploded view",
+                        "Show the exploded view of the assembly")
+
+        obj.addProperty("App::PropertyFloat",
+                        "ExplosionDistance",
+                        "Exploded view",
+                        "Offset of the parts per level of the mates "
+                        "graph").ExplosionDistance = 10.
+        self._reset_cache()
+        obj.Proxy = self
+
+    def _reset_cache(self):
+        self._cache_key = None
+        self._transforms = None
+        self._tree = None
+        self._frames = None
+        self._internal = None
+        self._boundary = None
+        self._exploded = None
+        self._exploded_distance = None
+
+    def onChanged(self, feature, prop):
+        r"""Do something when a property has changed"""
+        debug("Change property of Assembly: %s", prop)
+        record_notification()
+        if prop == 'Placement' and self._transforms is not None:
+            self._transforms.set_placement(ROOT, feature.Placement)
+        if prop in ['Placement', 'Exploded', 'ExplosionDistance'] \
+                and self._internal is not None:
+            # Moving the assembly moves its parts as a rigid unit
+            self.apply(feature)
+
+    def execute(self, feature):
+        r"""Do something when doing a recomputation, this method is mandatory"""
+        if len(feature.Parts) == 0:
+            self._reset_cache()
+            return
+
+        frames = {part.Name: part.Proxy.local_anchors(part)
+                  for part in feature.Parts}
+        mates = [(mate.Part0.Name, mate.Anchor0, mate.Part1.Name, mate.Anchor1)
+                 for mate in feature.Mates]
+
+        grounded = feature.Parts[0]
+        grounded_matrix = np.dot(np.linalg.inv(placement_matrix(feature)),
+                                 placement_matrix(grounded))
+
+        key = (tuple((name, _frames_key(frames[name]))
+                     for name in sorted(frames)),
+               tuple(mates),
+               tuple(feature.ExposedAnchors),
+               tuple(np.round(grounded_matrix, 9).ravel().tolist()))
+
+        if key != self._cache_key:
+            debug("Solving assembly %s", feature.Name)
+            self._tree = mate_tree(feature.Parts, mates)
+            self._frames = frames
+            self._internal = solve(self._tree, grounded_matrix, frames)
+            self._boundary = self._boundary_frames(feature, frames, mates)
+            self._exploded = None
+            self._cache_key = key
+        else:
+            debug("Assembly %s is up to date", feature.Name)
+
+        self.apply(feature)
+
+    def apply(self, feature):
+        r"""Move the parts to their solved (assembled or exploded)
+        placements
+
+        The parts are the children of the placement of the assembly in
+        its transform tree: moving the assembly only marks them dirty.
+
+        """
+        transforms = self.transforms(feature)
+        transforms.set_locals(ROOT, self.exploded(feature) if feature.Exploded
+                              else self._internal)
+        apply_placements([(part, transforms.world(part.Name))
+                          for part in feature.Parts
+                          if part.Name in transforms],
+                         document=feature.Document,
+                         recompute=False)
+
+    def exploded(self, feature):
+        r"""Exploded placements of the parts, in the local frame
+        of the assembly"""
+        if self._exploded is None \
+                or self._exploded_distance != feature.ExplosionDistance:
+            self._exploded = explode(self._tree, self._internal, self._frames,
+                                     feature.ExplosionDistance)
+            self._exploded_distance = feature.ExplosionDistance
+        return self._exploded
+
+    def _boundary_frames(self, feature, frames, mates):
+        r"""Frames of the exposed anchors, in the local frame
+        of the assembly"""
+        if len(feature.ExposedAnchors) > 0:
+            exposed = [tuple(name.split(".", 1))
+                       for name in feature.ExposedAnchors]
+        else:
+            mated = set()
+            for name0, label0, name1, label1 in mates:
+                mated.add((name0, label0))
+                mated.add((name1, label1))
+            exposed = [(part.Name, label)
+                       for part in feature.Parts
+                       for label in frames[part.Name]
+                       if (part.Name, label) not in mated]
+
+        boundary = {}
+        for name, label in exposed:
+            if name not in self._internal:
+                continue
+            boundary["%s.%s" % (name, label)] = \
+                transform_frame(self._internal[name], *frames[name][label])
+        return boundary
+
+    def local_anchors(self, feature):
+        r"""Exposed anchors frames, in the local frame of the assembly
+
+        This is what a parent assembly mates against.
+
+        """
+        if self._boundary is None:
+            self.execute(feature)
+        return self._boundary or {}
+
+    def transforms(self, feature):
+        r"""Transform tree (see transform_tree) of the assembly: its
+        placement, and the solved placements of its parts"""
+        if self._transforms is None:
+            self._transforms = placement_tree(feature.Placement)
+        return self._transforms
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        self._reset_cache()
+        return None
+
+
+class ViewProviderAssembly:
+    def __init__(self, vobj):
+        r"""Set this object to the proxy object of the actual view provider"""
+        vobj.Proxy = self
+
+    def attach(self, vobj):
+        r"""Setup the scene sub-graph of the view provider,
+        this method is mandatory
+        """
+        self.ViewObject = vobj
+        self.Object = vobj.Object
+
+    def getIcon(self):
+        r"""Return the icon in XPM format which will appear in the tree view.
+        This method is\ optional and if not defined a default icon is shown.
+        """
+        return join(dirname(__file__),
+                    "resources",
+                    "freecad_workbench_anchors_add_assembly.svg")
+
+    def claimChildren(self):
+        r"""Parts and mates are shown as children of the assembly"""
+        return self.Object.Parts + self.Object.Mates
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        return None
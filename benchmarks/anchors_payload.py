@@ -0,0 +1,112 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Benchmark of the JSON and binary anchors payloads of stepzip archives
+
+Does not require FreeCAD. Usage:
+
+    python benchmarks/anchors_payload.py [number of anchors ...]
+
+"""
+
+from __future__ import print_function
+
+from os.path import dirname, join, abspath
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from stepzip import StepzipWriter, read_content, read_anchors_array, \
+    anchors_from_array  # noqa: E402
+
+
+def random_anchors(n, seed=0):
+    r"""n anchors with random p, u, v and descriptors"""
+    values = np.random.RandomState(seed).uniform(-100, 100, (n, 9))
+    return {"Anchor%07i" % i: {'p': row[0:3].tolist(),
+                               'u': row[3:6].tolist(),
+                               'v': row[6:9].tolist(),
+                               'descriptor': {'type': 'circular_edge',
+                                              'radius': abs(row[0]),
+                                              'area': 0.,
+                                              'planar': True,
+                                              'signature': i}}
+            for i, row in enumerate(values)}
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - start, result
+
+
+def write_archive(path, content, binary_anchors):
+    with StepzipWriter(path, binary_anchors=binary_anchors) as writer:
+        writer.write_anchors(content)
+
+
+def benchmark(n, directory):
+    content = {'anchors': random_anchors(n), 'properties': {}}
+    json_path = join(directory, "json_%i.stepzip" % n)
+    binary_path = join(directory, "binary_%i.stepzip" % n)
+
+    t_write_json, _ = timed(write_archive, json_path, content, False)
+    t_write_binary, _ = timed(write_archive, binary_path, content, True)
+    t_read_json, read = timed(read_content, json_path)
+    t_read_content, read_binary = timed(read_content, binary_path)
+    t_read_binary, (labels, array) = timed(read_anchors_array, binary_path,
+                                           mmap=False)
+    t_mmap, (_, mapped) = timed(read_anchors_array, binary_path, mmap=True)
+
+    assert read_binary['anchors'] == read['anchors']
+    frames = anchors_from_array(labels, array)
+    assert all(frames[label]['p'] == anchor['p']
+               for label, anchor in read['anchors'].items())
+    assert np.array_equal(mapped, array)
+
+    with zipfile.ZipFile(json_path) as zf:
+        json_size = zf.getinfo(zf.namelist()[0]).compress_size
+    with zipfile.ZipFile(binary_path) as zf:
+        name = zf.namelist()[0].rsplit(".", 1)[0]
+        binary_size = zf.getinfo(name + ".npy").compress_size + \
+            zf.getinfo(name + ".labels").compress_size + \
+            zf.getinfo(name + ".descriptors.npy").compress_size
+
+    print("%9i anchors | write json %8.3f s  binary %8.3f s | "
+          "read json %8.3f s  binary %8.3f s (arrays %8.3f s, "
+          "mmap %8.3f s) | json %7.1f MB  binary %7.1f MB" %
+          (n, t_write_json, t_write_binary,
+           t_read_json, t_read_content, t_read_binary, t_mmap,
+           json_size / 1e6, binary_size / 1e6))
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    directory = tempfile.mkdtemp()
+    try:
+        for count in counts:
+            benchmark(count, directory)
+    finally:
+        shutil.rmtree(directory)
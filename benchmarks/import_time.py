@@ -0,0 +1,60 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Benchmark of the import time of the transformation kernels
+
+Each module is imported in a fresh interpreter (after NumPy, which both
+modules need), so that nothing is cached between measurements. Does not
+require FreeCAD. Usage:
+
+    python benchmarks/import_time.py [repeats]
+
+"""
+
+from __future__ import print_function
+
+from os.path import dirname, abspath
+import subprocess
+import sys
+
+ROOT = dirname(dirname(abspath(__file__)))
+
+_TIMER = """
+import sys, time, warnings
+sys.path.insert(0, %r)
+import numpy
+warnings.simplefilter("ignore")
+start = time.time()
+import %s
+print((time.time() - start) * 1000.)
+"""
+
+
+def import_time(module, repeats):
+    r"""Best import time of a module in fresh interpreters, in ms"""
+    return min(float(subprocess.check_output([sys.executable, "-c",
+                                              _TIMER % (ROOT, module)]))
+               for _ in range(repeats))
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print("%-16s %10s" % ("module", "import ms"))
+    for module in ("anchor_math", "transformations"):
+        print("%-16s %10.2f" % (module, import_time(module, repeats)))
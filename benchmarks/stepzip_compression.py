@@ -0,0 +1,104 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Benchmark of the stepzip compression strategies over a corpus of STEP files
+
+Does not require FreeCAD. Usage:
+
+    python benchmarks/stepzip_compression.py <directory of STEP files>
+
+Reports, for each compression method and level, the total time to write
+the stepzips of all the STEP files of the directory (recursively), the
+total time to read them back and the total size of the archives.
+
+"""
+
+from __future__ import print_function
+
+import os
+from os.path import dirname, join, abspath, getsize
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from stepzip import StepzipWriter, COMPRESSIONS  # noqa: E402
+
+LEVELS = {"stored": [None],
+          "deflated": [1, 6, 9],
+          "bzip2": [1, 9],
+          "lzma": [None]}
+
+
+def step_files(directory):
+    r"""STEP files of a directory tree"""
+    return sorted(join(root, filename)
+                  for root, _, filenames in os.walk(directory)
+                  for filename in filenames
+                  if filename.lower().endswith((".stp", ".step")))
+
+
+def benchmark(corpus, compression, compresslevel, directory):
+    write_time, read_time, size = 0., 0., 0
+    for i, step_file in enumerate(corpus):
+        path = join(directory, "%i.stepzip" % i)
+
+        start = time.time()
+        with StepzipWriter(path, compression=compression,
+                           compresslevel=compresslevel) as writer:
+            writer.write_step_file(step_file)
+            writer.write_anchors({'anchors': {}, 'properties': {}})
+        write_time += time.time() - start
+
+        start = time.time()
+        with zipfile.ZipFile(path) as zf:
+            zf.read(writer.step_entry)
+        read_time += time.time() - start
+
+        size += getsize(path)
+        os.remove(path)
+    return write_time, read_time, size
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+
+    corpus = step_files(sys.argv[1])
+    total = sum(getsize(step_file) for step_file in corpus)
+    print("%i STEP files, %.1f MB" % (len(corpus), total / 1e6))
+
+    directory = tempfile.mkdtemp()
+    try:
+        for compression in sorted(COMPRESSIONS):
+            for compresslevel in LEVELS[compression]:
+                write_time, read_time, size = \
+                    benchmark(corpus, compression, compresslevel, directory)
+                print("%-9s level %-7s | write %8.3f s | read %8.3f s | "
+                      "%8.1f MB (%5.1f %%)" %
+                      (compression,
+                       "default" if compresslevel is None else compresslevel,
+                       write_time, read_time, size / 1e6,
+                       100. * size / total if total > 0 else 0.))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,207 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""On-disk cache of the geometry and anchors of stepzip archives
+
+The translation of the STEP entry of a stepzip is by far the most expensive
+part of opening it. The cache stores the native BREP of the shape and the
+parsed anchors content (anchors and properties), keyed by the path, size
+and modification time of the archive (see cache_key), so that opening the
+same archive again skips the STEP translation completely. The key is
+computed without reading the archive.
+
+Each entry is made of <key>.brep and <key>.json files. The least recently
+used entries (by modification time, refreshed on every hit) are evicted
+when the total size of the cache exceeds its maximum size. The total size
+is kept up to date by the writes: the directory is only scanned when it
+goes over the maximum size (and once, to initialize it).
+
+"""
+
+from os import fdopen, listdir, makedirs, remove, replace, stat, utime
+from os.path import abspath, exists, isdir, join, splitext
+import hashlib
+import json
+import tempfile
+
+# Default maximum size of the cache, in bytes
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# Fraction of the maximum size a write going over it evicts down to, so
+# that the directory is not scanned again by the next write
+EVICTION_TARGET = 0.9
+
+_BREP = ".brep"
+_CONTENT = ".json"
+
+
+def cache_key(path):
+    r"""Key of a file in the cache
+
+    Derived from the absolute path, the size and the modification time of
+    the file: rewriting the file changes its key, and the file is not read.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    str
+        Hexadecimal digest
+
+    """
+    status = stat(path)
+    return hashlib.sha1(json.dumps([abspath(path),
+                                    status.st_size,
+                                    status.st_mtime_ns])
+                        .encode("utf-8")).hexdigest()
+
+
+class BrepCache:
+    r"""On-disk LRU cache of BREP strings and anchors
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the cache, created if needed
+    max_size : int
+        Maximum total size of the cache, in bytes
+
+    """
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        if not isdir(directory):
+            makedirs(directory)
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Running total size of the files, None until first needed
+        self._size = None
+
+    def _path(self, key, extension):
+        return join(self.directory, key + extension)
+
+    def _read(self, key, extension):
+        path = self._path(key, extension)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        # Refresh the entry for the LRU eviction
+        utime(path, None)
+        self.hits += 1
+        return data.decode("utf-8")
+
+    def _write(self, key, extension, text):
+        if self._size is None:
+            self._size = self.size()
+        path = self._path(key, extension)
+        try:
+            replaced = stat(path).st_size
+        except OSError:
+            replaced = 0
+        data = text.encode("utf-8")
+        # Written to a temporary file first so that a concurrent reader
+        # never sees a partial entry
+        handle, temporary = tempfile.mkstemp(dir=self.directory,
+                                             suffix=".part")
+        try:
+            with fdopen(handle, "wb") as f:
+                f.write(data)
+            replace(temporary, path)
+        except Exception:
+            if exists(temporary):
+                remove(temporary)
+            raise
+        self._size += len(data) - replaced
+        if self._size > self.max_size:
+            self.evict(int(self.max_size * EVICTION_TARGET))
+
+    def get_brep(self, key):
+        r"""The BREP string of the shape, None if not cached"""
+        return self._read(key, _BREP)
+
+    def put_brep(self, key, brep):
+        self._write(key, _BREP, brep)
+
+    def get_content(self, key):
+        r"""The anchors content (anchors and properties), None if not cached"""
+        text = self._read(key, _CONTENT)
+        return None if text is None else json.loads(text)
+
+    def put_content(self, key, content):
+        self._write(key, _CONTENT, json.dumps(content))
+
+    def _files(self):
+        r"""(modification time, size, path) of the files of the cache"""
+        files = []
+        for name in listdir(self.directory):
+            if splitext(name)[1] not in (_BREP, _CONTENT):
+                continue
+            path = join(self.directory, name)
+            try:
+                st = stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def size(self):
+        r"""Total size of the cache, in bytes"""
+        return sum(size for _, size, _ in self._files())
+
+    def evict(self, target_size=None):
+        r"""Remove the least recently used entries until the cache
+        fits in target_size (its maximum size if None)"""
+        if target_size is None:
+            target_size = self.max_size
+        entries = {}
+        for mtime, size, path in self._files():
+            key = splitext(path)[0]
+            last_used, total = entries.get(key, (0, 0))
+            entries[key] = (max(last_used, mtime), total + size)
+        total_size = sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda e: e[1][0]):
+            if total_size <= target_size:
+                break
+            for extension in (_BREP, _CONTENT):
+                if exists(key + extension):
+                    remove(key + extension)
+            total_size -= size
+            self.evictions += 1
+        self._size = total_size
+
+    def clear(self):
+        r"""Remove all the entries"""
+        for _, _, path in self._files():
+            remove(path)
+        self._size = 0
+
+    def stats(self):
+        r"""Hits, misses, evictions and size of the cache"""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / float(lookups) if lookups else 0.,
+                "evictions": self.evictions,
+                "size": self.size()}
@@ -0,0 +1,323 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Catalog of a library of stepzip archives, in a local SQLite index
+
+Indexing an archive only reads its anchors entry (never its STEP entry).
+The index stores, for each archive:
+- the name of the part, its number of anchors and its key dimensions
+  (the sizes of its bounding box, sorted, when saved with them)
+- for each anchor, its label and, when the anchor has a descriptor (see
+  anchor_descriptors), its type, radius and signature
+- the geometric fingerprint of the part, to report the duplicated parts
+  of the library
+
+so that searches across the library (e.g. the parts with a 10 mm hole
+anchor) are answered without opening the archives.
+
+Rescans are incremental: an archive whose modification time and size
+did not change is skipped, and an archive that was touched without
+changing (same content hash) is not read again.
+
+"""
+
+from os import stat
+from os.path import abspath, basename, exists, join, splitext
+import sqlite3
+from zipfile import BadZipFile
+
+from stepzip import content_hash, read_content, stepzip_paths
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS parts (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    anchor_count INTEGER NOT NULL,
+    dimension_0 REAL,
+    dimension_1 REAL,
+    dimension_2 REAL,
+    geometry TEXT
+);
+CREATE TABLE IF NOT EXISTS anchors (
+    part_id INTEGER NOT NULL REFERENCES parts(id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    type TEXT,
+    radius REAL,
+    signature INTEGER
+);
+CREATE INDEX IF NOT EXISTS anchors_type_radius ON anchors (type, radius);
+CREATE INDEX IF NOT EXISTS anchors_part ON anchors (part_id);
+CREATE INDEX IF NOT EXISTS anchors_signature ON anchors (signature);
+CREATE INDEX IF NOT EXISTS parts_geometry ON parts (geometry);
+"""
+
+# Version of the schema, the index is rebuilt when it changes
+_SCHEMA_VERSION = 3
+
+
+def key_dimensions(properties):
+    r"""Sorted sizes of the bounding box of a part, None if unknown
+
+    Parameters
+    ----------
+    properties : dict
+        Properties of the anchors content of a stepzip
+
+    Returns
+    -------
+    list of 3 floats or None
+
+    """
+    bounding_box = properties.get('bounding_box')
+    if bounding_box is None:
+        return None
+    return sorted(bounding_box[i + 3] - bounding_box[i] for i in range(3))
+
+
+class Catalog:
+    r"""SQLite index of stepzip archives
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite database, created if needed
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != _SCHEMA_VERSION:
+            self.connection.executescript("DROP TABLE IF EXISTS anchors;"
+                                          "DROP TABLE IF EXISTS parts;")
+            self.connection.execute("PRAGMA user_version = %i" %
+                                    _SCHEMA_VERSION)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _index(self, path, mtime, size, hash_, part_id=None):
+        r"""(Re)index the anchors entry of a stepzip
+
+        The archive is read before anything is written to the index.
+
+        """
+        content = read_content(path)
+        anchors = content['anchors']
+        properties = content.get('properties', {})
+        dimensions = key_dimensions(properties) or [None, None, None]
+        rows = []
+        for label, anchor in anchors.items():
+            descriptor = anchor.get('descriptor', {})
+            rows.append((label, descriptor.get('type'),
+                         descriptor.get('radius'),
+                         descriptor.get('signature')))
+        if part_id is not None:
+            self.connection.execute("DELETE FROM parts WHERE id = ?",
+                                    (part_id,))
+        cursor = self.connection.execute(
+            "INSERT INTO parts (path, name, mtime, size, hash, anchor_count, "
+            "dimension_0, dimension_1, dimension_2, geometry) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [path, splitext(basename(path))[0], mtime, size, hash_,
+             len(anchors)] + dimensions +
+            [properties.get('geometric_fingerprint')])
+        self.connection.executemany(
+            "INSERT INTO anchors (part_id, label, type, radius, signature) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(cursor.lastrowid,) + row for row in rows])
+
+    def scan(self, directory):
+        r"""Index the stepzips of a directory tree, incrementally
+
+        Parameters
+        ----------
+        directory : str
+
+        Returns
+        -------
+        dict
+            Number of archives indexed, skipped (unchanged), removed (no
+            longer on disk) and failed (unreadable), and the errors of the
+            failed archives as a list of (path, message)
+
+        """
+        directory = abspath(directory)
+        known = {row[0]: row[1:] for row in self.connection.execute(
+            "SELECT path, id, mtime, size, hash FROM parts")
+            if row[0].startswith(join(directory, ""))}
+        stats = {'indexed': 0, 'skipped': 0, 'removed': 0, 'failed': 0,
+                 'errors': []}
+
+        with self.connection:
+            for path in stepzip_paths([directory]):
+                path = abspath(path)
+                st = stat(path)
+                part_id, mtime, size, hash_ = known.pop(path,
+                                                        (None, None, None,
+                                                         None))
+                if (mtime, size) == (st.st_mtime, st.st_size):
+                    stats['skipped'] += 1
+                    continue
+                # A corrupt archive must not abort (and roll back) the scan
+                try:
+                    new_hash = content_hash(path)
+                    if new_hash == hash_:
+                        # Touched, not changed
+                        self.connection.execute(
+                            "UPDATE parts SET mtime = ?, size = ? "
+                            "WHERE id = ?",
+                            (st.st_mtime, st.st_size, part_id))
+                        stats['skipped'] += 1
+                        continue
+                    self._index(path, st.st_mtime, st.st_size, new_hash,
+                                part_id)
+                except (BadZipFile, KeyError, ValueError) as err:
+                    if part_id is not None:
+                        # Its previous index no longer describes it
+                        self.connection.execute(
+                            "DELETE FROM parts WHERE id = ?", (part_id,))
+                    stats['failed'] += 1
+                    stats['errors'].append((path, str(err)))
+                    continue
+                stats['indexed'] += 1
+
+            for path, (part_id, _, _, _) in known.items():
+                if not exists(path):
+                    self.connection.execute("DELETE FROM parts WHERE id = ?",
+                                            (part_id,))
+                    stats['removed'] += 1
+        return stats
+
+    def parts_with_anchor(self, anchor_type=None, radius=None,
+                          tolerance=1e-6):
+        r"""Parts having at least one anchor of a type and/or radius
+
+        Parameters
+        ----------
+        anchor_type : str or None
+            e.g. 'circular_edge' for the edge of a hole or of a shaft
+        radius : float or None
+        tolerance : float
+            Tolerance on the radius
+
+        Returns
+        -------
+        list of tuples
+            (path, name) of the parts
+
+        """
+        query = "SELECT DISTINCT parts.path, parts.name FROM parts " \
+                "JOIN anchors ON anchors.part_id = parts.id WHERE 1"
+        arguments = []
+        if anchor_type is not None:
+            query += " AND anchors.type = ?"
+            arguments.append(anchor_type)
+        if radius is not None:
+            query += " AND anchors.radius BETWEEN ? AND ?"
+            arguments.extend([radius - tolerance, radius + tolerance])
+        return self.connection.execute(query + " ORDER BY parts.path",
+                                       arguments).fetchall()
+
+    def parts_with_anchor_signature(self, signature):
+        r"""Parts having at least one anchor with a signature, i.e.
+        an anchor that can mate with anchors of that signature
+
+        Parameters
+        ----------
+        signature : int
+            see anchor_descriptors.signature
+
+        Returns
+        -------
+        list of tuples
+            (path, name, anchor label) of the parts and matching anchors
+
+        """
+        return self.connection.execute(
+            "SELECT parts.path, parts.name, anchors.label FROM anchors "
+            "JOIN parts ON anchors.part_id = parts.id "
+            "WHERE anchors.signature = ? ORDER BY parts.path, anchors.label",
+            (signature,)).fetchall()
+
+    def parts_fitting(self, dimensions):
+        r"""Parts whose bounding box fits in a box, in any orientation
+        along its axes
+
+        Parameters
+        ----------
+        dimensions : list of 3 floats
+
+        Returns
+        -------
+        list of tuples
+            (path, name) of the parts
+
+        """
+        return self.connection.execute(
+            "SELECT path, name FROM parts WHERE dimension_0 <= ? "
+            "AND dimension_1 <= ? AND dimension_2 <= ? ORDER BY path",
+            sorted(dimensions)).fetchall()
+
+    def parts_with_anchor_count(self, minimum, maximum=None):
+        r"""Parts with a number of anchors in [minimum, maximum]
+
+        Returns
+        -------
+        list of tuples
+            (path, name) of the parts
+
+        """
+        if maximum is None:
+            return self.connection.execute(
+                "SELECT path, name FROM parts WHERE anchor_count >= ? "
+                "ORDER BY path", (minimum,)).fetchall()
+        return self.connection.execute(
+            "SELECT path, name FROM parts WHERE anchor_count BETWEEN ? AND ? "
+            "ORDER BY path", (minimum, maximum)).fetchall()
+
+    def duplicates(self):
+        r"""Groups of parts with the same geometry (geometric fingerprint),
+        saved under different names or placements
+
+        Returns
+        -------
+        list of lists of str
+            Paths of the parts of each group, largest groups first
+
+        """
+        groups = {}
+        for geometry, path in self.connection.execute(
+                "SELECT geometry, path FROM parts WHERE geometry IN "
+                "(SELECT geometry FROM parts WHERE geometry IS NOT NULL "
+                "GROUP BY geometry HAVING COUNT(*) > 1) ORDER BY path"):
+            groups.setdefault(geometry, []).append(path)
+        return sorted(groups.values(), key=lambda paths: -len(paths))
@@ -19,11 +19,10 @@
 
 r"""Anchor Add Command"""
 
-from os.path import join, dirname
-
 import FreeCAD as App
 
 from freecad_logging import debug, error
+from lazy_commands import resources
 from anchor import Anchor, ViewProviderAnchor
 from puv import puv
 
@@ -99,13 +98,7 @@ class CommandAnchorAdd:
 
     def GetResources(self):
         r"""Resources for command integration in the UI"""
-        icon = join(dirname(__file__),
-                    "resources",
-                    "freecad_workbench_anchors_add_anchor.svg")
-        return {"MenuText": "Add anchor",
-                "Accel": "Alt+C",
-                "ToolTip": "Add an anchor to a part",
-                "Pixmap": icon}
+        return resources("AnchorAdd")
 
     def IsActive(self):
         r"""Determines if the command is active or inactive (greyed out)
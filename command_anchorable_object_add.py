@@ -19,11 +19,10 @@
 
 r"""Anchor Add Command"""
 
-from os.path import join, dirname
-
 import FreeCAD as App
 
 from freecad_logging import info, error, debug
+from lazy_commands import resources
 from anchorable_object import make_anchorable_object_feature
 
 if App.GuiUp:
@@ -56,8 +55,7 @@ class CommandAnchorableObjectAdd:
                 raise Exception("Select one shape to make it anchorable")
             try:
                 App.ActiveDocument.openTransaction("Anchorable Object")
-                obj = make_anchorable_object_feature()
-                obj.Base = sel[0].Object
+                obj = make_anchorable_object_feature(sel[0].Object)
                 obj.Base.ViewObject.hide()
                 obj.Proxy.execute(obj)
             finally:
@@ -72,13 +70,7 @@ class CommandAnchorableObjectAdd:
 
     def GetResources(self):
         r"""Icon, text and shortcut for CommandAnchorableObjectAdd"""
-        icon = join(dirname(__file__),
-                    "resources",
-                    "freecad_workbench_anchors_add_anchorable_object.svg")
-        return {"MenuText": "Add anchorable object",
-                "Accel": "Alt+P",
-                "ToolTip": "Make a part anchorable",
-                "Pixmap": icon}
+        return resources("AnchorableObjectAdd")
 
     def IsActive(self):
         r"""Determines if the command is active or inactive (greyed out)
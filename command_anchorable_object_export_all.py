@@ -0,0 +1,84 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Anchorable objects bulk export"""
+
+import FreeCAD as App
+from PySide import QtGui
+
+from freecad_logging import error, info
+from lazy_commands import resources
+from stepzip_export import exportable_objects, export_stepzips
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Exporting anchorable objects requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+class CommandAnchorableObjectExportAll:
+    r"""Anchorable objects bulk export command
+
+    Command to write all the anchorable objects of the selected groups
+    (or of the document if nothing is selected) to stepzip files
+
+    """
+
+    def __init__(self):
+        pass
+
+    def Activated(self):
+        r"""The Export anchorable objects Command was activated"""
+        selection = Gui.Selection.getSelection()
+        objects = selection if len(selection) > 0 \
+            else App.ActiveDocument.Objects
+        features = exportable_objects(objects)
+
+        if len(features) == 0:
+            error("Anchors : No anchorable object to export")
+            return
+
+        directory = QtGui.QFileDialog.getExistingDirectory()
+        if directory == "":
+            return
+
+        def progress(done, total, path, exception):
+            if exception is None:
+                info("Exported %s (%i/%i)" % (path, done, total))
+
+        written = export_stepzips(features, directory, progress=progress)
+        info("%i anchorable objects exported to %s" % (len(written),
+                                                       directory))
+
+    def GetResources(self):
+        r"""Resources for command integration in the UI"""
+        return resources("AnchorableObjectExportAll")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        if App.ActiveDocument is None:
+            return False
+        else:
+            return True
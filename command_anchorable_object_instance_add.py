@@ -0,0 +1,77 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Anchorable object instance Add Command"""
+
+import FreeCAD as App
+
+from freecad_logging import debug, error
+from lazy_commands import resources
+from anchorable_object import make_anchorable_object_instance
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Adding an instance requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+class CommandAnchorableObjectInstanceAdd:
+    r"""Command to add an instance of an anchorable object
+
+    The instance shares the shape and the anchors of the selected
+    anchorable object, so that a part used many times in an assembly
+    is only stored and recomputed once.
+
+    """
+
+    def __init__(self):
+        pass
+
+    def Activated(self):
+        r"""The command has been clicked"""
+        debug("CommandAnchorableObjectInstanceAdd, Activated")
+
+        selection = Gui.Selection.getSelection()
+
+        if len(selection) != 1 or not hasattr(selection[0], "Anchors"):
+            error("Anchors : Select only 1 anchorable object to instantiate")
+            return
+
+        try:
+            App.ActiveDocument.openTransaction("Anchorable Object Instance")
+            make_anchorable_object_instance(selection[0])
+        finally:
+            App.ActiveDocument.commitTransaction()
+
+    def GetResources(self):
+        r"""Icon, text and shortcut for CommandAnchorableObjectInstanceAdd"""
+        return resources("AnchorableObjectInstanceAdd")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        if App.ActiveDocument is None:
+            return False
+        else:
+            return True
@@ -19,12 +19,12 @@
 
 r"""Anchorable object open Command"""
 
-from os.path import join, dirname
-
 import FreeCAD as App
 from PySide import QtGui
 
-from freecad_logging import debug, error
+from freecad_logging import error, info
+from lazy_commands import resources
+from stepzip_shape import import_stepzips, open_stepzip
 
 if App.GuiUp:
     import FreeCADGui as Gui
@@ -33,10 +33,38 @@ else:
     error(msg_no_ui)
 
 
+def open_stepzips(paths):
+    r"""Open stepzip files in the active document
+
+    Parameters
+    ----------
+    paths : list of str
+
+    """
+    if len(paths) == 0:
+        return
+
+    def progress(done, total, path, exception):
+        if exception is None:
+            info("Opened %s (%i/%i)" % (path, done, total))
+
+    try:
+        App.ActiveDocument.openTransaction("Open anchorable objects")
+        if len(paths) == 1:
+            open_stepzip(paths[0])
+        else:
+            import_stepzips(paths, progress=progress)
+    except Exception as err:
+        error("Could not open the stepzips : %s" % str(err))
+    finally:
+        App.ActiveDocument.commitTransaction()
+    App.ActiveDocument.recompute()
+
+
 class CommandAnchorableObjectOpen:
     r"""Anchorable object open command
 
-    Command to open an anchorable object from a stepzip format
+    Command to open anchorable objects from stepzip files
 
     """
 
@@ -44,25 +72,21 @@ class CommandAnchorableObjectOpen:
         pass
 
     def Activated(self):
-        r"""The Open anchorable object Command was activated"""
-        dialog = QtGui.QFileDialog.getOpenFileName(
-            filter="Stepzip files (*.stepzip)")
-        # todo : open logic
-        #   unzip
-        #   open the step
-        #   make it an anchorable object
-        #   add the anchors to the anchorable object
-        debug("Will open %s" % str(dialog))
+        r"""The Open anchorable object Command was activated
+
+        A single stepzip is opened lazily: the anchors are read at once,
+        the geometry is loaded when the object is shown or its shape is
+        needed. Many stepzips are opened with their STEP translations
+        running in parallel.
+
+        """
+        paths = QtGui.QFileDialog.getOpenFileNames(
+            filter="Stepzip files (*.stepzip)")[0]
+        open_stepzips(paths)
 
     def GetResources(self):
         r"""Resources for command integration in the UI"""
-        icon = join(dirname(__file__),
-                    "resources",
-                    "freecad_workbench_anchors_open.png")
-        return {"MenuText": "Open anchorable object",
-                "Accel": "Ctrl+O",
-                "ToolTip": "Open an anchorable object",
-                "Pixmap": icon}
+        return resources("AnchorableObjectOpen")
 
     def IsActive(self):
         r"""Determines if the command is active or inactive (greyed out)
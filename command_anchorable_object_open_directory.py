@@ -0,0 +1,73 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Anchorable objects directory open Command"""
+
+import FreeCAD as App
+from PySide import QtGui
+
+from command_anchorable_object_open import open_stepzips
+from freecad_logging import error, info
+from lazy_commands import resources
+from stepzip import stepzip_paths
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Opening anchorable objects requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+class CommandAnchorableObjectOpenDirectory:
+    r"""Anchorable objects directory open command
+
+    Command to open all the stepzip files of a directory
+    (and of its subdirectories)
+
+    """
+
+    def __init__(self):
+        pass
+
+    def Activated(self):
+        r"""The Open directory Command was activated"""
+        directory = QtGui.QFileDialog.getExistingDirectory()
+        if directory == "":
+            return
+        paths = stepzip_paths([directory])
+        if len(paths) == 0:
+            info("No stepzip file in %s" % directory)
+            return
+        open_stepzips(paths)
+
+    def GetResources(self):
+        r"""Resources for command integration in the UI"""
+        return resources("AnchorableObjectOpenDirectory")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        if App.ActiveDocument is None:
+            return False
+        else:
+            return True
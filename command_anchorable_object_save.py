@@ -19,16 +19,19 @@
 
 r"""Anchorable object save"""
 
-from os import remove
-from os.path import join, dirname, splitext, basename
-import json
-import zipfile
+from concurrent.futures.process import BrokenProcessPool
+from os import remove, replace
+from os.path import basename, exists, splitext
 
 import FreeCAD as App
-from PySide import QtGui
+from PySide import QtCore, QtGui
 
 from anchorable_object import is_anchorable_object
-from freecad_logging import debug, error, info
+from freecad_logging import debug, error, info, warning
+from lazy_commands import resources
+from stepzip import saving_plan, content_hash, UP_TO_DATE, ANCHORS_ONLY
+from stepzip_export import snapshot, export_snapshot, rewrite_snapshot, \
+    saving_options, ExportProcess
 
 if App.GuiUp:
     import FreeCADGui as Gui
@@ -37,26 +40,111 @@ else:
     error(msg_no_ui)
 
 
-def create_stepzip(step_file, anchors_file):
-    r"""Procedure to create a zip file from a STEP file and an anchors file
+class BackgroundSave:
+    r"""Save of a snapshot to a stepzip in its own worker process
+
+    A non modal progress dialog lets the operator cancel the save: the
+    worker process is terminated.
+    The archive is written next to its final path and only renamed
+    once complete, so that a cancelled save leaves nothing behind.
+    A save of the anchors only (see stepzip.saving_plan) rewrites the
+    anchors of the existing archive the same way.
 
     Parameters
     ----------
-    step_file : str
-        Path to the STEP file
-    anchors_file : str
-        Path to the anchors file
+    brep : str
+        BREP string of the shape
+    content : dict
+        Anchors content
+    path : str
+        Path to the stepzip file
+    options : dict
+        Options of the stepzip writer
+    on_done : callable
+        Called with this BackgroundSave once it is over
+    anchors_only : bool
+        Only rewrite the anchors of the existing stepzip
 
     """
-    zf = zipfile.ZipFile("%s/%s.stepzip" % (dirname(step_file),
-                                            basename(splitext(step_file)[0])),
-                         "w",
-                         zipfile.ZIP_DEFLATED)
-    zf.write(step_file, basename(step_file))
-    zf.write(anchors_file, basename(anchors_file))
-    zf.close()
-    remove(step_file)
-    remove(anchors_file)
+    def __init__(self, brep, content, path, options, on_done,
+                 anchors_only=False):
+        self.brep = brep
+        self.content = content
+        self.options = options
+        self.anchors_only = anchors_only
+        self.path = path
+        self.partial_path = path + ".part"
+        self.name = basename(splitext(path)[0])
+        self.on_done = on_done
+        self.cancelled = False
+
+        # rewrite_snapshot writes the partial path itself
+        self.process = ExportProcess(brep,
+                                     content,
+                                     path if anchors_only
+                                     else self.partial_path,
+                                     self.name,
+                                     options,
+                                     anchors_only)
+
+        self.dialog = QtGui.QProgressDialog("Saving %s" % basename(path),
+                                            "Cancel", 0, 0)
+        self.dialog.setWindowTitle("Anchorable Object")
+        self.dialog.setMinimumDuration(500)
+        self.dialog.canceled.connect(self.cancel)
+
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.poll)
+        self.timer.start(100)
+
+    def cancel(self):
+        r"""Cancel the save, terminating its worker process"""
+        self.cancelled = True
+        self.process.terminate()
+
+    def poll(self):
+        r"""Check the worker, finalize the save once it is over"""
+        if not self.process.done():
+            # lets the dialog show itself after its minimum duration
+            self.dialog.setValue(0)
+            return
+
+        self.timer.stop()
+        self.dialog.reset()
+
+        exception = None if self.cancelled else self.process.exception()
+
+        if isinstance(exception, BrokenProcessPool):
+            warning("Worker process unavailable, saving on the main thread")
+            try:
+                if self.anchors_only:
+                    rewrite_snapshot(self.brep, self.content, self.path,
+                                     self.options)
+                else:
+                    export_snapshot(self.brep, self.content,
+                                    self.partial_path, self.name,
+                                    self.options)
+                exception = None
+            except Exception as err:
+                exception = err
+
+        if self.cancelled or exception is not None:
+            if exists(self.partial_path):
+                remove(self.partial_path)
+
+        if self.cancelled:
+            info("Save of %s cancelled" % self.path)
+        elif exception is not None:
+            error("Could not save %s : %s" % (self.path, exception))
+        elif self.anchors_only:
+            info("Anchors saved to %s" % self.path)
+        else:
+            replace(self.partial_path, self.path)
+            info("Anchorable object saved to %s" % self.path)
+            if self.options.get('reproducible', False):
+                info("Content hash : %s" % content_hash(self.path))
+
+        self.on_done(self)
 
 
 class CommandAnchorableObjectSave:
@@ -64,10 +152,14 @@ class CommandAnchorableObjectSave:
 
     Command to write an anchorable object to a stepzip format
 
+    Only a snapshot of the object is taken on the GUI thread,
+    the STEP translation and the compression run in the background.
+
     """
 
     def __init__(self):
-        pass
+        # keep the background saves alive until they are over
+        self.saves = []
 
     def Activated(self):
         r"""The Save anchorable object Command was activated"""
@@ -92,55 +184,36 @@ class CommandAnchorableObjectSave:
             if is_anchorable_object(selected_object):
                 dialog = QtGui.QFileDialog.getSaveFileName(
                     filter="Stepzip files (*.stepzip)")
-                #  save shape as step
                 stepzip_path = dialog[0]
-                stepfile = splitext(stepzip_path)[0] + ".stp"
-
-                # adaptation to json anchors + properties file format
-                # anchorsfile = splitext(stepzip_path)[0] + ".anchors"
-                anchorsfile = splitext(stepzip_path)[0] + ".json"
-
-                selected_object.Shape.exportStep(stepfile)
-                #  save anchors file (+ feature attachment)
+                if stepzip_path == "":
+                    return
 
                 # TODO : save more info about anchor (sub element link)
 
-                # anchors_descs = []
-                # for anchor in selected_object.Anchors:
-                #     anchors_descs.append("%s %f,%f,%f,%f,%f,%f,%f,%f,%f" %
-                #                          (anchor.Label,
-                #                           anchor.p[0], anchor.p[1], anchor.p[2],
-                #                           anchor.u[0], anchor.u[1], anchor.u[2],
-                #                           anchor.v[0], anchor.v[1], anchor.v[2]))
-                # with open(anchorsfile, 'w') as f:
-                #     f.write("\n".join(anchors_descs))
-
-                # adaptation to json anchors + properties file format
-                json_content = {'anchors': {}, 'properties': {}}
-                for anchor in selected_object.Anchors:
-                    json_content['anchors'][anchor.Label] = {
-                        'p': [anchor.p[0], anchor.p[1], anchor.p[2]],
-                        'u': [anchor.u[0], anchor.u[1], anchor.u[2]],
-                        'v': [anchor.v[0], anchor.v[1], anchor.v[2]]}
-
-                with open(anchorsfile, 'w') as fp:
-                    json.dump(json_content, fp, indent=4)
-
-                #  zip it to a stepzip
-                create_stepzip(stepfile, anchorsfile)
-                info("Anchorable object saved to %s" % dialog[0])
+                # The STEP and the anchors (json anchors + properties file
+                # format) are written straight into the stepzip entries,
+                # in the background
+                brep, content = snapshot(selected_object)
+                options = saving_options()
+
+                plan = saving_plan(stepzip_path,
+                                   content['properties']['fingerprint'],
+                                   options)
+                if plan == UP_TO_DATE:
+                    info("%s is up to date" % stepzip_path)
+                    return
+                self.saves.append(BackgroundSave(brep,
+                                                 content,
+                                                 stepzip_path,
+                                                 options,
+                                                 self.saves.remove,
+                                                 plan == ANCHORS_ONLY))
             else:
                 error("The object to save should be an anchorable object")
 
     def GetResources(self):
         r"""Resources for command integration in the UI"""
-        icon = join(dirname(__file__),
-                    "resources",
-                    "freecad_workbench_anchors_save.png")
-        return {"MenuText": "Save anchorable object",
-                "Accel": "Ctrl+S",
-                "ToolTip": "Save an anchorable object",
-                "Pixmap": icon}
+        return resources("AnchorableObjectSave")
 
     def IsActive(self):
         r"""Determines if the command is active or inactive (greyed out)
@@ -19,17 +19,25 @@
 
 r"""Assembly Add Command"""
 
-from os.path import join, dirname
-
 import FreeCAD as App
 
-from freecad_logging import info
+from freecad_logging import debug, error
+from lazy_commands import resources
+from assembly import make_assembly_feature
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Adding an assembly requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
 
 
 class CommandAssemblyAdd:
     r"""AssemblyAddCommand
 
-    Command to add an assembly to a Part
+    Command to add an assembly of the selected parts to a Document.
+    The parts may be anchorable objects, instances or assemblies
+    (that become subassemblies). The first selected part is grounded.
 
     """
 
@@ -37,17 +45,28 @@ class CommandAssemblyAdd:
         pass
 
     def Activated(self):
-        r""""""
-        info("This command will, in the future, add an assembly to a Document")
+        r"""The Add Assembly Command was activated"""
+        selection = Gui.Selection.getSelection()
+
+        debug("len selection = %i" % len(selection))
+
+        parts = [object_ for object_ in selection
+                 if hasattr(object_.Proxy, "local_anchors")]
+
+        if len(parts) == 0 or len(parts) != len(selection):
+            error("Anchors : Select the anchorable objects, instances "
+                  "or assemblies to assemble")
+            return
+
+        try:
+            App.ActiveDocument.openTransaction("Assembly")
+            make_assembly_feature(parts)
+        finally:
+            App.ActiveDocument.commitTransaction()
 
     def GetResources(self):
-        icon = join(dirname(__file__),
-                    "resources",
-                    "freecad_workbench_anchors_add_assembly.svg")
-        return {"MenuText": "Add assembly",
-                "Accel": "Alt+A",
-                "ToolTip": "Add an assembly to the document",
-                "Pixmap": icon}
+        r"""Resources for command integration in the UI"""
+        return resources("AssemblyAdd")
 
     def IsActive(self):
         r"""Determines if the command is active or inactive (greyed out)
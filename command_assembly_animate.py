@@ -0,0 +1,187 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Assembly Animate Command"""
+
+import time
+
+import numpy as np
+
+import FreeCAD as App
+from PySide import QtCore
+
+from anchor_math import interpolate_matrices
+from assembly import free_matrix, is_assembly, leaf_parts
+from freecad_logging import debug, error
+from lazy_commands import resources
+from placement_updates import stream_placements
+from placements import matrix_to_placement
+from preferences import parameters
+from transform_tree import placement_matrix
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Animating an assembly requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+def animation_frames(parts, duration, frame_rate, method="slerp"):
+    r"""Placements of the parts of an animation, from their free placements
+    to their current (mated) placements
+
+    All the frames are interpolated at once and converted to placements
+    before the animation starts.
+
+    Parameters
+    ----------
+    parts : list
+        Anchorable objects and instances
+    duration : float
+        In seconds
+    frame_rate : float
+        Frames per second
+    method : str
+        'slerp' or 'dual_quaternion' (see anchor_math.interpolate_matrices)
+
+    Returns
+    -------
+    list of lists of App.Placement
+        For each frame, the placements of the parts
+
+    """
+    n_frames = max(int(round(duration * frame_rate)), 1) + 1
+    # Smoothstep easing: the parts start and stop gently
+    t = np.linspace(0., 1., n_frames)
+    fractions = t * t * (3. - 2. * t)
+    frames = interpolate_matrices(np.array([free_matrix(part)
+                                            for part in parts]),
+                                  np.array([placement_matrix(part)
+                                            for part in parts]),
+                                  fractions,
+                                  method)
+    return [[matrix_to_placement(matrix) for matrix in frame]
+            for frame in frames]
+
+
+class AssemblyAnimation:
+    r"""Playback of precomputed frames, one frame per timer tick
+
+    The last frame is the placements the parts had when the animation
+    was created, so nothing is left to recompute once it is over.
+
+    Parameters
+    ----------
+    parts : list
+    frames : list of lists of App.Placement
+        see animation_frames
+    frame_rate : float
+    on_done : callable
+        Called with this AssemblyAnimation once it is over
+
+    """
+    def __init__(self, parts, frames, frame_rate, on_done):
+        self.parts = parts
+        self.frames = frames
+        self.on_done = on_done
+        self.index = 0
+        self.start = time.time()
+
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(int(1000. / frame_rate))
+
+    def tick(self):
+        r"""Show the next frame"""
+        stream_placements(self.parts, self.frames[self.index])
+        self.index += 1
+        if self.index == len(self.frames):
+            self.stop()
+
+    def stop(self):
+        r"""Jump to the last frame and stop"""
+        self.timer.stop()
+        if self.index < len(self.frames):
+            stream_placements(self.parts, self.frames[-1])
+        elapsed = time.time() - self.start
+        debug("Animation of %i parts : %i frames in %.2f s (%.1f fps)",
+              len(self.parts), self.index, elapsed,
+              self.index / elapsed if elapsed > 0. else 0.)
+        self.on_done(self)
+
+
+class CommandAssemblyAnimate:
+    r"""AssemblyAnimateCommand
+
+    Command to animate the selected assembly: its parts move from their
+    free placements (the placements of their bases) to their mated
+    placements. The duration, frame rate and interpolation method
+    ('slerp' or 'dual_quaternion') are the AnimationDuration,
+    AnimationFrameRate and AnimationInterpolation preferences.
+
+    """
+
+    def __init__(self):
+        self.animation = None
+
+    def Activated(self):
+        r"""The Animate Assembly Command was activated"""
+        selection = Gui.Selection.getSelection()
+
+        if len(selection) != 1 or not is_assembly(selection[0]):
+            error("Anchors : Select the assembly to animate")
+            return
+
+        if self.animation is not None:
+            self.animation.stop()
+
+        App.ActiveDocument.recompute()
+        parts = leaf_parts(selection[0])
+        frame_rate = parameters().GetFloat("AnimationFrameRate", 30.)
+        start = time.time()
+        frames = animation_frames(
+            parts,
+            parameters().GetFloat("AnimationDuration", 2.),
+            frame_rate,
+            parameters().GetString("AnimationInterpolation", "slerp"))
+        debug("Animation frames precomputed in %.1f ms",
+              (time.time() - start) * 1000.)
+
+        self.animation = AssemblyAnimation(parts, frames, frame_rate,
+                                           self.animation_done)
+
+    def animation_done(self, animation):
+        if self.animation is animation:
+            self.animation = None
+
+    def GetResources(self):
+        r"""Resources for command integration in the UI"""
+        return resources("AssemblyAnimate")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        if App.ActiveDocument is None:
+            return False
+        else:
+            return True
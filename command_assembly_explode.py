@@ -0,0 +1,76 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Assembly Explode Command"""
+
+import FreeCAD as App
+
+from assembly import is_assembly
+from freecad_logging import error
+from lazy_commands import resources
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Exploding an assembly requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+class CommandAssemblyExplode:
+    r"""AssemblyExplodeCommand
+
+    Command to toggle the selected assemblies between
+    their assembled and exploded states
+
+    """
+
+    def __init__(self):
+        pass
+
+    def Activated(self):
+        r"""The Explode Assembly Command was activated"""
+        assemblies = [object_ for object_ in Gui.Selection.getSelection()
+                      if is_assembly(object_)]
+
+        if len(assemblies) == 0:
+            error("Anchors : Select the assemblies to explode")
+            return
+
+        try:
+            App.ActiveDocument.openTransaction("Explode assembly")
+            for assembly in assemblies:
+                assembly.Exploded = not assembly.Exploded
+        finally:
+            App.ActiveDocument.commitTransaction()
+
+    def GetResources(self):
+        r"""Resources for command integration in the UI"""
+        return resources("AssemblyExplode")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        if App.ActiveDocument is None:
+            return False
+        else:
+            return True
@@ -0,0 +1,85 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Catalog scan Command"""
+
+from os import makedirs
+from os.path import join, isdir
+
+import FreeCAD as App
+from PySide import QtGui
+
+from catalog import Catalog
+from freecad_logging import error, info, warning
+from lazy_commands import resources
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Scanning a catalog requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+def catalog_path():
+    r"""Path to the catalog of the user, in the FreeCAD user data"""
+    directory = join(App.getUserAppDataDir(), "Anchors")
+    if not isdir(directory):
+        makedirs(directory)
+    return join(directory, "catalog.sqlite")
+
+
+class CommandCatalogScan:
+    r"""Catalog scan command
+
+    Command to index (or update the index of) the stepzips of a directory
+    tree in the catalog of the user (see catalog.Catalog)
+
+    """
+
+    def __init__(self):
+        pass
+
+    def Activated(self):
+        r"""The Catalog scan Command was activated"""
+        directory = QtGui.QFileDialog.getExistingDirectory()
+        if directory == "":
+            return
+        with Catalog(catalog_path()) as catalog:
+            stats = catalog.scan(directory)
+            duplicates = catalog.duplicates()
+        info("Catalog of %s : %i indexed, %i unchanged, %i removed, "
+             "%i failed", directory, stats['indexed'], stats['skipped'],
+             stats['removed'], stats['failed'])
+        for path, message in stats['errors']:
+            warning("Could not index %s : %s", path, message)
+        for paths in duplicates:
+            info("Same part : %s", ", ".join(paths))
+
+    def GetResources(self):
+        r"""Resources for command integration in the UI"""
+        return resources("CatalogScan")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        return True
@@ -0,0 +1,90 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Interference Check Command"""
+
+import FreeCAD as App
+
+from anchorable_object import ensure_shape
+from assembly import is_assembly, leaf_parts
+from freecad_logging import debug, error, info
+from lazy_commands import resources
+from interference import InterferenceChecker
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Checking interferences requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+class CommandInterferenceCheck:
+    r"""InterferenceCheckCommand
+
+    Command to find the overlapping parts of the selected assembly
+
+    The checker (and its cache of exact intersection results)
+    lives as long as the command.
+
+    """
+
+    def __init__(self):
+        self.checker = InterferenceChecker()
+
+    def Activated(self):
+        r"""The Interference Check Command was activated"""
+        selection = Gui.Selection.getSelection()
+
+        if len(selection) != 1 or not is_assembly(selection[0]):
+            error("Anchors : Select the assembly to check")
+            return
+
+        parts = leaf_parts(selection[0])
+        for part in parts:
+            ensure_shape(part)
+        interferences = self.checker.check(parts)
+        debug("Interference check : %i exact checks, %i cache hits",
+              self.checker.exact_checks, self.checker.cache_hits)
+
+        if len(interferences) == 0:
+            info("No interference in %s" % selection[0].Label)
+            return
+
+        Gui.Selection.clearSelection()
+        for part_a, part_b, volume in interferences:
+            info("Interference between %s and %s (volume : %f)" %
+                 (part_a.Label, part_b.Label, volume))
+            Gui.Selection.addSelection(part_a)
+            Gui.Selection.addSelection(part_b)
+
+    def GetResources(self):
+        r"""Resources for command integration in the UI"""
+        return resources("InterferenceCheck")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        if App.ActiveDocument is None:
+            return False
+        else:
+            return True
@@ -0,0 +1,207 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Mate Add Command"""
+
+import numpy as np
+
+import FreeCAD as App
+
+from freecad_logging import debug, error, info, warning
+from lazy_commands import resources
+from anchorable_object import anchors_descriptors, world_anchors
+from assembly import is_assembly, leaf_parts, make_mate_feature, \
+    mate_anchor
+from puv import puv
+
+if App.GuiUp:
+    import FreeCADGui as Gui
+else:
+    msg_no_ui = "Adding a mate requires the FreeCAD Gui to be up"
+    error(msg_no_ui)
+
+
+def anchor_at(part, element):
+    r"""Label of the anchor of a part at a sub element of its shape
+
+    This is how the anchors of instances (which have no Anchor features)
+    are selected.
+
+    Parameters
+    ----------
+    part : anchorable object or instance
+    element : face or circular edge of the shape of part
+
+    Returns
+    -------
+    str or None
+        None if no anchor of part has the origin and the axis (either way)
+        of the element
+
+    """
+    p, u, _ = puv(element)
+    p = np.array([p[0], p[1], p[2]])
+    u = np.array([u[0], u[1], u[2]])
+    tolerance = 1e-6 * max(part.Shape.BoundBox.DiagonalLength, 1.)
+    for label, (p_a, u_a, _) in sorted(world_anchors(part).items()):
+        if np.linalg.norm(p - p_a) <= tolerance \
+                and np.linalg.norm(np.cross(u, u_a)) <= 1e-6 \
+                * np.linalg.norm(u) * np.linalg.norm(u_a):
+            return label
+    return None
+
+
+def selected_anchors():
+    r"""Anchors of the selection, as (part, anchor label) tuples
+
+    An anchor is selected as an Anchor feature or, for the anchorable
+    objects and instances, as the sub element (face or circular edge)
+    of its shape it was defined on.
+
+    Returns
+    -------
+    list of tuples, None if a selected element is not an anchor
+
+    """
+    anchors = []
+    for selection in Gui.Selection.getSelectionEx():
+        object_ = selection.Object
+        if hasattr(object_, "parent"):
+            anchors.append((object_.parent, object_.Label))
+            continue
+        if not hasattr(getattr(object_, "Proxy", None), "local_anchors") \
+                or len(selection.SubObjects) == 0:
+            return None
+        for element in selection.SubObjects:
+            label = anchor_at(object_, element)
+            if label is None:
+                return None
+            anchors.append((object_, label))
+    return anchors
+
+
+def mating_assembly(anchors):
+    r"""Innermost assembly of the document to add the mate of 2 anchors to
+
+    Parameters
+    ----------
+    anchors : list of 2 (part, anchor label) tuples
+
+    Returns
+    -------
+    tuple
+        (assembly, [(part of the assembly, anchor label) x 2]),
+        None if the anchors are not in distinct parts of an assembly
+
+    """
+    candidates = []
+    for object_ in App.ActiveDocument.Objects:
+        if not is_assembly(object_):
+            continue
+        mated = [mate_anchor(object_, part, label) for part, label in anchors]
+        if None not in mated and mated[0][0] != mated[1][0]:
+            candidates.append((len(leaf_parts(object_)), object_.Name,
+                               object_, mated))
+    if len(candidates) == 0:
+        return None
+    _, _, assembly, mated = min(candidates, key=lambda c: c[:2])
+    return assembly, mated
+
+
+class CommandMateAdd:
+    r"""MateAddCommand
+
+    Command to mate 2 selected anchors: Anchor features, or the faces or
+    edges the anchors of instances are defined on.
+    The anchors must belong to parts of the same assembly (or of its
+    subassemblies, whose boundary anchors are then mated).
+    If their signatures differ, the anchors of each part with the
+    signature of the other anchor are suggested (from the anchor index
+    of the part, see anchor_descriptors.anchor_index).
+
+    """
+
+    def __init__(self):
+        pass
+
+    def Activated(self):
+        r"""The Add Mate Command was activated"""
+        anchors = selected_anchors()
+
+        debug("selected anchors = %s", anchors)
+
+        if anchors is None or len(anchors) != 2:
+            error("Anchors : Select the 2 anchors to mate")
+            return
+
+        found = mating_assembly(anchors)
+        if found is None:
+            error("Anchors : The parts of the anchors to mate "
+                  "should be in the same assembly")
+            return
+        assembly, ((part0, label0), (part1, label1)) = found
+
+        for part, label in ((part0, label0), (part1, label1)):
+            if label not in part.Proxy.local_anchors(part):
+                error("Anchors : %s is not an exposed anchor of %s",
+                      label, part.Label)
+                return
+
+        descriptors = [anchors_descriptors(part).get(label, {})
+                       for part, label in anchors]
+        signatures = [descriptor.get('signature', 0)
+                      for descriptor in descriptors]
+        if 0 not in signatures and signatures[0] != signatures[1]:
+            warning("Anchors : %s (%s, radius %g) and %s (%s, radius %g) "
+                    "do not look compatible",
+                    anchors[0][1], descriptors[0]['type'],
+                    descriptors[0]['radius'],
+                    anchors[1][1], descriptors[1]['type'],
+                    descriptors[1]['radius'])
+            # The anchors of the other part with the same signature
+            for i in range(2):
+                part = anchors[1 - i][0]
+                candidates = part.Proxy.anchor_index(part).get(signatures[i],
+                                                               [])
+                if len(candidates) > 0:
+                    info("Anchors : %s could be mated with %s of %s",
+                         anchors[i][1], ", ".join(candidates), part.Label)
+
+        try:
+            App.ActiveDocument.openTransaction("Mate")
+            make_mate_feature(assembly, part0, label0, part1, label1)
+        finally:
+            App.ActiveDocument.commitTransaction()
+        App.ActiveDocument.recompute()
+
+    def GetResources(self):
+        r"""Resources for command integration in the UI"""
+        return resources("MateAdd")
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        This method is called periodically, avoid calling other methods
+        that print to the console
+
+        """
+        if App.ActiveDocument is None:
+            return False
+        else:
+            return True
@@ -17,36 +17,438 @@
 # You should have received a copy of the GNU General Public License
 # along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
 
-r"""Utilities for the Anchors Workbench"""
+r"""Utilities for the Anchors Workbench
 
+Logging to the FreeCAD console, gated by a level: a message below the
+level of every sink costs one comparison, and is neither formatted nor
+timestamped. The arguments are %-style and only interpolated when the
+message is emitted, e.g. debug("Solving assembly %s", feature.Name).
+
+The level of the console is the LogLevel preference (DEBUG, INFO, WARNING
+or ERROR, INFO by default). An in-memory ring buffer of the last
+LogHistorySize messages (0, the default, to disable it) keeps a history
+down to the LogHistoryLevel preference (DEBUG by default) without writing
+to the console, see history().
+
+With the LogAsync preference, the messages are handed to an AsyncSink
+instead: a background thread writes them by batches to the console or,
+if the LogFile preference is set, to a rotating log file.
+
+"""
+
+import atexit
+from collections import deque
 from datetime import datetime
+import os
+import queue
+import threading
+import time
 
 import FreeCAD
 
+from preferences import parameters
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+_LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+# A record is a (time, level, message, arguments) tuple
+_console_level = INFO
+_async_sink = None
+_history = None
+_history_level = DEBUG
+# Lowest level of a message that is emitted somewhere
+_threshold = INFO
+
+
+def level_from_name(name, default=INFO):
+    r"""Level from its name (e.g. 'DEBUG'), default if unknown"""
+    return _LEVELS.get(name.strip().upper(), default)
+
+
+def _interpolate(msg, args):
+    if args:
+        try:
+            return msg % args
+        except (TypeError, ValueError) as e:
+            return "%s %r (formatting failed : %s)" % (msg, args, e)
+    return msg
+
+
+def _line(created, level, msg):
+    return "%s - %s - %s\n" % (
+        datetime.fromtimestamp(created).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+        LEVEL_NAMES[level],
+        msg)
+
+
+def format_record(record):
+    r"""Text of a record, as printed to the console
+
+    Parameters
+    ----------
+    record : tuple
+        (time, level, message, arguments)
+
+    Returns
+    -------
+    str
+
+    """
+    created, level, msg, args = record
+    return _line(created, level, _interpolate(msg, args))
+
+
+def _update_threshold():
+    global _threshold
+    _threshold = _console_level if _history is None \
+        else min(_console_level, _history_level)
+
+
+def set_level(level):
+    r"""Set the level of the console output
+
+    Parameters
+    ----------
+    level : int or str
+        DEBUG, INFO, WARNING or ERROR
+
+    """
+    global _console_level
+    if not isinstance(level, int):
+        level = level_from_name(level)
+    _console_level = level
+    _update_threshold()
+
+
+def get_level():
+    r"""Level of the console output"""
+    return _console_level
+
+
+def enable_history(size, level=DEBUG):
+    r"""Keep the last messages in memory
+
+    Parameters
+    ----------
+    size : int
+        Number of messages kept, the history is disabled if 0
+    level : int
+        Lowest level of the messages kept
+
+    """
+    global _history, _history_level
+    if size > 0:
+        _history = deque(_history or (), maxlen=size)
+    else:
+        _history = None
+    _history_level = level
+    _update_threshold()
+
+
+def history():
+    r"""Messages of the ring buffer, formatted, oldest first
+
+    Returns
+    -------
+    list of str
+
+    """
+    return [format_record(record) for record in (_history or ())]
+
+
+def _console_output(level, text):
+    if level >= ERROR:
+        FreeCAD.Console.PrintError(text)
+    elif level >= WARNING:
+        FreeCAD.Console.PrintWarning(text)
+    else:
+        FreeCAD.Console.PrintMessage(text)
 
-def _formatted_time():
-    return datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
 
+class ConsoleOutput:
+    r"""Output of an AsyncSink to the FreeCAD console"""
+    def write(self, level, text):
+        _console_output(level, text)
 
-def debug(msg):
+    def close(self):
+        pass
+
+
+class RotatingFile:
+    r"""Log file renamed to path.1 (path.1 to path.2 ...) once it
+    exceeds max_bytes, keeping backup_count old files
+
+    Parameters
+    ----------
+    path : str
+    max_bytes : int
+    backup_count : int
+
+    """
+    def __init__(self, path, max_bytes=1024 * 1024, backup_count=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = None
+
+    def write(self, level, text):
+        r"""Append lines to the file, rotating it when it is full"""
+        if self._file is None:
+            self._file = open(self.path, "a")
+        chunk = []
+        size = self._file.tell()
+        for line in text.splitlines(True):
+            if size > 0 and size + len(line) > self.max_bytes:
+                self._file.write("".join(chunk))
+                self._rotate()
+                chunk, size = [], 0
+            chunk.append(line)
+            size += len(line)
+        self._file.write("".join(chunk))
+        self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = "%s.%i" % (self.path, i)
+            if os.path.exists(source):
+                os.replace(source, "%s.%i" % (self.path, i + 1))
+        if self.backup_count > 0:
+            os.replace(self.path, "%s.1" % self.path)
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a")
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class AsyncSink:
+    r"""Queue of messages written by a background thread
+
+    The messages are interpolated by the caller (the arguments may be
+    document objects, not to be read from another thread); the timestamp
+    formatting and the output are done by the thread, by batches.
+
+    The queue is bounded: when it is full, the message is dropped and
+    counted, and the number of dropped messages is written with the next
+    batch. close() (called at exit) writes what is left in the queue.
+
+    Parameters
+    ----------
+    output : ConsoleOutput or RotatingFile or None
+        Its write(level, text) method is called from the thread, text
+        holding the lines of many messages of the same level.
+        ConsoleOutput if None
+    max_size : int
+        Maximum number of messages waiting in the queue
+    batch_size : int
+        Maximum number of messages per output call
+
+    """
+    def __init__(self, output=None, max_size=10000, batch_size=500):
+        self.output = output or ConsoleOutput()
+        self.batch_size = batch_size
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self._reported_dropped = 0
+        self._queue = queue.Queue(max_size)
+        self._thread = threading.Thread(target=self._run,
+                                        name="AnchorsLogSink")
+        self._thread.daemon = True
+        self._closed = False
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, created, level, msg):
+        r"""Queue a message, dropped if the queue is full
+
+        Returns
+        -------
+        bool
+            True if the message was queued
+
+        """
+        try:
+            self._queue.put_nowait((created, level, msg))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        dropped = self.dropped - self._reported_dropped
+        if dropped > 0:
+            self._reported_dropped += dropped
+            batch = batch + [(time.time(), WARNING,
+                              "%i log messages dropped (queue full)" %
+                              dropped)]
+        # One output call per run of messages of the same level
+        start = 0
+        for i in range(1, len(batch) + 1):
+            if i == len(batch) or batch[i][1] != batch[start][1]:
+                try:
+                    self.output.write(batch[start][1],
+                                      "".join(_line(*item)
+                                              for item in batch[start:i]))
+                except Exception as e:  # the thread must not die
+                    self.dropped += i - start
+                    self._reported_dropped += i - start
+                    FreeCAD.Console.PrintError(
+                        "Log sink output failed : %s\n" % e)
+                start = i
+        self.written += len(batch)
+        self.batches += 1
+
+    def flush(self):
+        r"""Wait until the queued messages are written"""
+        if not self._closed:
+            self._queue.join()
+
+    def close(self, timeout=5.):
+        r"""Write the queued messages and stop the thread"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # Stuck in its output, which would be stuck here too
+            return
+        # Whatever the thread did not write is written here
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                remaining.append(item)
+        if remaining or self.dropped > self._reported_dropped:
+            self._write(remaining)
+        self.output.close()
+
+
+def set_async_sink(sink):
+    r"""Send the console messages to an AsyncSink (None to print them
+    synchronously again), closing the previous sink
+
+    Parameters
+    ----------
+    sink : AsyncSink or None
+
+    """
+    global _async_sink
+    previous, _async_sink = _async_sink, sink
+    if previous is not None:
+        previous.close()
+
+
+def async_sink():
+    r"""The AsyncSink in use, or None"""
+    return _async_sink
+
+
+def log(level, msg, *args):
+    r"""Emit a message at a level"""
+    if level < _threshold:
+        return
+    record = (time.time(), level, msg, args)
+    if _history is not None and level >= _history_level:
+        _history.append(record)
+    if level >= _console_level:
+        if _async_sink is not None:
+            _async_sink.put(record[0], level, _interpolate(msg, args))
+        else:
+            _console_output(level, format_record(record))
+
+
+def debug(msg, *args):
     r"""Print a debug message"""
-    msg = "%s - DEBUG - %s\n" % (_formatted_time(), msg)
-    FreeCAD.Console.PrintMessage(msg)
+    if DEBUG < _threshold:
+        return
+    log(DEBUG, msg, *args)
 
 
-def info(msg):
+def info(msg, *args):
     r"""Print an info message"""
-    msg = "%s - INFO - %s\n" % (_formatted_time(), msg)
-    FreeCAD.Console.PrintMessage(msg)
+    if INFO < _threshold:
+        return
+    log(INFO, msg, *args)
 
 
-def warning(msg):
+def warning(msg, *args):
     r"""Print a warning message"""
-    msg = "%s - WARNING - %s\n" % (_formatted_time(), msg)
-    FreeCAD.Console.PrintWarning(msg)
+    log(WARNING, msg, *args)
 
 
-def error(msg):
+def error(msg, *args):
     r"""Print an error message"""
-    msg = "%s - ERROR - %s\n" % (_formatted_time(), msg)
-    FreeCAD.Console.PrintError(msg)
+    log(ERROR, msg, *args)
+
+
+def configure():
+    r"""Read the level, the history size and the asynchronous output
+    from the preferences
+
+    LogAsync (False by default) enables the AsyncSink, with at most
+    LogQueueSize (10000) queued messages. Its output is the console, or
+    the LogFile if set, rotated at LogFileMaxSize kB (1024) with
+    LogFileBackups (3) old files.
+
+    """
+    parameters_ = parameters()
+    set_level(parameters_.GetString("LogLevel", "INFO"))
+    enable_history(parameters_.GetInt("LogHistorySize", 0),
+                   level_from_name(parameters_.GetString("LogHistoryLevel",
+                                                         "DEBUG"),
+                                   DEBUG))
+    if parameters_.GetBool("LogAsync", False):
+        path = parameters_.GetString("LogFile", "")
+        output = None
+        if path != "":
+            output = RotatingFile(
+                path,
+                parameters_.GetInt("LogFileMaxSize", 1024) * 1024,
+                parameters_.GetInt("LogFileBackups", 3))
+        set_async_sink(AsyncSink(output,
+                                 parameters_.GetInt("LogQueueSize", 10000)))
+    else:
+        set_async_sink(None)
+
+
+configure()
@@ -0,0 +1,256 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Placement-invariant geometric fingerprint of anchorable objects
+
+The same part is often saved many times under different names (and at
+different placements). The geometric fingerprint of a part only depends
+on its geometry and on its anchors, not on its placement: it combines
+- the volume and the area of the shape
+- the eigenvalues of the matrix of inertia of the shape (about its center
+  of mass)
+- the sorted signatures of the anchors: distance of the anchor to the
+  center of mass, projections of its axes on that direction and signature
+  of its descriptor (see anchor_descriptors)
+
+all quantized relative to the size of the part.
+
+The canonical frame of a part (center of mass and principal axes of
+inertia, the signs of the axes being fixed by the anchors) is stored
+alongside the fingerprint, if the anchors define it: the transformation
+between the canonical frames of two parts with the same fingerprint
+places one onto the other.
+
+"""
+
+import hashlib
+import json
+
+import numpy as np
+
+# Relative tolerance of the quantization of the fingerprint quantities
+TOLERANCE = 1e-6
+
+
+def mass_properties(shape):
+    r"""Volume, area, center of mass and matrix of inertia (about the center
+    of mass, unit density) of a shape, combining its solids
+
+    Parameters
+    ----------
+    shape : Part.Shape
+
+    Returns
+    -------
+    tuple
+        (volume, area, center of mass (3,), matrix of inertia (3, 3))
+
+    """
+    solids = shape.Solids
+    volumes = np.array([solid.Volume for solid in solids])
+    volume = float(volumes.sum())
+    if volume <= 0.:
+        center = shape.BoundBox.Center
+        return 0., float(shape.Area), np.array([center.x,
+                                                center.y,
+                                                center.z]), np.zeros((3, 3))
+
+    centers = np.array([[solid.CenterOfMass.x,
+                         solid.CenterOfMass.y,
+                         solid.CenterOfMass.z] for solid in solids])
+    center = volumes.dot(centers) / volume
+    inertia = np.zeros((3, 3))
+    for solid, solid_volume, solid_center in zip(solids, volumes, centers):
+        m = solid.MatrixOfInertia
+        inertia += np.array([[m.A11, m.A12, m.A13],
+                             [m.A21, m.A22, m.A23],
+                             [m.A31, m.A32, m.A33]])
+        # Parallel axis theorem
+        d = solid_center - center
+        inertia += solid_volume * (d.dot(d) * np.eye(3) - np.outer(d, d))
+    return volume, float(shape.Area), center, inertia
+
+
+def _length_scale(area):
+    return np.sqrt(area) if area > 0. else 1.
+
+
+def _quantize(value, scale):
+    return int(round(value / (TOLERANCE * scale)))
+
+
+def _anchor_signature(center, anchor, scale):
+    d = np.asarray(anchor['p'], dtype=float) - center
+    return (_quantize(np.linalg.norm(d), scale),
+            _quantize(np.dot(anchor['u'], d), scale),
+            _quantize(np.dot(anchor['v'], d), scale),
+            anchor.get('descriptor', {}).get('signature', 0))
+
+
+def anchor_signatures(center, anchors, scale):
+    r"""Placement-invariant, sorted, signatures of anchors
+
+    Parameters
+    ----------
+    center : (3,) array
+        Center of mass of the shape
+    anchors : dict
+        {label: {'p': [x, y, z], 'u': [x, y, z], 'v': [x, y, z]}}
+    scale : float
+        Length scale of the shape
+
+    Returns
+    -------
+    list of tuples of int
+
+    """
+    return sorted(_anchor_signature(center, anchor, scale)
+                  for anchor in anchors.values())
+
+
+def _orthonormalize(vectors, basis, tolerance):
+    r"""Orthonormal vectors of the span of basis, taken in priority along
+    the projections of vectors (in order) on that span
+
+    Returns
+    -------
+    tuple
+        (orthonormal vectors as columns, number of them taken from vectors)
+
+    """
+    found = []
+    from_vectors = 0
+    candidates = [basis.dot(basis.T.dot(v)) for v in vectors]
+    for k, w in enumerate(candidates + list(basis.T)):
+        for a in found:
+            w = w - a.dot(w) * a
+        norm = np.linalg.norm(w)
+        if norm > tolerance:
+            found.append(w / norm)
+            if k < len(candidates):
+                from_vectors += 1
+        if len(found) == basis.shape[1]:
+            break
+    return np.array(found).T, from_vectors
+
+
+def _axis_sign(axis, points, directions, scale):
+    r"""Sign orienting an axis, 0 if the anchors cannot tell
+
+    The sign is that of the sum of the cubes of the projections of the
+    anchors origins on the axis or, if it vanishes, of the sum of the
+    projections of the anchors axes: both are odd in the axis and
+    independent of the order of the anchors.
+
+    """
+    moment = sum(point.dot(axis) ** 3 for point in points)
+    if abs(moment) > TOLERANCE * scale ** 3 * max(len(points), 1):
+        return 1. if moment > 0. else -1.
+    projection = sum(direction.dot(axis) for direction in directions)
+    if abs(projection) > TOLERANCE * max(len(directions), 1):
+        return 1. if projection > 0. else -1.
+    return 0.
+
+
+def canonical_frame(center, inertia, anchors, scale=1.):
+    r"""Frame of the center of mass and of the principal axes of inertia
+
+    The axes are sorted by increasing moment of inertia. Where moments are
+    equal (symmetric parts), the axes are taken along the anchors with a
+    unique signature, in the order of their signatures. The first two
+    axes are oriented by the anchors (see _axis_sign), the third axis
+    completes a direct frame.
+
+    The principal axes only being defined up to their signs, the frame is
+    ambiguous if the anchors do not orient them (no anchors, anchors on
+    the principal planes, symmetric anchors ...): None is then returned,
+    and the part cannot be placed from its canonical frame.
+
+    Returns
+    -------
+    4x4 matrix (numpy array) or None
+
+    """
+    eigenvalues, axes = np.linalg.eigh(inertia)
+    signatures = [_anchor_signature(center, anchor, scale)
+                  for anchor in anchors.values()]
+    anchors_ = list(anchors.values())
+    points = [np.asarray(anchor['p'], dtype=float) - center
+              for anchor in anchors_]
+    directions = [np.asarray(anchor[name], dtype=float)
+                  for anchor in anchors_ for name in ('u', 'v')]
+    # Anchors told apart by their signatures, farthest first
+    unique = sorted((signature, i) for i, signature in enumerate(signatures)
+                    if signatures.count(signature) == 1)
+    unique_points = [points[i] for _, i in reversed(unique)]
+
+    equal = TOLERANCE * max(np.abs(eigenvalues).max(), 1.)
+    i = 0
+    while i < 3:
+        j = i + 1
+        while j < 3 and eigenvalues[j] - eigenvalues[i] <= equal:
+            j += 1
+        if j - i > 1:
+            axes[:, i:j], from_anchors = _orthonormalize(unique_points,
+                                                         axes[:, i:j],
+                                                         TOLERANCE * scale)
+            # The last axis of the subspace is then defined up to its sign
+            if from_anchors < j - i - 1:
+                return None
+        i = j
+
+    for i in range(2):
+        sign = _axis_sign(axes[:, i], points, directions, scale)
+        if sign == 0.:
+            return None
+        axes[:, i] *= sign
+    axes[:, 2] = np.cross(axes[:, 0], axes[:, 1])
+    frame = np.eye(4)
+    frame[:3, :3] = axes
+    frame[:3, 3] = center
+    return frame
+
+
+def geometric_fingerprint(shape, anchors):
+    r"""Placement-invariant fingerprint and canonical frame of a part
+
+    Parameters
+    ----------
+    shape : Part.Shape
+    anchors : dict
+        {label: {'p': [x, y, z], 'u': [x, y, z], 'v': [x, y, z]}}
+
+    Returns
+    -------
+    tuple
+        (sha1 hex digest, canonical frame as a 4x4 matrix or None if it
+        is ambiguous, see canonical_frame)
+
+    """
+    volume, area, center, inertia = mass_properties(shape)
+    scale = _length_scale(area)
+    eigenvalues = np.linalg.eigvalsh(inertia)
+    quantities = {'volume': _quantize(volume, scale ** 3),
+                  'area': _quantize(area, scale ** 2),
+                  'inertia': [_quantize(eigenvalue, scale ** 5)
+                              for eigenvalue in eigenvalues],
+                  'anchors': anchor_signatures(center, anchors, scale)}
+    digest = hashlib.sha1(json.dumps(quantities, sort_keys=True)
+                          .encode("utf-8")).hexdigest()
+    return digest, canonical_frame(center, inertia, anchors, scale)
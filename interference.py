@@ -0,0 +1,294 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Interference check between the parts of an assembly
+
+A bounding volume hierarchy (BVH) of the axis aligned bounding boxes
+of the parts prunes the candidate pairs in bulk. The exact (boolean)
+intersection is only computed for the few pairs whose bounding boxes
+overlap, and its result is cached.
+
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from freecad_logging import debug
+from transform_tree import placement_matrix
+
+
+def bounding_boxes(parts):
+    r"""Axis aligned bounding boxes of parts
+
+    Parameters
+    ----------
+    parts : list of FreeCAD objects with a Shape
+
+    Returns
+    -------
+    (N, 6) numpy array
+        xmin, ymin, zmin, xmax, ymax, zmax of each part
+
+    """
+    boxes = np.empty((len(parts), 6))
+    for i, part in enumerate(parts):
+        bb = part.Shape.BoundBox
+        boxes[i] = (bb.XMin, bb.YMin, bb.ZMin, bb.XMax, bb.YMax, bb.ZMax)
+    return boxes
+
+
+def _overlap(boxes_a, boxes_b, tolerance=0.):
+    r"""Element-wise overlap test of 2 arrays of boxes (broadcasting)"""
+    return np.all((boxes_a[..., :3] <= boxes_b[..., 3:] + tolerance)
+                  & (boxes_b[..., :3] <= boxes_a[..., 3:] + tolerance),
+                  axis=-1)
+
+
+class BoundingVolumeHierarchy:
+    r"""Bounding volume hierarchy of axis aligned bounding boxes
+
+    The tree is built by median split along the largest extent of the
+    box centers. Nodes are stored in flat arrays so that the traversal
+    tests a whole frontier of node pairs with a single numpy operation.
+
+    Parameters
+    ----------
+    boxes : (N, 6) numpy array
+        xmin, ymin, zmin, xmax, ymax, zmax of each box
+    leaf_size : int
+        Maximum number of boxes in a leaf
+
+    """
+    def __init__(self, boxes, leaf_size=8):
+        self.boxes = np.asarray(boxes, dtype=float)
+        self.leaf_size = leaf_size
+
+        n = len(self.boxes)
+        self.order = np.arange(n)
+        node_boxes, starts, ends, lefts, rights = [], [], [], [], []
+
+        centers = (self.boxes[:, :3] + self.boxes[:, 3:]) / 2
+        stack = [(0, n, -1, 0)] if n > 0 else []
+
+        while stack:
+            start, end, parent, side = stack.pop()
+            node = len(starts)
+            if parent >= 0:
+                (lefts if side == 0 else rights)[parent] = node
+
+            indices = self.order[start:end]
+            node_boxes.append(np.concatenate(
+                [self.boxes[indices, :3].min(axis=0),
+                 self.boxes[indices, 3:].max(axis=0)]))
+            starts.append(start)
+            ends.append(end)
+            lefts.append(-1)
+            rights.append(-1)
+
+            if end - start > leaf_size:
+                c = centers[indices]
+                axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+                middle = (end - start) // 2
+                partition = np.argpartition(c[:, axis], middle)
+                self.order[start:end] = indices[partition]
+                stack.append((start + middle, end, node, 1))
+                stack.append((start, start + middle, node, 0))
+
+        self.node_boxes = np.array(node_boxes).reshape(-1, 6)
+        self.starts = np.array(starts, dtype=int)
+        self.ends = np.array(ends, dtype=int)
+        self.lefts = np.array(lefts, dtype=int)
+        self.rights = np.array(rights, dtype=int)
+
+    def overlapping_pairs(self, tolerance=0.):
+        r"""Pairs of boxes that overlap
+
+        Parameters
+        ----------
+        tolerance : float
+            Boxes closer than the tolerance are considered overlapping
+
+        Returns
+        -------
+        (M, 2) numpy array of int
+            Indices (i < j) of the overlapping boxes
+
+        """
+        if len(self.node_boxes) == 0:
+            return np.empty((0, 2), dtype=int)
+
+        a = np.zeros(1, dtype=int)
+        b = np.zeros(1, dtype=int)
+        leaf_pairs = []
+
+        while len(a) > 0:
+            # Bulk pruning of the node pairs whose boxes do not overlap
+            keep = (a == b) | _overlap(self.node_boxes[a],
+                                       self.node_boxes[b],
+                                       tolerance)
+            a, b = a[keep], b[keep]
+
+            leaf_a = self.lefts[a] < 0
+            leaf_b = self.lefts[b] < 0
+            both_leaves = leaf_a & leaf_b
+            leaf_pairs.append(np.stack([a[both_leaves], b[both_leaves]],
+                                       axis=1))
+
+            # A node paired with itself: its children with themselves
+            # and with each other
+            same = (a == b) & ~both_leaves
+            s = a[same]
+            l_s, r_s = self.lefts[s], self.rights[s]
+
+            # 2 different nodes: split the one that is not a leaf
+            different = (a != b) & ~both_leaves
+            a_d, b_d = a[different], b[different]
+            split_a = self.lefts[a_d] >= 0
+            split_b = ~split_a
+            a_s, b_s = a_d[split_a], b_d[split_a]
+            a_k, b_k = a_d[split_b], b_d[split_b]
+
+            a = np.concatenate([l_s, r_s, l_s,
+                                self.lefts[a_s], self.rights[a_s],
+                                a_k, a_k])
+            b = np.concatenate([l_s, r_s, r_s,
+                                b_s, b_s,
+                                self.lefts[b_k], self.rights[b_k]])
+
+        pairs = []
+        for node_a, node_b in np.concatenate(leaf_pairs):
+            i = self.order[self.starts[node_a]:self.ends[node_a]]
+            j = self.order[self.starts[node_b]:self.ends[node_b]]
+            overlap = _overlap(self.boxes[i][:, None, :],
+                               self.boxes[j][None, :, :],
+                               tolerance)
+            ii, jj = np.nonzero(overlap)
+            candidates = np.stack([i[ii], j[jj]], axis=1)
+            if node_a == node_b:
+                candidates = candidates[candidates[:, 0] < candidates[:, 1]]
+            pairs.append(np.sort(candidates, axis=1))
+
+        if len(pairs) == 0:
+            return np.empty((0, 2), dtype=int)
+        return np.concatenate(pairs)
+
+
+def _geometry_id(part):
+    r"""Identifier of the geometry of a part (shared by instances)
+
+    Names are only unique within a document: the name of the document
+    is part of the identifier.
+
+    """
+    source = getattr(part, "Source", None) or part
+    return source.Document.Name, source.Name
+
+
+class InterferenceChecker:
+    r"""Interference checker with a cache of the exact intersection results
+
+    The results are cached per pair of parts, keyed on the geometries
+    of the parts and on their relative placement: moving 2 parts together
+    or checking other instances of the same parts at the same relative
+    placement does not compute the intersection again.
+    The results of a geometry are forgotten once its shape is no longer
+    the one they were computed with (e.g. after an edit), whatever
+    its placement.
+
+    Parameters
+    ----------
+    min_volume : float
+        Minimum volume of the common solid to report an interference
+
+    """
+    def __init__(self, min_volume=1e-6):
+        self.min_volume = min_volume
+        self._cache = {}
+        # Geometry id -> shape the cached results were computed with
+        self._shapes = {}
+        self.exact_checks = 0
+        self.cache_hits = 0
+
+    def clear(self):
+        r"""Forget the cached results"""
+        self._cache = {}
+        self._shapes = {}
+
+    def _check_shape(self, part):
+        r"""Forget the cached results of the geometry of part if its shape
+        changed since they were computed"""
+        geometry = _geometry_id(part)
+        shape = self._shapes.get(geometry)
+        if shape is not None and shape.isPartner(part.Shape):
+            return
+        if shape is not None:
+            self._cache = {key: volume for key, volume in self._cache.items()
+                           if geometry not in key[:2]}
+        self._shapes[geometry] = part.Shape
+
+    def _key(self, part_a, part_b, matrix_a, matrix_b):
+        relative = np.dot(np.linalg.inv(matrix_a), matrix_b)
+        return (_geometry_id(part_a),
+                _geometry_id(part_b),
+                tuple(np.round(relative, 9).ravel().tolist()))
+
+    def check(self, parts, tolerance=0.):
+        r"""Find the interfering parts
+
+        Parameters
+        ----------
+        parts : list of FreeCAD objects with a Shape
+        tolerance : float
+            Bounding boxes tolerance of the broad phase
+
+        Returns
+        -------
+        list of tuples
+            (part_a, part_b, volume of the common solid)
+
+        """
+        parts = [part for part in parts if not part.Shape.isNull()]
+        bvh = BoundingVolumeHierarchy(bounding_boxes(parts))
+        candidates = bvh.overlapping_pairs(tolerance)
+        debug("Interference check : %i candidate pairs out of %i parts",
+              len(candidates), len(parts))
+
+        matrices = {}
+        interferences = []
+        for i, j in candidates:
+            part_a, part_b = parts[i], parts[j]
+            for part in (part_a, part_b):
+                if (part.Document.Name, part.Name) not in matrices:
+                    self._check_shape(part)
+                    matrices[(part.Document.Name, part.Name)] = \
+                        placement_matrix(part)
+            key = self._key(part_a, part_b,
+                            matrices[(part_a.Document.Name, part_a.Name)],
+                            matrices[(part_b.Document.Name, part_b.Name)])
+            if key in self._cache:
+                self.cache_hits += 1
+                volume = self._cache[key]
+            else:
+                self.exact_checks += 1
+                volume = part_a.Shape.common(part_b.Shape).Volume
+                self._cache[key] = volume
+            if volume > self.min_volume:
+                interferences.append((part_a, part_b, volume))
+        return interferences
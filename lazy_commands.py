@@ -0,0 +1,188 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Commands of the Anchors Workbench, registered without importing them
+
+Importing the command modules pulls in NumPy, the transformations module,
+pivy and PySide. The workbench registers a LazyCommand per command
+instead: its resources (menu text, tooltip, shortcut, icon) are static,
+and the command module is only imported on the first activation of the
+command.
+
+"""
+
+from importlib import import_module
+from os.path import join, dirname
+import time
+
+import FreeCAD as App
+
+from freecad_logging import debug
+
+# name, module, class, needs an active document, resources
+# (the Pixmap being the file name of the icon in the resources directory)
+COMMANDS = [
+    ("AnchorableObjectOpen",
+     "command_anchorable_object_open", "CommandAnchorableObjectOpen", True,
+     {"MenuText": "Open anchorable object",
+      "Accel": "Ctrl+O",
+      "ToolTip": "Open one or many anchorable objects",
+      "Pixmap": "freecad_workbench_anchors_open.png"}),
+    ("AnchorableObjectOpenDirectory",
+     "command_anchorable_object_open_directory",
+     "CommandAnchorableObjectOpenDirectory", True,
+     {"MenuText": "Open a directory of anchorable objects",
+      "ToolTip": "Open all the anchorable objects of a directory",
+      "Pixmap": "freecad_workbench_anchors_open.png"}),
+    ("AnchorableObjectAdd",
+     "command_anchorable_object_add", "CommandAnchorableObjectAdd", True,
+     {"MenuText": "Add anchorable object",
+      "Accel": "Alt+P",
+      "ToolTip": "Make a part anchorable",
+      "Pixmap": "freecad_workbench_anchors_add_anchorable_object.svg"}),
+    ("AnchorableObjectInstanceAdd",
+     "command_anchorable_object_instance_add",
+     "CommandAnchorableObjectInstanceAdd", True,
+     {"MenuText": "Add anchorable object instance",
+      "Accel": "Alt+I",
+      "ToolTip": "Add an instance of an anchorable object",
+      "Pixmap": "freecad_workbench_anchors_add_anchorable_object.svg"}),
+    ("AnchorAdd",
+     "command_anchor_add", "CommandAnchorAdd", True,
+     {"MenuText": "Add anchor",
+      "Accel": "Alt+C",
+      "ToolTip": "Add an anchor to a part",
+      "Pixmap": "freecad_workbench_anchors_add_anchor.svg"}),
+    ("AnchorableObjectSave",
+     "command_anchorable_object_save", "CommandAnchorableObjectSave", True,
+     {"MenuText": "Save anchorable object",
+      "Accel": "Ctrl+S",
+      "ToolTip": "Save an anchorable object",
+      "Pixmap": "freecad_workbench_anchors_save.png"}),
+    ("AnchorableObjectExportAll",
+     "command_anchorable_object_export_all",
+     "CommandAnchorableObjectExportAll", True,
+     {"MenuText": "Export anchorable objects",
+      "ToolTip": "Save all the anchorable objects of the document "
+                 "or of the selected groups",
+      "Pixmap": "freecad_workbench_anchors_save.png"}),
+    ("AssemblyAdd",
+     "command_assembly_add", "CommandAssemblyAdd", True,
+     {"MenuText": "Add assembly",
+      "Accel": "Alt+A",
+      "ToolTip": "Add an assembly to the document",
+      "Pixmap": "freecad_workbench_anchors_add_assembly.svg"}),
+    ("MateAdd",
+     "command_mate_add", "CommandMateAdd", True,
+     {"MenuText": "Mate anchors",
+      "Accel": "Alt+M",
+      "ToolTip": "Mate 2 anchors of parts of an assembly",
+      "Pixmap": "freecad_workbench_anchors_anchor.svg"}),
+    ("AssemblyExplode",
+     "command_assembly_explode", "CommandAssemblyExplode", True,
+     {"MenuText": "Explode assembly",
+      "Accel": "Alt+E",
+      "ToolTip": "Toggle the exploded view of an assembly",
+      "Pixmap": "freecad_workbench_anchors_add_assembly.svg"}),
+    ("AssemblyAnimate",
+     "command_assembly_animate", "CommandAssemblyAnimate", True,
+     {"MenuText": "Animate assembly",
+      "Accel": "Alt+N",
+      "ToolTip": "Move the parts of an assembly from their free placements "
+                 "to their mated placements",
+      "Pixmap": "freecad_workbench_anchors_add_assembly.svg"}),
+    ("InterferenceCheck",
+     "command_interference_check", "CommandInterferenceCheck", True,
+     {"MenuText": "Check interferences",
+      "ToolTip": "Find the overlapping parts of an assembly",
+      "Pixmap": "default_icon.svg"}),
+    ("CatalogScan",
+     "command_catalog_scan", "CommandCatalogScan", False,
+     {"MenuText": "Scan a stepzip library",
+      "ToolTip": "Index the anchorable objects of a directory "
+                 "in the catalog",
+      "Pixmap": "default_icon.svg"}),
+]
+
+_COMMANDS = {entry[0]: entry for entry in COMMANDS}
+
+
+def resources(name):
+    r"""Resources of a command, for its GetResources method
+
+    Parameters
+    ----------
+    name : str
+        Name of the command, e.g. "AnchorAdd"
+
+    Returns
+    -------
+    dict
+
+    """
+    resources_ = dict(_COMMANDS[name][4])
+    resources_["Pixmap"] = join(dirname(__file__),
+                                "resources",
+                                resources_["Pixmap"])
+    return resources_
+
+
+class LazyCommand:
+    r"""Stand-in for a command, importing it on its first activation
+
+    Parameters
+    ----------
+    name : str
+        Name of the command, e.g. "AnchorAdd"
+
+    """
+    def __init__(self, name):
+        self.name = name
+        _, self.module_name, self.class_name, self.needs_document, _ = \
+            _COMMANDS[name]
+        self._command = None
+
+    def command(self):
+        r"""The actual command, created on the first call"""
+        if self._command is None:
+            start = time.time()
+            module = import_module(self.module_name)
+            self._command = getattr(module, self.class_name)()
+            debug("Loaded the %s command in %.1f ms",
+                  self.name, (time.time() - start) * 1000.)
+        return self._command
+
+    def Activated(self):
+        r"""Import the command, and activate it"""
+        self.command().Activated()
+
+    def GetResources(self):
+        r"""Static resources, the command is not imported"""
+        return resources(self.name)
+
+    def IsActive(self):
+        r"""Determines if the command is active or inactive (greyed out)
+
+        Until the command is imported, only the presence of an active
+        document (for the commands that need one) is checked
+
+        """
+        if self._command is not None:
+            return self._command.IsActive()
+        return not self.needs_document or App.ActiveDocument is not None
@@ -0,0 +1,248 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Bulk placement updates
+
+Writing placements one object at a time lets FreeCAD recompute and Coin
+redraw after every write. apply_placements writes all the placements
+(and the anchors of the moved anchorable objects) with the recomputes and
+the scene graph notifications suspended, then recomputes and redraws once.
+
+The feature proxies report their property change notifications with
+record_notification, so that the cost of a bulk update can be measured.
+
+"""
+
+from contextlib import contextmanager
+
+import numpy as np
+
+import FreeCAD as App
+
+from freecad_logging import debug
+from placements import matrix_to_placement, transform_frame
+from transform_tree import ROOT, object_transforms, placement_matrix
+
+
+class BulkUpdateStats:
+    r"""Counters of a bulk placement update"""
+    def __init__(self):
+        self.placements = 0
+        self.anchors = 0
+        self.notifications = 0
+        self.recomputes = 0
+        self.redraws = 0
+
+    def __str__(self):
+        return "%i placements, %i anchors, %i notifications, " \
+               "%i recomputes, %i redraws" % (self.placements,
+                                               self.anchors,
+                                               self.notifications,
+                                               self.recomputes,
+                                               self.redraws)
+
+
+# Statistics of the bulk update in progress (None outside of a bulk update)
+_current = None
+
+# Statistics of the last completed bulk update
+last_stats = None
+
+# True while stream_placements writes a frame of an animation
+_streaming = False
+
+
+def record_notification():
+    r"""Count a property change notification, if a bulk update is
+    in progress"""
+    if _current is not None:
+        _current.notifications += 1
+
+
+def placements_streaming():
+    r"""Is stream_placements writing a frame?
+
+    The anchors are not moved while the placements are streamed: the
+    proxies must keep their cached local anchors frames.
+
+    """
+    return _streaming
+
+
+@contextmanager
+def scene_notifications_suspended():
+    r"""Suspend the notifications of the scene graph of the active view
+
+    Yields True if the notifications were actually suspended.
+    The scene is redrawn once, when leaving the context.
+
+    """
+    root = None
+    if App.GuiUp:
+        import FreeCADGui as Gui
+        if Gui.ActiveDocument is not None:
+            view = Gui.ActiveDocument.ActiveView
+            if hasattr(view, "getSceneGraph"):
+                root = view.getSceneGraph()
+
+    enabled = root.enableNotify(False) if root is not None else None
+    try:
+        yield root is not None
+    finally:
+        if root is not None:
+            root.enableNotify(enabled)
+            root.touch()
+
+
+def write_placement(part, matrix, stats=None):
+    r"""Move a part (and its anchors) to a new placement
+
+    Parameters
+    ----------
+    part : anchorable object, instance or assembly
+    matrix : 4x4 matrix (numpy array)
+    stats : BulkUpdateStats or None
+
+    Returns
+    -------
+    bool
+        False if the part already was at the requested placement
+
+    """
+    current = placement_matrix(part)
+    if np.allclose(current, matrix, atol=1e-9):
+        return False
+
+    # The shape and the anchors are moved right away: no need to recompute
+    # the part if nothing else changed
+    was_touched = "Touched" in part.State
+
+    delta = np.dot(matrix, np.linalg.inv(current))
+    part.Placement = matrix_to_placement(matrix)
+    transforms = object_transforms(part)
+    if transforms is not None:
+        # The matrix is known: no need to convert the placement back
+        transforms.set_local(ROOT, matrix)
+
+    anchors = getattr(part, "Anchors", [])
+    for anchor in anchors:
+        p, u, v = transform_frame(delta, anchor.p, anchor.u, anchor.v)
+        anchor.p = App.Vector(*p)
+        anchor.u = App.Vector(*u)
+        anchor.v = App.Vector(*v)
+        anchor.purgeTouched()
+
+    if not was_touched:
+        part.purgeTouched()
+
+    if stats is not None:
+        stats.placements += 1
+        stats.anchors += len(anchors)
+    return True
+
+
+def stream_placements(parts, placements):
+    r"""Write a frame of an animation: the placements only
+
+    The anchors are not moved and nothing is recomputed: the animation
+    must end with the placements the parts had when it started
+    (or be followed by apply_placements). The cached local anchors
+    frames are kept meanwhile (see placements_streaming).
+
+    Parameters
+    ----------
+    parts : list
+    placements : list of App.Placement
+        Precomputed placements, one per part
+
+    """
+    global _streaming
+
+    _streaming = True
+    try:
+        with scene_notifications_suspended():
+            for part, placement in zip(parts, placements):
+                was_touched = "Touched" in part.State
+                part.Placement = placement
+                if not was_touched:
+                    part.purgeTouched()
+    finally:
+        _streaming = False
+
+
+def apply_placements(updates, document=None, transaction=None,
+                     recompute=True):
+    r"""Write many placements at once
+
+    Parameters
+    ----------
+    updates : iterable of tuples
+        (part, 4x4 matrix)
+    document : App.Document or None
+        The document of the parts, the active document if None
+    transaction : str or None
+        Name of the (single) undo transaction, no transaction if None
+    recompute : bool
+        Recompute the document once all the placements are written.
+        Must be False when called from a recompute.
+
+    Returns
+    -------
+    BulkUpdateStats
+        The counters of this update. A bulk update started while another
+        one is in progress is merged into it.
+
+    """
+    global _current, last_stats
+
+    if _current is not None:
+        for part, matrix in updates:
+            write_placement(part, matrix, _current)
+        return _current
+
+    document = document or App.ActiveDocument
+    stats = BulkUpdateStats()
+    _current = stats
+
+    frozen = getattr(document, "RecomputesFrozen", None)
+    if frozen is not None:
+        document.RecomputesFrozen = True
+    if transaction is not None:
+        document.openTransaction(transaction)
+
+    try:
+        with scene_notifications_suspended() as suspended:
+            for part, matrix in updates:
+                write_placement(part, matrix, stats)
+    finally:
+        if transaction is not None:
+            document.commitTransaction()
+        if frozen is not None:
+            document.RecomputesFrozen = frozen
+        _current = None
+
+    if suspended:
+        stats.redraws += 1
+    if recompute:
+        document.recompute()
+        stats.recomputes += 1
+
+    last_stats = stats
+    debug("Bulk placement update : %s", stats)
+    return stats
@@ -0,0 +1,81 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Conversions between FreeCAD placements and 4x4 matrices (numpy arrays)"""
+
+import numpy as np
+
+import FreeCAD as App
+
+
+def placement_to_matrix(placement):
+    r"""Convert a FreeCAD Placement to a 4x4 matrix
+
+    Parameters
+    ----------
+    placement : App.Placement
+
+    Returns
+    -------
+    4x4 matrix (numpy array)
+
+    """
+    m = placement.toMatrix()
+    return np.array([[m.A11, m.A12, m.A13, m.A14],
+                     [m.A21, m.A22, m.A23, m.A24],
+                     [m.A31, m.A32, m.A33, m.A34],
+                     [m.A41, m.A42, m.A43, m.A44]])
+
+
+def matrix_to_placement(matrix):
+    r"""Convert a 4x4 rigid transformation matrix to a FreeCAD Placement
+
+    Parameters
+    ----------
+    matrix : 4x4 matrix (numpy array)
+
+    Returns
+    -------
+    App.Placement
+
+    """
+    return App.Placement(App.Matrix(*[float(x) for x in
+                                      np.asarray(matrix).ravel()]))
+
+
+def transform_frame(matrix, p, u, v):
+    r"""Apply a 4x4 rigid transformation matrix to an anchor frame
+
+    Parameters
+    ----------
+    matrix : 4x4 matrix (numpy array)
+    p : tuple or list or array
+        Origin of the anchor
+    u : tuple or list or array
+    v : tuple or list or array
+
+    Returns
+    -------
+    tuple of 3 numpy arrays (p, u, v)
+
+    """
+    rotation = matrix[:3, :3]
+    return (np.dot(rotation, [p[0], p[1], p[2]]) + matrix[:3, 3],
+            np.dot(rotation, [u[0], u[1], u[2]]),
+            np.dot(rotation, [v[0], v[1], v[2]]))
@@ -0,0 +1,29 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Preferences of the Anchors Workbench, stored in the FreeCAD parameters"""
+
+import FreeCAD as App
+
+PARAMETERS_PATH = "User parameter:BaseApp/Preferences/Mod/Anchors"
+
+
+def parameters():
+    r"""The parameter group of the Anchors Workbench"""
+    return App.ParamGet(PARAMETERS_PATH)
@@ -73,7 +73,7 @@ def puv(subselected_object):
         debug("It is a Wire")
     elif isinstance(subselected_object, Part.Edge):
         debug("It is an Edge")
-        debug('TYPE : %s' % type(subselected_object.Curve))
+        debug('TYPE : %s', type(subselected_object.Curve))
 
         if str(type(subselected_object.Curve)) == "<type 'Part.Circle'>":
             debug("it is a circle")
@@ -0,0 +1,743 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""stepzip archives
+
+A stepzip archive named <name>.stepzip contains:
+- <name>.stp : the STEP file of the shape
+- <name>.json : the anchors and the properties of the shape
+- optionally, for the parts with many anchors, the anchors in a binary
+  form instead of in the JSON entry (which then only holds the
+  properties, compactly written):
+  - <name>.npy : (N, 9) float64 array of the p, u, v of the anchors,
+    stored uncompressed so that it can be memory-mapped
+  - <name>.labels : the labels of the anchors (utf-8 JSON list), in the
+    order of the rows of the array
+  - <name>.descriptors.npy : (N,) structured array of the descriptors
+    of the anchors (see anchor_descriptors), in the same order
+
+The properties hold a fingerprint of the shape and of the anchors, and
+the options of the writer, so that saving an unchanged object again (with
+the same options) can be skipped, and saving an object whose anchors only
+changed only rewrites the anchors entry.
+
+The compression of the entries can be chosen (see COMPRESSIONS) to trade
+size for speed (local caches) or speed for size (distribution).
+
+In reproducible mode, identical content gives byte-identical archives:
+the JSON keys are sorted, the entries have fixed timestamps and
+attributes, and the time stamp and file name of the STEP header are
+normalized. The content_hash of such archives can then be used as a key
+by caches and artifact stores.
+
+"""
+
+from os import close, remove, replace, walk
+from os.path import exists, isdir, join, splitext, basename
+import hashlib
+import json
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+# Size of the chunks used to stream data into the archive entries
+CHUNK_SIZE = 1024 * 1024
+
+# Compression methods available in this Python, by name
+COMPRESSIONS = {"stored": zipfile.ZIP_STORED,
+                "deflated": zipfile.ZIP_DEFLATED}
+try:
+    import bz2  # noqa: F401
+    COMPRESSIONS["bzip2"] = zipfile.ZIP_BZIP2
+except ImportError:
+    pass
+try:
+    import lzma  # noqa: F401
+    COMPRESSIONS["lzma"] = zipfile.ZIP_LZMA
+except ImportError:
+    pass
+
+# Options of the StepzipWriter, as stored in the properties of the stepzips
+DEFAULT_OPTIONS = {'reproducible': False,
+                   'binary_anchors': False,
+                   'compression': "deflated",
+                   'compresslevel': None}
+
+# What saving an object to an existing stepzip requires (see saving_plan)
+UP_TO_DATE = "up to date"
+ANCHORS_ONLY = "anchors only"
+FULL = "full"
+
+# Timestamp of the entries of the reproducible archives (earliest zip date)
+REPRODUCIBLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+# Size of the beginning of a STEP file searched for the header section
+_STEP_HEADER_MAX_SIZE = 64 * 1024
+
+_STEP_FILE_NAME = re.compile(br"FILE_NAME\s*\(\s*'(?:[^']|'')*'\s*,"
+                             br"\s*'(?:[^']|'')*'")
+
+
+def normalized_step_header(header, name):
+    r"""STEP header with a fixed file name and time stamp
+
+    Parameters
+    ----------
+    header : bytes
+        Beginning of a STEP file
+    name : str
+        File name to put in the header
+
+    Returns
+    -------
+    bytes
+
+    """
+    file_name = ("FILE_NAME('%s','%04i-%02i-%02iT%02i:%02i:%02i'" %
+                 ((name,) + REPRODUCIBLE_DATE_TIME)).encode("utf-8")
+    return _STEP_FILE_NAME.sub(lambda _: file_name, header, count=1)
+
+
+class StepzipWriter:
+    r"""Writer of a stepzip archive
+
+    The anchors are serialized straight into their archive entry.
+    The STEP payload is streamed into its entry in chunks: as
+    Shape.exportStep() can only write to a path, it goes through a single
+    temporary file in the temporary directory, never next to the archive.
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    name : str or None
+        Name of the entries, derived from the path if None
+    reproducible : bool
+        Write a byte-identical archive for identical content
+    binary_anchors : bool
+        Write the anchors as binary arrays, not in the JSON entry
+    compression : str
+        Compression method of the entries, a key of COMPRESSIONS
+    compresslevel : int or None
+        Compression level (0-9 for deflated, 1-9 for bzip2),
+        the default level of the method if None
+
+    Examples
+    --------
+    >>> with StepzipWriter("part.stepzip") as writer:
+    ...     writer.write_step(shape)
+    ...     writer.write_anchors(anchors_content)
+
+    """
+    def __init__(self, path, name=None, reproducible=False,
+                 binary_anchors=False, compression="deflated",
+                 compresslevel=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown or unavailable compression : %s" %
+                             compression)
+        self.path = path
+        self.name = name or basename(splitext(path)[0])
+        self.options = {'reproducible': reproducible,
+                        'binary_anchors': binary_anchors,
+                        'compression': compression,
+                        'compresslevel': compresslevel}
+        self.reproducible = reproducible
+        self.binary_anchors = binary_anchors
+        self.compression = COMPRESSIONS[compression]
+        self.compresslevel = compresslevel
+        self._zf = zipfile.ZipFile(path, "w", self.compression)
+
+    def _entry(self, filename, compression=None):
+        r"""ZipInfo of a new entry"""
+        if self.reproducible:
+            info = zipfile.ZipInfo(filename, REPRODUCIBLE_DATE_TIME)
+            info.create_system = 3
+            info.external_attr = 0o644 << 16
+        else:
+            info = zipfile.ZipInfo(filename, time.localtime()[:6])
+        info.compress_type = self.compression if compression is None \
+            else compression
+        if self.compresslevel is not None \
+                and info.compress_type == self.compression:
+            if hasattr(zipfile.ZipInfo, "compress_level"):
+                info.compress_level = self.compresslevel
+            else:
+                info._compresslevel = self.compresslevel
+        return info
+
+    @property
+    def step_entry(self):
+        return "%s.stp" % self.name
+
+    @property
+    def anchors_entry(self):
+        return "%s.json" % self.name
+
+    @property
+    def anchors_array_entry(self):
+        return "%s.npy" % self.name
+
+    @property
+    def anchors_labels_entry(self):
+        return "%s.labels" % self.name
+
+    @property
+    def anchors_descriptors_entry(self):
+        return "%s.descriptors.npy" % self.name
+
+    def write_step(self, shape):
+        r"""Write the STEP entry
+
+        Parameters
+        ----------
+        shape : Part.Shape
+
+        """
+        handle, step_file = tempfile.mkstemp(suffix=".stp")
+        close(handle)
+        try:
+            shape.exportStep(step_file)
+            self.write_step_file(step_file)
+        finally:
+            remove(step_file)
+
+    def write_step_file(self, step_file):
+        r"""Stream an existing STEP file into the STEP entry"""
+        with open(step_file, "rb") as source, \
+                self._zf.open(self._entry(self.step_entry), "w") as entry:
+            if self.reproducible:
+                header = source.read(_STEP_HEADER_MAX_SIZE)
+                entry.write(normalized_step_header(header, self.step_entry))
+            shutil.copyfileobj(source, entry, CHUNK_SIZE)
+
+    def copy_entry(self, source, info):
+        r"""Copy an entry of another archive into this archive
+
+        The compressed bytes are copied as they are, with the CRC and the
+        sizes of the entry: nothing is decompressed nor compressed again.
+
+        Parameters
+        ----------
+        source : zipfile.ZipFile
+        info : zipfile.ZipInfo
+            The entry of source to copy
+
+        """
+        entry = self._entry(info.filename, info.compress_type)
+        # The sizes are known: no data descriptor after the data
+        entry.flag_bits = info.flag_bits & ~0x08
+        entry.CRC = info.CRC
+        entry.compress_size = info.compress_size
+        entry.file_size = info.file_size
+        with open(source.filename, "rb") as entry_in:
+            entry_in.seek(_entry_data_offset(entry_in, info))
+
+            # zipfile has no public API to write raw compressed bytes
+            zf = self._zf
+            with zf._lock:
+                zf._writecheck(entry)
+                zf._didModify = True
+                entry.header_offset = zf.fp.tell()
+                zf.fp.write(entry.FileHeader())
+                remaining = info.compress_size
+                while remaining > 0:
+                    chunk = entry_in.read(min(CHUNK_SIZE, remaining))
+                    if len(chunk) == 0:
+                        raise zipfile.BadZipFile("Truncated %s in %s" %
+                                                 (info.filename,
+                                                  source.filename))
+                    zf.fp.write(chunk)
+                    remaining -= len(chunk)
+                zf.filelist.append(entry)
+                zf.NameToInfo[entry.filename] = entry
+                zf.start_dir = zf.fp.tell()
+
+    def write_anchors(self, content):
+        r"""Write the anchors entry (or the properties entry and the binary
+        anchors entries)
+
+        The options of the writer are added to the properties.
+
+        Parameters
+        ----------
+        content : dict
+            {'anchors': {label: {'p': [...], 'u': [...], 'v': [...]}},
+             'properties': {...}}
+
+        """
+        properties = dict(content.get('properties', {}))
+        properties['writer_options'] = self.options
+        content = dict(content, properties=properties)
+        if not self.binary_anchors:
+            self._zf.writestr(self._entry(self.anchors_entry),
+                              json.dumps(content,
+                                         indent=4,
+                                         sort_keys=self.reproducible)
+                              .encode("utf-8"))
+            return
+
+        self._zf.writestr(self._entry(self.anchors_entry),
+                          json.dumps({key: value
+                                      for key, value in content.items()
+                                      if key != 'anchors'},
+                                     separators=(',', ':'),
+                                     sort_keys=self.reproducible)
+                          .encode("utf-8"))
+        labels, array = anchors_array(content['anchors'])
+        # Not one per line: a label may contain any character
+        self._zf.writestr(self._entry(self.anchors_labels_entry),
+                          json.dumps(labels, separators=(',', ':'))
+                          .encode("utf-8"))
+        with self._zf.open(self._entry(self.anchors_array_entry,
+                                       zipfile.ZIP_STORED),
+                           "w") as entry:
+            np.lib.format.write_array(entry, array)
+        with self._zf.open(self._entry(self.anchors_descriptors_entry),
+                           "w") as entry:
+            np.lib.format.write_array(
+                entry, descriptors_array(labels, content['anchors']))
+
+    def close(self):
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is not None:
+            remove(self.path)
+
+
+def write_stepzip(path, shape, content, name=None, **options):
+    r"""Write a stepzip archive
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    shape : Part.Shape
+    content : dict
+        The anchors and properties
+    name : str or None
+        Name of the entries, derived from the path if None
+    options
+        Options of the StepzipWriter
+
+    """
+    with StepzipWriter(path, name, **options) as writer:
+        writer.write_step(shape)
+        writer.write_anchors(content)
+
+
+def anchors_array(anchors):
+    r"""Anchors as a label table and a (N, 9) float64 array
+
+    Parameters
+    ----------
+    anchors : dict
+        label -> {'p': [...], 'u': [...], 'v': [...]}
+
+    Returns
+    -------
+    tuple
+        (list of labels (sorted), (N, 9) numpy array of p, u, v)
+
+    """
+    labels = sorted(anchors)
+    array = np.empty((len(labels), 9), dtype=np.float64)
+    for i, label in enumerate(labels):
+        anchor = anchors[label]
+        array[i, 0:3] = anchor['p']
+        array[i, 3:6] = anchor['u']
+        array[i, 6:9] = anchor['v']
+    return labels, array
+
+
+def descriptors_array(labels, anchors):
+    r"""Descriptors of anchors as a structured array
+
+    Parameters
+    ----------
+    labels : list of str
+        The order of the rows
+    anchors : dict
+        label -> {..., 'descriptor': {...}}, the descriptor being optional
+
+    Returns
+    -------
+    (N,) numpy structured array
+        present (has the anchor a descriptor?), type, radius, area,
+        planar, signature
+
+    """
+    descriptors = [anchors[label].get('descriptor') for label in labels]
+    type_length = max([len(descriptor['type'])
+                       for descriptor in descriptors
+                       if descriptor is not None] + [1])
+    array = np.zeros(len(labels), dtype=[('present', '?'),
+                                         ('type', 'U%i' % type_length),
+                                         ('radius', '<f8'),
+                                         ('area', '<f8'),
+                                         ('planar', '?'),
+                                         ('signature', '<i8')])
+    for i, descriptor in enumerate(descriptors):
+        if descriptor is not None:
+            array[i] = (True, descriptor['type'], descriptor['radius'],
+                        descriptor['area'], descriptor['planar'],
+                        descriptor['signature'])
+    return array
+
+
+def anchors_from_array(labels, array, descriptors=None):
+    r"""Inverse of anchors_array (and of descriptors_array)"""
+    rows = np.asarray(array).tolist()
+    anchors = {label: {'p': row[0:3], 'u': row[3:6], 'v': row[6:9]}
+               for label, row in zip(labels, rows)}
+    if descriptors is not None:
+        for label, descriptor in zip(labels, descriptors.tolist()):
+            present, type_, radius, area, planar, signature = descriptor
+            if present:
+                anchors[label]['descriptor'] = {'type': type_,
+                                                'radius': radius,
+                                                'area': area,
+                                                'planar': planar,
+                                                'signature': signature}
+    return anchors
+
+
+def _entry_data_offset(f, info):
+    r"""Offset of the data of a zip entry in the archive file"""
+    f.seek(info.header_offset)
+    local_header = f.read(30)
+    filename_length = int.from_bytes(local_header[26:28], "little")
+    extra_length = int.from_bytes(local_header[28:30], "little")
+    return info.header_offset + 30 + filename_length + extra_length
+
+
+def read_anchors_array(path, mmap=True):
+    r"""Read the binary anchors of a stepzip
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    mmap : bool
+        Memory-map the array instead of reading it
+
+    Returns
+    -------
+    tuple
+        (list of labels, (N, 9) numpy array of p, u, v),
+        None if the stepzip has no binary anchors
+
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        name = splitext(_anchors_entry_name(zf))[0]
+        try:
+            array_info = zf.getinfo("%s.npy" % name)
+            labels_data = zf.read("%s.labels" % name)
+        except KeyError:
+            return None
+        labels = json.loads(labels_data.decode("utf-8"))
+
+        if not mmap or array_info.compress_type != zipfile.ZIP_STORED:
+            with zf.open(array_info) as entry:
+                array = np.lib.format.read_array(entry)
+            return _checked_labels(path, labels, array), array
+
+    with open(path, "rb") as f:
+        f.seek(_entry_data_offset(f, array_info))
+        if np.lib.format.read_magic(f) == (1, 0):
+            header = np.lib.format.read_array_header_1_0(f)
+        else:
+            header = np.lib.format.read_array_header_2_0(f)
+        shape, fortran_order, dtype = header
+        offset = f.tell()
+    if shape[0] == 0:
+        array = np.empty(shape, dtype=dtype)
+    else:
+        array = np.memmap(path, dtype=dtype, mode="r", shape=shape,
+                          offset=offset, order="F" if fortran_order else "C")
+    return _checked_labels(path, labels, array), array
+
+
+def _checked_labels(path, labels, array):
+    r"""labels, if there is one per row of the binary anchors array"""
+    if len(labels) != len(array):
+        raise ValueError("%i labels for %i binary anchors in %s" %
+                         (len(labels), len(array), path))
+    return labels
+
+
+def read_binary_anchors(path):
+    r"""Anchors (with their descriptors) from the binary entries of a stepzip
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    dict
+        label -> {'p': [...], 'u': [...], 'v': [...], 'descriptor': {...}}
+
+    Raises
+    ------
+    KeyError
+        If the stepzip has no binary anchors
+
+    """
+    binary = read_anchors_array(path)
+    if binary is None:
+        raise KeyError("No binary anchors in %s" % path)
+    labels, array = binary
+    with zipfile.ZipFile(path, "r") as zf:
+        name = splitext(_anchors_entry_name(zf))[0]
+        try:
+            with zf.open("%s.descriptors.npy" % name) as entry:
+                descriptors = np.lib.format.read_array(entry)
+        except KeyError:
+            descriptors = None
+    return anchors_from_array(labels, array, descriptors)
+
+
+def fingerprint(brep, anchors):
+    r"""Fingerprint of the content of a stepzip
+
+    Parameters
+    ----------
+    brep : str
+        BREP string of the shape
+    anchors : dict
+        The 'anchors' part of the anchors content
+
+    Returns
+    -------
+    dict
+        {'shape': sha1 of the BREP, 'anchors': sha1 of the anchors}
+
+    """
+    return {'shape': hashlib.sha1(brep.encode("utf-8")).hexdigest(),
+            'anchors': hashlib.sha1(
+                json.dumps(anchors, sort_keys=True).encode("utf-8")).hexdigest()}
+
+
+def stepzip_paths(paths):
+    r"""The stepzip files of a list of files and directories
+
+    Parameters
+    ----------
+    paths : list of str
+        Stepzip files and directories (searched recursively)
+
+    Returns
+    -------
+    list of str
+
+    """
+    found = []
+    for path in paths:
+        if isdir(path):
+            for root, _, filenames in walk(path):
+                found.extend(join(root, filename)
+                             for filename in sorted(filenames)
+                             if filename.lower().endswith(".stepzip"))
+        else:
+            found.append(path)
+    return found
+
+
+def _anchors_entry_name(zf):
+    for name in zf.namelist():
+        if name.endswith(".json"):
+            return name
+    raise ValueError("No anchors entry in %s" % zf.filename)
+
+
+def read_content(path, anchors=True):
+    r"""Read the anchors content of a stepzip, without touching its STEP
+
+    The anchors are read from the binary entries if the JSON entry
+    does not hold them.
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    anchors : bool
+        Read the binary anchors too (if False, the content of a stepzip
+        with binary anchors has no 'anchors')
+
+    Returns
+    -------
+    dict
+        The anchors and properties
+
+    """
+    with zipfile.ZipFile(path, "r") as zf:
+        content = json.loads(zf.read(_anchors_entry_name(zf))
+                             .decode("utf-8"))
+    if anchors and 'anchors' not in content:
+        content['anchors'] = read_binary_anchors(path)
+    return content
+
+
+def _step_entry_name(zf):
+    for name in zf.namelist():
+        if name.lower().endswith((".stp", ".step")):
+            return name
+    raise ValueError("No STEP entry in %s" % zf.filename)
+
+
+def extract_step(path):
+    r"""Extract the STEP entry of a stepzip to a temporary file
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    str
+        Path to the temporary STEP file, to be removed by the caller
+
+    """
+    handle, step_file = tempfile.mkstemp(suffix=".stp")
+    close(handle)
+    try:
+        with zipfile.ZipFile(path, "r") as zf, \
+                zf.open(_step_entry_name(zf)) as entry, \
+                open(step_file, "wb") as target:
+            shutil.copyfileobj(entry, target, CHUNK_SIZE)
+    except Exception:
+        remove(step_file)
+        raise
+    return step_file
+
+
+def saving_plan(path, fingerprint_, options=None):
+    r"""What saving content with a given fingerprint to path requires
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    fingerprint_ : dict
+        Fingerprint of the content to save
+    options : dict or None
+        Options of the StepzipWriter to save with (see DEFAULT_OPTIONS),
+        not compared if None
+
+    Returns
+    -------
+    str
+        UP_TO_DATE, ANCHORS_ONLY or FULL
+
+    """
+    if not exists(path):
+        return FULL
+    try:
+        properties = read_content(path, anchors=False).get('properties', {})
+    except (zipfile.BadZipfile, ValueError, KeyError):
+        return FULL
+    saved = properties.get('fingerprint')
+    if saved is None or saved.get('shape') != fingerprint_['shape']:
+        return FULL
+    anchors_only = saved.get('anchors') != fingerprint_['anchors']
+    if options is not None:
+        saved_options = properties.get('writer_options')
+        if saved_options is None:
+            # Written before the options were stored
+            return FULL
+        saved_options = dict(DEFAULT_OPTIONS, **saved_options)
+        options = dict(DEFAULT_OPTIONS, **options)
+        changed = [name for name in options
+                   if options[name] != saved_options.get(name)]
+        # The STEP entry is copied as is when the anchors are rewritten
+        if len(set(changed) - {'binary_anchors'}) > 0:
+            return FULL
+        anchors_only = anchors_only or len(changed) > 0
+    return ANCHORS_ONLY if anchors_only else UP_TO_DATE
+
+
+def rewrite_anchors(path, content, **options):
+    r"""Replace the anchors entry of an existing stepzip
+
+    The compressed bytes of the STEP entry are copied as they are into a
+    new archive: no STEP translation and no compression is involved.
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    content : dict
+        The new anchors and properties
+    options
+        Options of the StepzipWriter
+
+    """
+    partial_path = path + ".part"
+    with zipfile.ZipFile(path, "r") as source:
+        anchors_entry = _anchors_entry_name(source)
+        name = splitext(anchors_entry)[0]
+        anchors_entries = {"%s%s" % (name, extension)
+                           for extension in (".json", ".npy", ".labels",
+                                             ".descriptors.npy")}
+        try:
+            with StepzipWriter(partial_path, name, **options) as writer:
+                for info in source.infolist():
+                    if info.filename not in anchors_entries:
+                        writer.copy_entry(source, info)
+                writer.write_anchors(content)
+        except Exception:
+            if exists(partial_path):
+                remove(partial_path)
+            raise
+    replace(partial_path, path)
+
+
+def content_hash(path):
+    r"""sha256 of a stepzip archive
+
+    For archives written in reproducible mode, identical content
+    gives identical hashes.
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    str
+        Hexadecimal digest
+
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
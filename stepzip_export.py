@@ -0,0 +1,525 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Export of anchorable objects to stepzip archives in worker processes
+
+Only a snapshot of each object is taken on the main thread: its shape
+serialized to a BREP string and its anchors. The STEP translation, the
+geometric properties of the shape (see geometric_fingerprint) and the
+compression run in a pool of worker processes, so that the throughput
+of a bulk export scales with the number of cores.
+
+The same worker processes translate the STEP entries of the stepzips
+opened in bulk (see stepzip_shape.import_stepzips) to BREP strings.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from importlib import import_module
+import multiprocessing
+import os
+from os.path import dirname, exists, join
+import re
+import sys
+
+import FreeCAD as App
+
+from anchorable_object import anchors_content, ensure_shape
+from freecad_logging import debug, error, warning
+from geometric_fingerprint import geometric_fingerprint
+from preferences import parameters
+from stepzip import write_stepzip, rewrite_anchors, fingerprint, \
+    saving_plan, extract_step, UP_TO_DATE, ANCHORS_ONLY
+
+
+def is_exportable(object_):
+    r"""Is the object an anchorable object (or instance) with a shape?"""
+    return hasattr(object_, "Shape") \
+        and hasattr(getattr(object_, "Proxy", None), "local_anchors")
+
+
+def exportable_objects(objects):
+    r"""Anchorable objects (and instances) in objects and in the groups
+    (folders) of objects"""
+    exportable = []
+    for object_ in objects:
+        if is_exportable(object_):
+            exportable.append(object_)
+        elif object_.isDerivedFrom("App::DocumentObjectGroup"):
+            exportable.extend(exportable_objects(object_.Group))
+    return exportable
+
+
+def stepzip_filename(feature):
+    r"""File name of the stepzip of a feature, derived from its Label"""
+    return "%s.stepzip" % re.sub(r"[^\w\-.]", "_", feature.Label)
+
+
+def stepzip_filenames(features):
+    r"""Distinct file names of the stepzips of features
+
+    The name derived from the Label (see stepzip_filename) is kept if no
+    other feature maps to it (ignoring the case, for case insensitive
+    file systems), the unique Name of the feature is appended otherwise.
+
+    Returns
+    -------
+    list of str
+
+    """
+    names = [stepzip_filename(feature) for feature in features]
+    counts = {}
+    for name in names:
+        counts[name.lower()] = counts.get(name.lower(), 0) + 1
+    unique = []
+    taken = set()
+    for feature, name in zip(features, names):
+        if counts[name.lower()] > 1:
+            name = "%s_%s.stepzip" % (name[:-len(".stepzip")],
+                                      re.sub(r"[^\w\-.]", "_", feature.Name))
+        candidate, i = name, 1
+        while candidate.lower() in taken:
+            candidate = "%s_%i.stepzip" % (name[:-len(".stepzip")], i)
+            i += 1
+        taken.add(candidate.lower())
+        unique.append(candidate)
+    return unique
+
+
+def snapshot(feature):
+    r"""Minimal, picklable, snapshot of an anchorable object
+
+    This is the only part of an export that has to run on the main thread.
+    The geometry of an object opened from a stepzip is loaded if needed.
+    The fingerprint of the shape and of the anchors is added to the
+    properties of the anchors content; the geometric properties are left
+    to the worker (see export_snapshot).
+
+    Returns
+    -------
+    tuple
+        (BREP string of the shape, anchors content)
+
+    """
+    ensure_shape(feature)
+    # Without the triangulation, which depends on whether the shape was
+    # displayed (and is not needed to write the STEP)
+    brep = feature.Shape.cleaned().exportBrepToString()
+    content = anchors_content(feature)
+    content['properties']['fingerprint'] = fingerprint(brep,
+                                                       content['anchors'])
+    return brep, content
+
+
+def saving_options():
+    r"""Options of the stepzip writer, from the preferences
+
+    Returns
+    -------
+    dict
+
+    """
+    compresslevel = parameters().GetInt("StepzipCompressionLevel", -1)
+    return {'reproducible': parameters().GetBool("ReproducibleStepzip",
+                                                 False),
+            'binary_anchors': parameters().GetBool("BinaryAnchors", False),
+            'compression': parameters().GetString("StepzipCompression",
+                                                  "deflated"),
+            'compresslevel': None if compresslevel < 0 else compresslevel}
+
+
+def _with_geometry_properties(brep, content):
+    r"""Shape of a snapshot, and its content with the bounding box of the
+    shape and its geometric fingerprint and canonical frame (see
+    geometric_fingerprint) added to the properties"""
+    import Part
+    shape = Part.Shape()
+    shape.importBrepFromString(brep)
+    properties = dict(content.get('properties', {}))
+    bound_box = shape.BoundBox
+    properties['bounding_box'] = [bound_box.XMin,
+                                  bound_box.YMin,
+                                  bound_box.ZMin,
+                                  bound_box.XMax,
+                                  bound_box.YMax,
+                                  bound_box.ZMax]
+    geometry, frame = geometric_fingerprint(shape, content['anchors'])
+    properties['geometric_fingerprint'] = geometry
+    if frame is not None:
+        properties['canonical_frame'] = frame.tolist()
+    return shape, dict(content, properties=properties)
+
+
+def export_snapshot(brep, content, path, name=None, options=None):
+    r"""Write a stepzip from a snapshot (runs in a worker process)
+
+    The geometric properties are computed from the BREP (see snapshot).
+
+    Parameters
+    ----------
+    brep : str
+        BREP string of the shape
+    content : dict
+        Anchors content
+    path : str
+        Path to the stepzip file
+    name : str or None
+        Name of the archive entries, derived from the path if None
+    options : dict or None
+        Options of the stepzip writer
+
+    Returns
+    -------
+    str
+        path
+
+    """
+    shape, content = _with_geometry_properties(brep, content)
+    write_stepzip(path, shape, content, name, **(options or {}))
+    return path
+
+
+def rewrite_snapshot(brep, content, path, options=None):
+    r"""Replace the anchors of an existing stepzip with those of a snapshot
+    (runs in a worker process)
+
+    The STEP entry is kept (see stepzip.rewrite_anchors), the geometric
+    properties are computed from the BREP: the canonical frame depends
+    on the anchors.
+
+    Parameters
+    ----------
+    brep : str
+        BREP string of the shape
+    content : dict
+        Anchors content
+    path : str
+        Path to the stepzip file
+    options : dict or None
+        Options of the stepzip writer
+
+    Returns
+    -------
+    str
+        path
+
+    """
+    _, content = _with_geometry_properties(brep, content)
+    rewrite_anchors(path, content, **(options or {}))
+    return path
+
+
+def read_step_shape(path):
+    r"""Read the shape of the STEP entry of a stepzip
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    import Part
+    step_file = extract_step(path)
+    try:
+        return Part.read(step_file)
+    finally:
+        os.remove(step_file)
+
+
+def translate_stepzip(path):
+    r"""BREP string of the STEP entry of a stepzip (runs in a worker process)
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    str
+
+    """
+    return read_step_shape(path).exportBrepToString()
+
+
+def _python_executable():
+    r"""Python interpreter for the worker processes
+
+    Inside FreeCAD, sys.executable is the FreeCAD program: use the
+    PythonExecutable preference, or the interpreter bundled with FreeCAD.
+
+    """
+    executable = parameters().GetString("PythonExecutable", "")
+    if executable != "":
+        return executable
+    for candidate in (join(sys.exec_prefix, "bin", "python3"),
+                      join(sys.exec_prefix, "bin", "python"),
+                      join(sys.exec_prefix, "python.exe")):
+        if exists(candidate):
+            return candidate
+    return sys.executable
+
+
+def _init_worker(paths):
+    r"""Make FreeCAD (and this workbench) importable in a worker process"""
+    for path in paths:
+        if path not in sys.path:
+            sys.path.append(path)
+    # Part can only be imported after FreeCAD (and fails the pool if
+    # FreeCAD cannot be imported)
+    import_module("FreeCAD")
+
+
+def _spawn_context():
+    r"""Multiprocessing context of the worker processes, and the paths
+    making FreeCAD (and this workbench) importable in them"""
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(_python_executable())
+    paths = [join(App.getHomePath(), "lib"),
+             join(App.getHomePath(), "Mod", "Part"),
+             dirname(__file__)]
+    return context, paths
+
+
+def make_executor(max_workers=None):
+    r"""Pool of worker processes able to import FreeCAD and Part
+
+    Parameters
+    ----------
+    max_workers : int or None
+        Number of worker processes, the number of cores if None
+
+    """
+    context, paths = _spawn_context()
+    return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                               mp_context=context,
+                               initializer=_init_worker,
+                               initargs=(paths,))
+
+
+def _run_export_process(connection, paths, brep, content, path, name,
+                        options, anchors_only):
+    r"""Target of the process of an ExportProcess: sends None or the
+    exception of the export"""
+    try:
+        _init_worker(paths)
+    except Exception as err:
+        # Same failure as a pool whose initializer fails
+        result = BrokenProcessPool("The export process cannot import "
+                                   "FreeCAD : %s" % err)
+    else:
+        try:
+            if anchors_only:
+                rewrite_snapshot(brep, content, path, options)
+            else:
+                export_snapshot(brep, content, path, name, options)
+            result = None
+        except Exception as err:
+            result = err
+    try:
+        connection.send(result)
+    except Exception:
+        # e.g. an exception that cannot be pickled
+        connection.send(RuntimeError(str(result)))
+    connection.close()
+
+
+class ExportProcess:
+    r"""Export of a snapshot (see export_snapshot, or rewrite_snapshot if
+    anchors_only) in its own worker process, which can be terminated
+
+    Parameters
+    ----------
+    brep : str
+        BREP string of the shape
+    content : dict
+        Anchors content
+    path : str
+        Path to the stepzip file
+    name : str or None
+        Name of the archive entries, derived from the path if None
+    options : dict or None
+        Options of the stepzip writer
+    anchors_only : bool
+        Only rewrite the anchors of the existing stepzip at path
+
+    """
+    def __init__(self, brep, content, path, name=None, options=None,
+                 anchors_only=False):
+        self._done = False
+        self._exception = None
+        context, paths = _spawn_context()
+        self._connection, child = context.Pipe(duplex=False)
+        self._process = context.Process(target=_run_export_process,
+                                        args=(child, paths, brep, content,
+                                              path, name, options,
+                                              anchors_only))
+        self._process.daemon = True
+        try:
+            self._process.start()
+        except Exception as err:
+            # e.g. a PythonExecutable preference that cannot be run
+            self._exception = BrokenProcessPool("The export process could "
+                                                "not start : %s" % err)
+            self._done = True
+            self._connection.close()
+        finally:
+            child.close()
+
+    def _receive(self):
+        try:
+            self._exception = self._connection.recv()
+        except EOFError:
+            self._exception = BrokenProcessPool(
+                "The export process exited with code %s" %
+                self._process.exitcode)
+        self._finish()
+
+    def _finish(self):
+        self._done = True
+        self._process.join()
+        self._connection.close()
+
+    def done(self):
+        r"""Is the export over (or terminated)?"""
+        if not self._done:
+            if self._connection.poll():
+                self._receive()
+            elif not self._process.is_alive():
+                # It may have sent its result just before exiting
+                self._receive()
+        return self._done
+
+    def exception(self):
+        r"""Exception of the export once done, None on success
+
+        A BrokenProcessPool if the process could not start or could not
+        run the export (e.g. it cannot import FreeCAD).
+
+        """
+        return self._exception
+
+    def terminate(self):
+        r"""Stop the export, the partial file is left behind"""
+        if not self._done:
+            self._process.terminate()
+            self._finish()
+
+
+def export_stepzips(features, directory, max_workers=None, progress=None,
+                    incremental=True, options=None):
+    r"""Export many anchorable objects to stepzip archives
+
+    In incremental mode, the existing stepzips whose fingerprint matches
+    the object are left untouched and the stepzips of the objects whose
+    anchors only changed get their anchors entry rewritten.
+
+    Parameters
+    ----------
+    features : list of anchorable objects (or instances)
+    directory : str
+        Where to write the stepzip files
+    max_workers : int or None
+        Number of worker processes, the number of cores if None
+    progress : callable or None
+        Called after each file as progress(done, total, path, exception),
+        exception being None on success
+    incremental : bool
+        Only regenerate what changed since the previous export
+    options : dict or None
+        Options of the stepzip writer, from the preferences if None
+
+    Returns
+    -------
+    list of str
+        Paths of the stepzip files exported (or already up to date)
+
+    """
+    options = saving_options() if options is None else options
+    jobs = [snapshot(feature) + (join(directory, filename),)
+            for feature, filename in zip(features,
+                                         stepzip_filenames(features))]
+    plans = {path: saving_plan(path, content['properties']['fingerprint'],
+                               options)
+             if incremental else None
+             for _, content, path in jobs}
+    debug("Exporting %i stepzips to %s, %i up to date",
+          len(jobs), directory, list(plans.values()).count(UP_TO_DATE))
+
+    total = len(jobs)
+    written = []
+    reported = set()
+
+    def report(path, exception):
+        reported.add(path)
+        if exception is None:
+            written.append(path)
+        else:
+            error("Could not export %s : %s" % (path, exception))
+        if progress is not None:
+            progress(len(reported), total, path, exception)
+
+    for _, _, path in jobs:
+        if plans[path] == UP_TO_DATE:
+            report(path, None)
+    jobs = [job for job in jobs if job[2] not in reported]
+    if len(jobs) == 0:
+        return written
+
+    # The jobs whose worker could not run (e.g. the workers cannot
+    # import FreeCAD) are run on the main thread
+    try:
+        with make_executor(max_workers) as executor:
+            futures = {}
+            for brep, content, path in jobs:
+                if plans[path] == ANCHORS_ONLY:
+                    future = executor.submit(rewrite_snapshot,
+                                             brep, content, path, options)
+                else:
+                    future = executor.submit(export_snapshot,
+                                             brep, content, path,
+                                             None, options)
+                futures[future] = path
+            for future in as_completed(futures):
+                exception = future.exception()
+                if not isinstance(exception, BrokenProcessPool):
+                    report(futures[future], exception)
+    except (BrokenProcessPool, OSError) as err:
+        debug("Worker processes unavailable : %s", err)
+
+    pending = [job for job in jobs if job[2] not in reported]
+    if len(pending) > 0:
+        warning("Worker processes unavailable, exporting %i stepzips "
+                "on the main thread", len(pending))
+    for brep, content, path in pending:
+        try:
+            if plans[path] == ANCHORS_ONLY:
+                rewrite_snapshot(brep, content, path, options)
+            else:
+                export_snapshot(brep, content, path, None, options)
+            report(path, None)
+        except Exception as err:
+            report(path, err)
+
+    return written
@@ -0,0 +1,453 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Opening stepzip archives, with lazy loading of their geometry
+
+Opening a stepzip only reads its anchors: the anchorable object and its
+anchors are created at once, and the STEP entry is only read (which is
+the expensive part) when the shape is needed or the object is shown.
+Browsing a library of stepzips does not pay for the STEP parsing of the
+parts that are never inspected.
+
+The geometry and the anchors of the opened archives are kept in a local
+BREP cache (see brep_cache), keyed by the path, size and modification time
+of the archives: opening the same archive again skips the STEP translation
+completely.
+
+A stepzip holding a part already opened from another stepzip (same
+geometric fingerprint, see geometric_fingerprint) reuses its geometry.
+
+Many stepzips (or whole directories) can be opened at once: the STEP
+translations then run in worker processes, the main thread only builds
+the shapes from the BREP strings and attaches the anchors.
+
+"""
+
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from os.path import basename, join, dirname, splitext
+
+import numpy as np
+
+import FreeCAD as App
+import Part
+
+from anchor import make_anchor_feature
+from anchorable_object import make_anchorable_object_feature
+from brep_cache import BrepCache, DEFAULT_MAX_SIZE, cache_key
+from freecad_logging import debug, error, warning
+from placements import matrix_to_placement, placement_to_matrix
+from preferences import parameters
+from stepzip import read_content
+from stepzip_export import make_executor, read_step_shape, translate_stepzip
+
+_MB = 1024 * 1024
+
+_shared_cache = None
+
+
+def shared_brep_cache():
+    r"""The BREP cache of the user, None if disabled in the preferences
+
+    The cache lives in the Anchors/cache directory of the user data of
+    FreeCAD, its maximum size is the BrepCacheSize preference (in MB)
+
+    """
+    global _shared_cache
+    if not parameters().GetBool("UseBrepCache", True):
+        return None
+    if _shared_cache is None:
+        max_size = parameters().GetInt("BrepCacheSize",
+                                       DEFAULT_MAX_SIZE // _MB) * _MB
+        _shared_cache = BrepCache(join(App.getUserAppDataDir(),
+                                       "Anchors",
+                                       "cache"),
+                                  max_size)
+    return _shared_cache
+
+
+def read_stepzip_content(path, key=None):
+    r"""Read the anchors content of a stepzip
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    key : str or None
+        Key of the stepzip in the BREP cache (see brep_cache.cache_key),
+        to use the BREP cache
+
+    Returns
+    -------
+    dict
+        {'anchors': {label: {'p': [x, y, z], 'u': [x, y, z],
+                             'v': [x, y, z]}},
+         'properties': {}}
+
+    """
+    cache = shared_brep_cache() if key is not None else None
+    if cache is not None:
+        content = cache.get_content(key)
+        if content is not None:
+            return content
+
+    # From the binary anchors entries if the stepzip has some
+    content = read_content(path)
+
+    if cache is not None:
+        cache.put_content(key, content)
+    return content
+
+
+def shape_from_brep(brep):
+    r"""Part.Shape from a BREP string"""
+    shape = Part.Shape()
+    shape.importBrepFromString(brep)
+    return shape
+
+
+def load_shape(path, key=None):
+    r"""Load the shape of a stepzip, from the BREP cache if possible
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+    key : str or None
+        Key of the stepzip in the BREP cache (see brep_cache.cache_key),
+        to use the BREP cache
+
+    Returns
+    -------
+    Part.Shape
+
+    """
+    cache = shared_brep_cache() if key is not None else None
+    if cache is None:
+        return read_step_shape(path)
+
+    brep = cache.get_brep(key)
+    if brep is not None:
+        shape = shape_from_brep(brep)
+    else:
+        shape = read_step_shape(path)
+        cache.put_brep(key, shape.exportBrepToString())
+    debug("BREP cache : %i hits, %i misses, %i evictions",
+          cache.hits, cache.misses, cache.evictions)
+    return shape
+
+
+def make_stepzip_shape_feature(path):
+    r"""makes a stepzip shape feature, whose shape is not loaded yet
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    the new object.
+
+    """
+    obj = App.ActiveDocument.addObject("Part::FeaturePython", "StepzipShape")
+    StepzipShape(obj)
+    if App.GuiUp:
+        ViewProviderStepzipShape(obj.ViewObject)
+    obj.File = path
+    obj.Label = splitext(basename(path))[0]
+    return obj
+
+
+def canonical_frame_of(stepzip_shape):
+    r"""Canonical frame of a stepzip shape feature, as a 4x4 matrix"""
+    return np.array(stepzip_shape.CanonicalFrame).reshape(4, 4)
+
+
+def find_stepzip_shape(geometry):
+    r"""A stepzip shape of the active document with a geometric fingerprint,
+    loaded ones first
+
+    Parameters
+    ----------
+    geometry : str
+        Geometric fingerprint (see geometric_fingerprint)
+
+    Returns
+    -------
+    the stepzip shape feature, None if there is none
+
+    """
+    candidates = [obj for obj in App.ActiveDocument.Objects
+                  if hasattr(obj, "GeometricFingerprint")
+                  and obj.GeometricFingerprint == geometry
+                  and len(obj.CanonicalFrame) == 16]
+    candidates.sort(key=lambda obj: not obj.Loaded)
+    return candidates[0] if len(candidates) > 0 else None
+
+
+def open_stepzip(path):
+    r"""Open a stepzip as an anchorable object, without loading its geometry
+
+    If a stepzip holding the same part (same geometric fingerprint) is
+    already opened in the document, its geometry is reused.
+
+    Parameters
+    ----------
+    path : str
+        Path to the stepzip file
+
+    Returns
+    -------
+    the anchorable object.
+
+    """
+    key = cache_key(path) if shared_brep_cache() is not None else ""
+    content = read_stepzip_content(path, key or None)
+    anchors = content['anchors']
+    geometry = content['properties'].get('geometric_fingerprint', "")
+    frame = content['properties'].get('canonical_frame')
+
+    # Without a canonical frame (ambiguous, see canonical_frame) the part
+    # cannot be placed onto another one
+    base = find_stepzip_shape(geometry) \
+        if geometry != "" and frame is not None else None
+    if base is None:
+        base = make_stepzip_shape_feature(path)
+        base.ContentHash = key
+        base.GeometricFingerprint = geometry
+        if frame is not None:
+            base.CanonicalFrame = [x for row in frame for x in row]
+        obj = make_anchorable_object_feature(base)
+    else:
+        # The same part, already opened from another stepzip: its geometry
+        # is reused, placed from its canonical frame onto the one of the
+        # part of this stepzip
+        debug("%s reuses the geometry of %s", path, base.File)
+        obj = make_anchorable_object_feature(base)
+        obj.Placement = matrix_to_placement(
+            np.dot(np.dot(np.array(frame),
+                          np.linalg.inv(canonical_frame_of(base))),
+                   placement_to_matrix(base.Placement)))
+    obj.Label = splitext(basename(path))[0]
+    obj.Anchors = [make_anchor_feature(obj,
+                                       anchor['p'],
+                                       anchor['u'],
+                                       anchor['v'],
+                                       label=label,
+                                       descriptor_=anchor.get('descriptor'))
+                   for label, anchor in sorted(anchors.items())]
+    if App.GuiUp:
+        # Showing the object loads its geometry
+        obj.ViewObject.Visibility = False
+    debug("Opened %s with %i anchors, geometry not loaded",
+          path, len(anchors))
+    return obj
+
+
+def import_stepzips(paths, max_workers=None, progress=None):
+    r"""Open many stepzips, translating their STEP entries in parallel
+
+    The anchorable objects and their anchors are created at once. The
+    STEP entries that are not in the BREP cache are translated to BREP
+    strings in worker processes, and the shapes are built on the main
+    thread as the translations complete.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to the stepzip files
+    max_workers : int or None
+        Number of worker processes, the number of cores if None
+    progress : callable or None
+        Called after each file as progress(done, total, path, exception),
+        exception being None on success
+
+    Returns
+    -------
+    list
+        The anchorable objects
+
+    """
+    cache = shared_brep_cache()
+    objects = []
+    for path in paths:
+        try:
+            objects.append(open_stepzip(path))
+        except Exception as err:
+            error("Could not open %s : %s" % (path, err))
+
+    total = len(objects)
+    reported = set()
+    # Objects reusing the geometry of another stepzip share its base
+    by_base = {}
+    for obj in objects:
+        by_base.setdefault(obj.Base.Name, []).append(obj)
+
+    def report(base, exception):
+        for obj in by_base[base.Name]:
+            reported.add(obj.Name)
+            if exception is not None:
+                error("Could not load %s : %s" % (base.File, exception))
+            elif App.GuiUp:
+                obj.ViewObject.Visibility = True
+            if progress is not None:
+                progress(len(reported), total, obj.Base.File, exception)
+
+    pending = []
+    for name in by_base:
+        base = by_base[name][0].Base
+        brep = cache.get_brep(base.ContentHash) \
+            if cache is not None and not base.Loaded else None
+        if base.Loaded:
+            report(base, None)
+        elif brep is not None:
+            base.Proxy.set_brep(base, brep)
+            report(base, None)
+        else:
+            pending.append(base)
+    debug("Importing %i stepzips, %i STEP translations",
+          total, len(pending))
+    if len(pending) == 0:
+        return objects
+
+    # The translations whose worker could not run (e.g. the workers cannot
+    # import FreeCAD) are done on the main thread
+    try:
+        with make_executor(max_workers) as executor:
+            futures = {executor.submit(translate_stepzip, base.File): base
+                       for base in pending}
+            for future in as_completed(futures):
+                base = futures[future]
+                exception = future.exception()
+                if isinstance(exception, BrokenProcessPool):
+                    continue
+                if exception is None:
+                    brep = future.result()
+                    if cache is not None:
+                        cache.put_brep(base.ContentHash, brep)
+                    base.Proxy.set_brep(base, brep)
+                report(base, exception)
+    except (BrokenProcessPool, OSError) as err:
+        debug("Worker processes unavailable : %s", err)
+
+    pending = [base for base in pending
+               if by_base[base.Name][0].Name not in reported]
+    if len(pending) > 0:
+        warning("Worker processes unavailable, translating %i stepzips "
+                "on the main thread", len(pending))
+    for base in pending:
+        try:
+            base.Proxy.load(base)
+            report(base, None)
+        except Exception as err:
+            report(base, err)
+
+    return objects
+
+
+class StepzipShape:
+    r"""The shape of the STEP entry of a stepzip, loaded on demand"""
+    def __init__(self, obj):
+        obj.addProperty("App::PropertyFile",
+                        "File",
+                        "Stepzip",
+                        "Stepzip file")
+        obj.addProperty("App::PropertyBool",
+                        "Loaded",
+                        "Stepzip",
+                        "Is the shape loaded?").Loaded = False
+        obj.setEditorMode("Loaded", 1)
+        obj.addProperty("App::PropertyString",
+                        "ContentHash",
+                        "Stepzip",
+                        "Key of the stepzip in the BREP cache")
+        obj.setEditorMode("ContentHash", 1)
+        obj.addProperty("App::PropertyString",
+                        "GeometricFingerprint",
+                        "Stepzip",
+                        "Placement-invariant fingerprint of the part")
+        obj.setEditorMode("GeometricFingerprint", 1)
+        obj.addProperty("App::PropertyFloatList",
+                        "CanonicalFrame",
+                        "Stepzip",
+                        "Canonical frame of the part (4x4 matrix, row major)")
+        obj.setEditorMode("CanonicalFrame", 2)
+        obj.Proxy = self
+
+    def load(self, feature):
+        r"""Read the shape from the stepzip"""
+        debug("Loading the geometry of %s", feature.File)
+        if feature.ContentHash == "" and shared_brep_cache() is not None:
+            feature.ContentHash = cache_key(feature.File)
+        feature.Shape = load_shape(feature.File, feature.ContentHash or None)
+        feature.Loaded = True
+
+    def set_brep(self, feature, brep):
+        r"""Set the shape from its BREP string (e.g. translated elsewhere)"""
+        feature.Shape = shape_from_brep(brep)
+        feature.Loaded = True
+
+    def onChanged(self, feature, prop):
+        if prop == "File":
+            feature.ContentHash = ""
+            feature.GeometricFingerprint = ""
+            feature.CanonicalFrame = []
+            if feature.Loaded:
+                # Another file: its shape is read on the next recompute
+                feature.Shape = Part.Shape()
+
+    def execute(self, feature):
+        r"""Only reads the shape if it has been loaded before
+        (e.g. after the File changed)"""
+        if feature.Loaded and feature.Shape.isNull():
+            self.load(feature)
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        return None
+
+
+class ViewProviderStepzipShape:
+    def __init__(self, vobj):
+        r"""Set this object to the proxy object of the actual view provider"""
+        vobj.Proxy = self
+
+    def attach(self, vobj):
+        r"""Setup the scene sub-graph of the view provider,
+        this method is mandatory
+        """
+        self.ViewObject = vobj
+        self.Object = vobj.Object
+
+    def getIcon(self):
+        r"""Return the icon in XPM format which will appear in the tree view.
+        This method is\ optional and if not defined a default icon is shown.
+        """
+        return join(dirname(__file__),
+                    "resources",
+                    "freecad_workbench_anchors_open.svg")
+
+    def __getstate__(self):
+        return None
+
+    def __setstate__(self, state):
+        return None
@@ -0,0 +1,272 @@
+# coding: utf-8
+
+# Copyright 2018-2019 Guillaume Florent
+
+# This file is part of cadracks-freecad-workbench.
+#
+# cadracks-freecad-workbench is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# cadracks-freecad-workbench is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with cadracks-freecad-workbench.  If not, see <https://www.gnu.org/licenses/>.
+
+r"""Cache of the local and world matrices of a hierarchy of frames
+
+Each node of a TransformTree stores its matrix in the frame of its parent
+(local) and, once computed, in the global frame (world), with a dirty
+flag. Reading a clean world matrix is a dictionary lookup; changing a
+local matrix marks the node and its descendants dirty, and their world
+matrices are recomputed on the next read only.
+
+A node may be given an App.Placement instead of a matrix: it is converted
+on the first read after the change, i.e. once per change.
+
+The features keep their own tree (see the transforms method of their
+proxy): its ROOT node is the Placement of the feature, the anchors frames
+(anchorable objects) or the parts (assemblies) are its children.
+
+"""
+
+import numpy as np
+
+from placements import placement_to_matrix, matrix_to_placement
+
+# Name of the node holding the Placement of a feature
+# (FreeCAD labels cannot be empty)
+ROOT = ""
+
+
+def _frozen(matrix):
+    r"""Read-only float copy of a 4x4 matrix"""
+    matrix = np.array(matrix, dtype=np.float64)
+    matrix.setflags(write=False)
+    return matrix
+
+
+class _Node:
+    __slots__ = ("parent", "children", "local", "placement", "world",
+                 "world_placement", "dirty", "source")
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.children = []
+        self.local = _frozen(np.identity(4))
+        self.placement = None  # App.Placement waiting to be converted
+        self.world = None
+        self.world_placement = None
+        self.dirty = True
+        self.source = None  # what the children were last built from
+
+
+class TransformTree:
+    r"""Local and world 4x4 matrices of named frames, cached
+
+    Invariant: the descendants of a dirty node are dirty, so that an
+    invalidation stops at the first node that is already dirty.
+
+    The matrices returned are read-only numpy arrays shared with the cache.
+
+    """
+    def __init__(self):
+        self._nodes = {}
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def add(self, name, parent=None, local=None):
+        r"""Add a node
+
+        Parameters
+        ----------
+        name : hashable
+        parent : hashable or None
+            Name of the parent node, None for a root
+        local : 4x4 matrix (numpy array) or None
+            Matrix in the frame of the parent, identity if None
+
+        """
+        if name in self._nodes:
+            raise ValueError("%s is already in the transform tree" % name)
+        if parent is not None:
+            self._nodes[parent].children.append(name)
+        node = self._nodes[name] = _Node(parent)
+        if local is not None:
+            node.local = _frozen(local)
+
+    def remove(self, name):
+        r"""Remove a node and its descendants"""
+        node = self._nodes[name]
+        if node.parent is not None:
+            self._nodes[node.parent].children.remove(name)
+        stack = [name]
+        while stack:
+            stack.extend(self._nodes.pop(stack.pop()).children)
+
+    def children(self, name):
+        return list(self._nodes[name].children)
+
+    def invalidate(self, name):
+        r"""Mark a node and its descendants dirty"""
+        stack = [name]
+        while stack:
+            node = self._nodes[stack.pop()]
+            if not node.dirty:
+                node.dirty = True
+                stack.extend(node.children)
+
+    def set_local(self, name, matrix):
+        r"""Change the matrix of a node in the frame of its parent"""
+        node = self._nodes[name]
+        node.local = _frozen(matrix)
+        node.placement = None
+        self.invalidate(name)
+
+    def set_placement(self, name, placement):
+        r"""Change the matrix of a node in the frame of its parent,
+        given as an App.Placement
+
+        The conversion is deferred to the next read.
+
+        """
+        node = self._nodes[name]
+        node.placement = placement
+        self.invalidate(name)
+
+    def local(self, name):
+        r"""Matrix of a node in the frame of its parent"""
+        node = self._nodes[name]
+        if node.placement is not None:
+            node.local = _frozen(placement_to_matrix(node.placement))
+            node.placement = None
+        return node.local
+
+    def world(self, name):
+        r"""Matrix of a node in the global frame"""
+        node = self._nodes[name]
+        if node.dirty:
+            local = self.local(name)
+            if node.parent is None:
+                node.world = local
+            else:
+                node.world = _frozen(np.dot(self.world(node.parent), local))
+            node.world_placement = None
+            node.dirty = False
+        return node.world
+
+    def world_placement(self, name):
+        r"""World matrix of a node as an App.Placement,
+        converted once per change"""
+        world = self.world(name)
+        node = self._nodes[name]
+        if node.world_placement is None:
+            node.world_placement = matrix_to_placement(world)
+        return node.world_placement
+
+    def set_locals(self, parent, matrices):
+        r"""Replace the children of a node
+
+        Parameters
+        ----------
+        parent : hashable
+        matrices : dict
+            child name -> matrix in the frame of the parent
+
+            The dict is taken as immutable: setting the same dict again
+            does nothing.
+
+        """
+        if self._nodes[parent].source is matrices:
+            return
+        for name in self.children(parent):
+            self.remove(name)
+        for name, matrix in matrices.items():
+            self.add(name, parent, matrix)
+        self._nodes[parent].source = matrices
+
+    def set_frames(self, parent, frames):
+        r"""Replace the children of a node by anchors frames
+
+        Parameters
+        ----------
+        parent : hashable
+        frames : dict
+            name -> (p, u, v) in the frame of the parent
+
+            The dict is taken as immutable: setting the same dict again
+            does nothing.
+
+        """
+        if self._nodes[parent].source is frames:
+            return
+        names = list(frames)
+        # The columns are p, u, v as given (not orthonormalized), so that
+        # the world frames are exactly the transformed anchors frames
+        matrices = np.zeros((len(names), 4, 4))
+        for i, name in enumerate(names):
+            p, u, v = [np.array([x[0], x[1], x[2]], dtype=np.float64)
+                       for x in frames[name]]
+            matrices[i, :3, 0] = u
+            matrices[i, :3, 1] = v
+            matrices[i, :3, 2] = np.cross(u, v)
+            matrices[i, :3, 3] = p
+            matrices[i, 3, 3] = 1.
+        self.set_locals(parent, dict(zip(names, matrices)))
+        self._nodes[parent].source = frames
+
+    def world_frames(self, parent):
+        r"""World frames of the children of a node (see set_frames)
+
+        Returns
+        -------
+        dict
+            name -> (p, u, v) tuple of numpy arrays
+
+        """
+        frames = {}
+        for name in self._nodes[parent].children:
+            world = self.world(name)
+            frames[name] = (world[:3, 3], world[:3, 0], world[:3, 1])
+        return frames
+
+
+def object_transforms(object_):
+    r"""Transform tree of a feature, None if it has none"""
+    proxy = getattr(object_, "Proxy", None)
+    if hasattr(proxy, "transforms"):
+        return proxy.transforms(object_)
+    return None
+
+
+def placement_matrix(object_):
+    r"""Placement of a document object as a 4x4 matrix
+
+    Cached by the features that have a transform tree,
+    converted for the others.
+
+    Returns
+    -------
+    4x4 matrix (numpy array), read-only
+
+    """
+    transforms = object_transforms(object_)
+    if transforms is None:
+        return placement_to_matrix(object_.Placement)
+    return transforms.world(ROOT)
+
+
+def placement_tree(placement):
+    r"""New transform tree with the ROOT node at placement"""
+    tree = TransformTree()
+    tree.add(ROOT)
+    tree.set_placement(ROOT, placement)
+    return tree